@@ -1,427 +1,2006 @@
-import psycopg2
-from datetime import datetime
-
-# --- Database Connection Configuration ---
-# You need to replace these with your actual PostgreSQL database credentials.
-# It is recommended to use environment variables in a production environment.
-DB_HOST = "localhost"
-DB_NAME = "pms"
-DB_USER = "postgres"
-DB_PASS = "postgrespv"
-
-def get_db_connection():
-    """Establishes and returns a new database connection."""
-    conn = None
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS
-        )
-    except psycopg2.OperationalError as e:
-        print(f"Error connecting to database: {e}")
-    return conn
-
-def create_tables():
-    """
-    Creates the necessary database tables if they don't already exist.
-    This function should be run once to initialize the database schema.
-    """
-    conn = get_db_connection()
-    if conn is None:
-        return
-    
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS employees (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS goals (
-                id SERIAL PRIMARY KEY,
-                employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
-                description TEXT NOT NULL,
-                due_date DATE,
-                status VARCHAR(50) NOT NULL DEFAULT 'Draft',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS tasks (
-                id SERIAL PRIMARY KEY,
-                goal_id INTEGER REFERENCES goals(id) ON DELETE CASCADE,
-                employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
-                description TEXT NOT NULL,
-                is_approved BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS feedback (
-                id SERIAL PRIMARY KEY,
-                goal_id INTEGER REFERENCES goals(id) ON DELETE CASCADE,
-                manager_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
-                feedback_text TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        conn.commit()
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error creating tables: {e}")
-    finally:
-        cur.close()
-        conn.close()
-
-# --- Manager and Employee Management ---
-def get_all_employees():
-    """Reads and returns a list of all employees."""
-    conn = get_db_connection()
-    if conn is None:
-        return []
-    
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT id, name FROM employees ORDER BY name;")
-        employees = cur.fetchall()
-        return employees
-    except psycopg2.Error as e:
-        print(f"Error fetching employees: {e}")
-        return []
-    finally:
-        cur.close()
-        conn.close()
-
-def add_employee(name):
-    """Creates a new employee."""
-    conn = get_db_connection()
-    if conn is None:
-        return
-    
-    cur = conn.cursor()
-    try:
-        cur.execute("INSERT INTO employees (name) VALUES (%s) RETURNING id;", (name,))
-        employee_id = cur.fetchone()[0]
-        conn.commit()
-        return employee_id
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error adding employee: {e}")
-        return None
-    finally:
-        cur.close()
-        conn.close()
-
-# --- CRUD for Goals ---
-def create_goal(employee_id, description, due_date, status="Draft"):
-    """Creates a new goal for an employee."""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "INSERT INTO goals (employee_id, description, due_date, status) VALUES (%s, %s, %s, %s);",
-            (employee_id, description, due_date, status)
-        )
-        conn.commit()
-        return True
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error creating goal: {e}")
-        return False
-    finally:
-        cur.close()
-        conn.close()
-
-def read_goals(employee_id=None):
-    """Reads and returns goals. Can be filtered by employee_id."""
-    conn = get_db_connection()
-    if conn is None:
-        return []
-    
-    cur = conn.cursor()
-    try:
-        if employee_id:
-            cur.execute("SELECT g.id, e.name, g.description, g.due_date, g.status FROM goals g JOIN employees e ON g.employee_id = e.id WHERE g.employee_id = %s ORDER BY g.due_date DESC;", (employee_id,))
-        else:
-            cur.execute("SELECT g.id, e.name, g.description, g.due_date, g.status FROM goals g JOIN employees e ON g.employee_id = e.id ORDER BY g.due_date DESC;")
-        goals = cur.fetchall()
-        return goals
-    except psycopg2.Error as e:
-        print(f"Error reading goals: {e}")
-        return []
-    finally:
-        cur.close()
-        conn.close()
-
-def update_goal_status(goal_id, status):
-    """Updates the status of a specific goal."""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "UPDATE goals SET status = %s WHERE id = %s;",
-            (status, goal_id)
-        )
-        conn.commit()
-        return cur.rowcount > 0
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error updating goal status: {e}")
-        return False
-    finally:
-        cur.close()
-        conn.close()
-
-def delete_goal(goal_id):
-    """Deletes a goal and its associated tasks and feedback."""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    cur = conn.cursor()
-    try:
-        cur.execute("DELETE FROM goals WHERE id = %s;", (goal_id,))
-        conn.commit()
-        return cur.rowcount > 0
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error deleting goal: {e}")
-        return False
-    finally:
-        cur.close()
-        conn.close()
-
-# --- CRUD for Tasks ---
-def create_task(goal_id, employee_id, description):
-    """Creates a new task for a goal."""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "INSERT INTO tasks (goal_id, employee_id, description) VALUES (%s, %s, %s);",
-            (goal_id, employee_id, description)
-        )
-        conn.commit()
-        return True
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error creating task: {e}")
-        return False
-    finally:
-        cur.close()
-        conn.close()
-
-def read_tasks(goal_id=None, employee_id=None):
-    """Reads and returns tasks, can be filtered by goal or employee."""
-    conn = get_db_connection()
-    if conn is None:
-        return []
-    
-    cur = conn.cursor()
-    try:
-        if goal_id:
-            cur.execute("SELECT id, description, is_approved FROM tasks WHERE goal_id = %s ORDER BY created_at DESC;", (goal_id,))
-        elif employee_id:
-            cur.execute("SELECT t.id, g.description, t.description, t.is_approved FROM tasks t JOIN goals g ON t.goal_id = g.id WHERE t.employee_id = %s ORDER BY t.created_at DESC;", (employee_id,))
-        else:
-            cur.execute("SELECT id, description, is_approved FROM tasks ORDER BY created_at DESC;")
-        tasks = cur.fetchall()
-        return tasks
-    except psycopg2.Error as e:
-        print(f"Error reading tasks: {e}")
-        return []
-    finally:
-        cur.close()
-        conn.close()
-
-def update_task_approval(task_id, is_approved):
-    """Updates the approval status of a task."""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "UPDATE tasks SET is_approved = %s WHERE id = %s;",
-            (is_approved, task_id)
-        )
-        conn.commit()
-        return cur.rowcount > 0
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error updating task approval: {e}")
-        return False
-    finally:
-        cur.close()
-        conn.close()
-
-# --- CRUD for Feedback ---
-def create_feedback(goal_id, manager_id, feedback_text):
-    """Creates new feedback for a goal."""
-    conn = get_db_connection()
-    if conn is None:
-        return False
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "INSERT INTO feedback (goal_id, manager_id, feedback_text) VALUES (%s, %s, %s);",
-            (goal_id, manager_id, feedback_text)
-        )
-        conn.commit()
-        return True
-    except psycopg2.Error as e:
-        conn.rollback()
-        print(f"Error creating feedback: {e}")
-        return False
-    finally:
-        cur.close()
-        conn.close()
-
-def read_feedback(goal_id=None):
-    """Reads feedback, filtered by goal_id."""
-    conn = get_db_connection()
-    if conn is None:
-        return []
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "SELECT id, feedback_text, created_at FROM feedback WHERE goal_id = %s ORDER BY created_at DESC;",
-            (goal_id,)
-        )
-        feedback = cur.fetchall()
-        return feedback
-    except psycopg2.Error as e:
-        print(f"Error reading feedback: {e}")
-        return []
-    finally:
-        cur.close()
-        conn.close()
-
-# --- Reporting and Business Insights ---
-def get_performance_history(employee_id):
-    """Retrieves all goals and associated feedback for an employee."""
-    conn = get_db_connection()
-    if conn is None:
-        return [], []
-    
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "SELECT id, description, due_date, status, created_at FROM goals WHERE employee_id = %s ORDER BY created_at DESC;",
-            (employee_id,)
-        )
-        goals = cur.fetchall()
-        
-        history = []
-        for goal_id, description, due_date, status, created_at in goals:
-            cur.execute(
-                "SELECT feedback_text, created_at FROM feedback WHERE goal_id = %s ORDER BY created_at DESC;",
-                (goal_id,)
-            )
-            feedbacks = cur.fetchall()
-            history.append({
-                'goal_id': goal_id,
-                'description': description,
-                'due_date': due_date,
-                'status': status,
-                'created_at': created_at,
-                'feedbacks': feedbacks
-            })
-        return history
-    except psycopg2.Error as e:
-        print(f"Error fetching performance history: {e}")
-        return []
-    finally:
-        cur.close()
-        conn.close()
-
-def get_goal_status_counts(employee_id=None):
-    """Returns a count of goals by status."""
-    conn = get_db_connection()
-    if conn is None:
-        return {}
-    
-    cur = conn.cursor()
-    try:
-        if employee_id:
-            cur.execute("SELECT status, COUNT(*) FROM goals WHERE employee_id = %s GROUP BY status;", (employee_id,))
-        else:
-            cur.execute("SELECT status, COUNT(*) FROM goals GROUP BY status;")
-        counts = dict(cur.fetchall())
-        return counts
-    except psycopg2.Error as e:
-        print(f"Error fetching status counts: {e}")
-        return {}
-    finally:
-        cur.close()
-        conn.close()
-
-def get_avg_days_to_complete_goal(employee_id=None):
-    """Returns the average number of days to complete a goal."""
-    conn = get_db_connection()
-    if conn is None:
-        return None
-    
-    cur = conn.cursor()
-    try:
-        if employee_id:
-            cur.execute("SELECT AVG(EXTRACT(EPOCH FROM (due_date - created_at))) / 86400 FROM goals WHERE employee_id = %s AND status = 'Completed';", (employee_id,))
-        else:
-            cur.execute("SELECT AVG(EXTRACT(EPOCH FROM (due_date - created_at))) / 86400 FROM goals WHERE status = 'Completed';")
-        avg_days = cur.fetchone()[0]
-        return avg_days
-    except psycopg2.Error as e:
-        print(f"Error fetching average completion time: {e}")
-        return None
-    finally:
-        cur.close()
-        conn.close()
-
-def get_max_min_due_date():
-    """Returns the earliest and latest goal due dates."""
-    conn = get_db_connection()
-    if conn is None:
-        return None, None
-    
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT MIN(due_date), MAX(due_date) FROM goals;")
-        min_date, max_date = cur.fetchone()
-        return min_date, max_date
-    except psycopg2.Error as e:
-        print(f"Error fetching min/max dates: {e}")
-        return None, None
-    finally:
-        cur.close()
-        conn.close()
-
-def get_total_tasks_approved():
-    """Returns the total number of approved tasks."""
-    conn = get_db_connection()
-    if conn is None:
-        return 0
-    
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT COUNT(*) FROM tasks WHERE is_approved = TRUE;")
-        count = cur.fetchone()[0]
-        return count
-    except psycopg2.Error as e:
-        print(f"Error fetching total approved tasks: {e}")
-        return 0
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+import contextvars
+import functools
+import json
+import os
+import select
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+from datetime import datetime
+
+from instrumentation import InstrumentedConnection, current_operation, instrumented
+from storage import (
+    DEFAULT_PAGE_SIZE, EMPLOYEE_SEARCH_LIMIT, FRAME_CHUNK_SIZE, GOAL_FRAME_COLUMNS, MAX_PAGE_SIZE, SEARCH_HIGHLIGHT,
+    SEARCH_KINDS, TEAM_TASK_FRAME_COLUMNS, TREND_PERIODS, DashboardSummary, decode_page_token, encode_page_token,
+    escape_like, frame_from_chunks, task_frame_columns
+)
+
+# --- Database Connection Configuration ---
+# You need to replace these with your actual PostgreSQL database credentials.
+# It is recommended to use environment variables in a production environment.
+DB_HOST = "localhost"
+DB_NAME = "pms"
+DB_USER = "postgres"
+DB_PASS = "postgrespv"
+
+# --- Connection Pool Configuration ---
+# The pool is shared by every session served by this process. Sizes and
+# timeouts can be tuned through environment variables without code changes.
+DB_POOL_MIN_SIZE = int(os.environ.get("PMS_DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.environ.get("PMS_DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.environ.get("PMS_DB_POOL_ACQUIRE_TIMEOUT", "10"))
+DB_POOL_MAX_USES = int(os.environ.get("PMS_DB_POOL_MAX_USES", "1000"))
+# Connections idle for longer than this many seconds are pinged before reuse.
+DB_POOL_HEALTH_CHECK_AFTER = float(os.environ.get("PMS_DB_POOL_HEALTH_CHECK_AFTER", "30"))
+
+# --- Timeouts and Fast Failure ---
+# Every statement run through db_connection() is bounded by a statement
+# timeout, per function where the default does not fit (0 disables it), and
+# connection attempts by a connect timeout. After repeated connection
+# failures the circuit breaker fails new connections at once, instead of each
+# call waiting out the connect timeout, until a probe connects again.
+DB_CONNECT_TIMEOUT = int(os.environ.get("PMS_DB_CONNECT_TIMEOUT", "5"))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("PMS_DB_STATEMENT_TIMEOUT_MS", "15000"))
+STATEMENT_TIMEOUTS_MS = {
+    "search_employees": 2000,
+    "search_records": 5000,
+    "export_dataset": 0,
+    "import_records": 0,
+}
+DB_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("PMS_DB_BREAKER_FAILURE_THRESHOLD", "3"))
+DB_BREAKER_RESET_SECONDS = float(os.environ.get("PMS_DB_BREAKER_RESET_SECONDS", "10"))
+
+class DatabaseUnavailableError(psycopg2.OperationalError):
+    """Raised instead of connecting while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """
+    Counts consecutive connection failures; at `failure_threshold` it opens
+    and call() fails at once. After `reset_seconds` one call is let through
+    as a probe: if it connects the breaker closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold=DB_BREAKER_FAILURE_THRESHOLD, reset_seconds=DB_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_error = None
+        self._lock = threading.Lock()
+        self._stats = {'failures': 0, 'rejected': 0, 'opened': 0, 'probes': 0}
+
+    def _allow(self):
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = "half_open"
+            if self._state == "half_open" and not self._probing:
+                self._probing = True
+                self._stats['probes'] += 1
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def _record_success(self):
+        with self._lock:
+            if self._state != "closed":
+                print("Database reachable again; circuit breaker closed.")
+            self._state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def _record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._stats['failures'] += 1
+            self._last_error = str(error).strip()
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._stats['opened'] += 1
+                    print(f"Database unreachable after {self._failures} attempt(s); failing fast for {self.reset_seconds:g}s: {self._last_error}")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def call(self, connect):
+        """Returns connect(), or raises DatabaseUnavailableError while the breaker is open."""
+        if not self._allow():
+            raise DatabaseUnavailableError(f"database unavailable (circuit breaker open): {self._last_error}")
+        try:
+            conn = connect()
+        except BaseException as e:
+            self._record_failure(e)
+            raise
+        self._record_success()
+        return conn
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return self._state
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'consecutive_failures': self._failures, 'last_error': self._last_error})
+        stats['state'] = self.state
+        return stats
+
+_circuit_breaker = CircuitBreaker()
+
+def get_circuit_breaker_stats():
+    """Returns the state and counters of the primary database's circuit breaker."""
+    return _circuit_breaker.stats()
+
+def _connect():
+    """Opens a new database connection, raising on failure or while the circuit breaker is open."""
+    return _circuit_breaker.call(lambda: psycopg2.connect(
+        host=DB_HOST,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASS,
+        connect_timeout=DB_CONNECT_TIMEOUT,
+        connection_factory=InstrumentedConnection
+    ))
+
+def get_db_connection():
+    """Establishes and returns a new, unpooled database connection."""
+    conn = None
+    try:
+        conn = _connect()
+    except psycopg2.OperationalError as e:
+        print(f"Error connecting to database: {e}")
+    return conn
+
+# --- Connection Pool ---
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """Raised when no pooled connection becomes free within the acquire timeout."""
+
+class _PooledConnection:
+    __slots__ = ("conn", "uses", "last_used", "wait_seconds", "statement_timeout_ms")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.uses = 0
+        self.last_used = time.monotonic()
+        self.wait_seconds = 0.0
+        # The statement_timeout last set on the connection, None for the server default.
+        self.statement_timeout_ms = None
+
+class ConnectionPool:
+    """
+    A thread-safe, bounded pool of PostgreSQL connections.
+    Connections are health-checked on checkout when they have been idle for a
+    while and are recycled after a fixed number of uses.
+    """
+
+    def __init__(self, connect=_connect, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT, max_uses=DB_POOL_MAX_USES,
+                 health_check_after=DB_POOL_HEALTH_CHECK_AFTER):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_uses = max_uses
+        self.health_check_after = health_check_after
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+        }
+        self._fill()
+
+    def _fill(self):
+        """Opens connections until the pool holds at least min_size of them."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                entry = _PooledConnection(self._connect())
+            except psycopg2.Error as e:
+                with self._cond:
+                    self._size -= 1
+                print(f"Error pre-filling connection pool: {e}")
+                return
+            with self._cond:
+                self._stats['created'] += 1
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def _is_healthy(self, entry):
+        conn = entry.conn
+        if conn.closed:
+            return False
+        if time.monotonic() - entry.last_used < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _drop(self, entry):
+        try:
+            entry.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def acquire(self, timeout=None):
+        """Checks out a connection, waiting up to `timeout` seconds for one to free up."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"no database connection available after {timeout:.1f}s "
+                        f"({self._in_use} of {self.max_size} in use)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+            wait_seconds = time.monotonic() - started
+            self._stats['checkouts'] += 1
+            self._stats['total_wait_seconds'] += wait_seconds
+            self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], wait_seconds)
+            if waited:
+                self._stats['waits'] += 1
+
+        try:
+            if entry is not None and not self._is_healthy(entry):
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                self._drop(entry)
+                entry = None
+            if entry is None:
+                entry = _PooledConnection(self._connect())
+                with self._cond:
+                    self._stats['created'] += 1
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        entry.uses += 1
+        entry.wait_seconds = wait_seconds
+        return entry
+
+    def release(self, entry, discard=False):
+        """Returns a checked-out connection, closing it if broken or worn out."""
+        conn = entry.conn
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        recycle = discard or conn.closed or entry.uses >= self.max_uses
+        if recycle:
+            self._drop(entry)
+        else:
+            entry.last_used = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if recycle or self._closed:
+                self._size -= 1
+                self._stats['recycled'] += 1
+                if not recycle:
+                    self._drop(entry)
+            else:
+                self._idle.append(entry)
+            self._cond.notify()
+
+    def stats(self):
+        """Returns a snapshot of pool usage counters."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        stats['avg_wait_seconds'] = (
+            stats['total_wait_seconds'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        )
+        return stats
+
+    def close(self):
+        """Closes idle connections; checked-out ones are closed when released."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._drop(entry)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+def configure_pool(**settings):
+    """Replaces the process-wide pool with one built from the given settings."""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, ConnectionPool(**settings)
+    if old is not None:
+        old.close()
+    return _pool
+
+def get_pool_stats():
+    """Returns in-use, idle and wait-time statistics for the shared pool."""
+    return get_pool().stats()
+
+# --- Read Replicas ---
+# Read-only functions are routed to replicas listed in PMS_DB_REPLICAS
+# (libpq DSNs or URIs separated by ";"), round-robin over the healthy ones;
+# writes always go to the primary. A replica that fails to connect is skipped
+# for DB_REPLICA_RETRY_SECONDS, and one whose replay lags by more than
+# DB_REPLICA_MAX_LAG_SECONDS is skipped until its next lag check. A replica
+# whose pool stays busy for DB_REPLICA_ACQUIRE_TIMEOUT is only passed over for
+# that checkout. Without a healthy replica to spare, reads use the primary.
+DB_REPLICA_DSNS = [dsn.strip() for dsn in os.environ.get("PMS_DB_REPLICAS", "").split(";") if dsn.strip()]
+DB_REPLICA_RETRY_SECONDS = float(os.environ.get("PMS_DB_REPLICA_RETRY_SECONDS", "30"))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get("PMS_DB_REPLICA_MAX_LAG_SECONDS", "10"))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.environ.get("PMS_DB_REPLICA_LAG_CHECK_SECONDS", "5"))
+DB_REPLICA_ACQUIRE_TIMEOUT = float(os.environ.get("PMS_DB_REPLICA_ACQUIRE_TIMEOUT", "0.5"))
+# After a session writes, its reads stay on the primary for this many seconds
+# so that the rerun following a write sees it despite replication lag.
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("PMS_READ_YOUR_WRITES_SECONDS", "10"))
+
+_REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END;
+"""
+
+def _describe_dsn(dsn):
+    """Returns `dsn` without its password, for display."""
+    try:
+        params = psycopg2.extensions.parse_dsn(dsn)
+    except psycopg2.ProgrammingError:
+        return "<invalid dsn>"
+    params.pop("password", None)
+    return psycopg2.extensions.make_dsn(**params)
+
+def _connect_dsn(dsn):
+    """Opens a new connection to the server described by `dsn`."""
+    return psycopg2.connect(dsn, connect_timeout=DB_CONNECT_TIMEOUT, connection_factory=InstrumentedConnection)
+
+class _Replica:
+    def __init__(self, dsn, pool):
+        self.dsn = dsn
+        self.pool = pool
+        self.down_until = 0.0
+        self.lag_seconds = None
+        self.lag_checked_at = 0.0
+        self.failures = 0
+        self.checkouts = 0
+        self.busy = 0
+
+class ReplicaRouter:
+    """Balances read-only checkouts over replica pools and tracks their health."""
+
+    def __init__(self, dsns, pool_factory=None, retry_seconds=DB_REPLICA_RETRY_SECONDS,
+                 max_lag_seconds=DB_REPLICA_MAX_LAG_SECONDS, lag_check_seconds=DB_REPLICA_LAG_CHECK_SECONDS,
+                 acquire_timeout=DB_REPLICA_ACQUIRE_TIMEOUT):
+        pool_factory = pool_factory or (lambda dsn: ConnectionPool(connect=functools.partial(_connect_dsn, dsn), min_size=0))
+        self.retry_seconds = retry_seconds
+        self.acquire_timeout = acquire_timeout
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_seconds = lag_check_seconds
+        self._replicas = [_Replica(dsn, pool_factory(dsn)) for dsn in dsns]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _candidates(self):
+        """Healthy replicas, rotated one step per call for round-robin balancing."""
+        now = time.monotonic()
+        healthy = [replica for replica in self._replicas if replica.down_until <= now]
+        if not healthy:
+            return []
+        with self._lock:
+            start = self._next % len(healthy)
+            self._next += 1
+        return healthy[start:] + healthy[:start]
+
+    def _mark_down(self, replica, error):
+        replica.failures += 1
+        replica.down_until = time.monotonic() + self.retry_seconds
+        print(f"Read replica unavailable, using others or the primary for {self.retry_seconds:g}s: {error}")
+
+    def _lag_ok(self, replica, conn):
+        if time.monotonic() - replica.lag_checked_at < self.lag_check_seconds:
+            return replica.lag_seconds is None or replica.lag_seconds <= self.max_lag_seconds
+        with conn.cursor() as cur:
+            cur.execute(_REPLICA_LAG_SQL)
+            replica.lag_seconds = float(cur.fetchone()[0])
+        conn.rollback()
+        replica.lag_checked_at = time.monotonic()
+        return replica.lag_seconds <= self.max_lag_seconds
+
+    def acquire(self):
+        """Returns (replica, pooled entry) from the next healthy replica, or (None, None)."""
+        for replica in self._candidates():
+            try:
+                entry = replica.pool.acquire(self.acquire_timeout)
+            except PoolTimeoutError:
+                # Busy, not broken: try the next replica or the primary, but
+                # keep this one for the next checkout.
+                replica.busy += 1
+                continue
+            except psycopg2.Error as e:
+                self._mark_down(replica, e)
+                continue
+            try:
+                if self._lag_ok(replica, entry.conn):
+                    replica.checkouts += 1
+                    return replica, entry
+            except psycopg2.Error as e:
+                replica.pool.release(entry, discard=True)
+                self._mark_down(replica, e)
+                continue
+            replica.pool.release(entry)
+        return None, None
+
+    def release(self, replica, entry, discard=False):
+        if discard:
+            self._mark_down(replica, "connection lost")
+        replica.pool.release(entry, discard=discard)
+
+    def stats(self):
+        now = time.monotonic()
+        return [
+            {
+                'dsn': _describe_dsn(replica.dsn),
+                'healthy': replica.down_until <= now,
+                'lag_seconds': replica.lag_seconds,
+                'failures': replica.failures,
+                'checkouts': replica.checkouts,
+                'busy': replica.busy,
+                'pool': replica.pool.stats(),
+            }
+            for replica in self._replicas
+        ]
+
+    def close(self):
+        for replica in self._replicas:
+            replica.pool.close()
+
+_replica_router = None
+
+def get_replica_router():
+    """Returns the process-wide replica router, or None when no replicas are configured."""
+    global _replica_router
+    if _replica_router is None and DB_REPLICA_DSNS:
+        with _pool_lock:
+            if _replica_router is None:
+                _replica_router = ReplicaRouter(DB_REPLICA_DSNS)
+    return _replica_router
+
+def configure_replicas(dsns, **settings):
+    """Replaces the replica set (an empty list disables replica reads)."""
+    global _replica_router
+    with _pool_lock:
+        old, _replica_router = _replica_router, ReplicaRouter(dsns, **settings) if dsns else None
+    if old is not None:
+        old.close()
+    return _replica_router
+
+def get_replica_stats():
+    """Returns health, lag and pool statistics per configured replica."""
+    router = get_replica_router()
+    return router.stats() if router else []
+
+# --- Read-Your-Writes Sessions ---
+# The application binds each user session to a key (see set_db_session());
+# writes record when that session last wrote.
+_db_session = contextvars.ContextVar("pms_db_session", default=None)
+_primary_reads = contextvars.ContextVar("pms_primary_reads", default=False)
+_session_writes = {}
+_session_writes_lock = threading.Lock()
+
+def set_db_session(key):
+    """Attributes the current context's database calls to the session `key`."""
+    _db_session.set(key)
+
+@contextmanager
+def primary_reads():
+    """Routes read-only queries inside the block to the primary."""
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+def _record_session_write():
+    key = _db_session.get()
+    if key is None:
+        return
+    now = time.monotonic()
+    with _session_writes_lock:
+        _session_writes[key] = now
+        if len(_session_writes) > 10000:
+            for stale in [k for k, at in _session_writes.items() if now - at > READ_YOUR_WRITES_SECONDS]:
+                del _session_writes[stale]
+
+# Connections running statements for each session, so that a session's
+# queries can be cancelled when it stops waiting for them.
+_session_connections = {}
+_session_connections_lock = threading.Lock()
+
+def _track_session_connection(key, conn, active):
+    with _session_connections_lock:
+        if active:
+            _session_connections.setdefault(key, set()).add(conn)
+        else:
+            connections = _session_connections.get(key)
+            if connections is not None:
+                connections.discard(conn)
+                if not connections:
+                    del _session_connections[key]
+
+def cancel_session_queries(key):
+    """
+    Cancels the statements running for session `key`; the functions that ran
+    them fail as they do on any database error. Returns how many connections
+    were signalled. A cancel racing with the end of a statement can, rarely,
+    hit the connection's next statement instead.
+    """
+    with _session_connections_lock:
+        connections = list(_session_connections.get(key, ()))
+    for conn in connections:
+        try:
+            conn.cancel()
+        except psycopg2.Error as e:
+            print(f"Error cancelling a query: {e}")
+    return len(connections)
+
+def _reads_need_primary():
+    if _primary_reads.get():
+        return True
+    key = _db_session.get()
+    if key is None:
+        return False
+    last_write = _session_writes.get(key)
+    return last_write is not None and time.monotonic() - last_write < READ_YOUR_WRITES_SECONDS
+
+@contextmanager
+def db_connection(read_only=False):
+    """
+    Checks a connection out of the shared pool for the duration of the block.
+    The transaction is committed when the block exits normally and rolled back
+    when it raises; the connection then goes back to the pool. Read-only
+    blocks may be served by a replica (see ReplicaRouter). Statements are
+    bounded by the calling function's statement timeout.
+    """
+    replica = entry = None
+    if read_only and not _reads_need_primary():
+        router = get_replica_router()
+        if router is not None:
+            replica, entry = router.acquire()
+    if entry is None:
+        pool = get_pool()
+        entry = pool.acquire()
+        release = pool.release
+    else:
+        release = functools.partial(router.release, replica)
+    conn = entry.conn
+    conn.pending_acquire_wait_ms = entry.wait_seconds * 1000
+    session = _db_session.get()
+    if session is not None:
+        _track_session_connection(session, conn, True)
+    discard = False
+    try:
+        statement_timeout_ms = STATEMENT_TIMEOUTS_MS.get(current_operation(), DB_STATEMENT_TIMEOUT_MS)
+        if entry.statement_timeout_ms != statement_timeout_ms:
+            # A plain cursor, so that the SET stays out of the query statistics.
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                cur.execute("SET statement_timeout = %s;", (statement_timeout_ms,))
+            conn.commit()
+            entry.statement_timeout_ms = statement_timeout_ms
+        yield conn
+        conn.commit()
+        if not read_only:
+            _record_session_write()
+    except BaseException:
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        raise
+    finally:
+        if session is not None:
+            _track_session_connection(session, conn, False)
+        release(entry, discard=discard or bool(conn.closed))
+
+@contextmanager
+def db_cursor(read_only=False):
+    """Yields a cursor on a pooled connection, see db_connection()."""
+    with db_connection(read_only) as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+# --- Query Result Cache ---
+# Read results are cached per process, keyed by function and arguments. Each
+# entry carries tags such as ("goals", "employee", 7) so that writes can evict
+# exactly the entries they affect. Cached values are shared between sessions
+# and must be treated as read-only by callers. Writes from other processes are
+# evicted by the change listener below, so the TTL only bounds staleness if
+# notifications are missed; processes without a listener should lower it.
+QUERY_CACHE_TTL = float(os.environ.get("PMS_QUERY_CACHE_TTL", "600"))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("PMS_QUERY_CACHE_MAX_ENTRIES", "1024"))
+# Expired entries are kept this many seconds longer and served when reloading
+# them fails because the database is unreachable or too slow.
+QUERY_CACHE_MAX_STALE = float(os.environ.get("PMS_QUERY_CACHE_MAX_STALE", "3600"))
+
+class QueryCache:
+    """A thread-safe LRU cache with per-entry TTL and tag-based invalidation."""
+
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES, primary_window=READ_YOUR_WRITES_SECONDS,
+                 max_stale=QUERY_CACHE_MAX_STALE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        # Fills of tags invalidated this recently read from the primary, so a
+        # lagging replica cannot put pre-write rows back into the cache.
+        self.primary_window = primary_window
+        self._invalidated_at = {}
+        self._table_invalidated_at = {}
+        self._cleared_at = None
+        self._entries = OrderedDict()
+        self._keys_by_tag = {}
+        self._tag_versions = {}
+        # Bumped by clear() and invalidate_table() so in-flight fills are not kept.
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0, 'stale_hits': 0}
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def fetch(self, key, tags, loader):
+        """
+        Returns the cached value for `key`, calling `loader()` on a miss. If
+        the loader fails with an operational error (database unreachable,
+        statement timeout, pool exhausted), an expired value of at most
+        `max_stale` seconds is returned instead.
+        """
+        tags = tuple(tags)
+        stale = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                now = time.monotonic()
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[1]
+                self._stats['expirations'] += 1
+                if now - entry[0] <= self.max_stale:
+                    # Kept until the reload succeeds, in case it does not.
+                    stale = entry
+                else:
+                    self._remove(key)
+            self._stats['misses'] += 1
+            generation = self._generation
+            versions = [self._tag_versions.get(tag, 0) for tag in tags]
+            recently_written = self._recently_invalidated(tags)
+
+        try:
+            if recently_written:
+                with primary_reads():
+                    value = loader()
+            else:
+                value = loader()
+        except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
+            with self._lock:
+                # Writes evict entries; only serve the one we saw if it is still there.
+                if stale is None or self._entries.get(key) is not stale:
+                    raise
+                self._stats['stale_hits'] += 1
+            print(f"Serving a stale cached result, the database query failed: {str(e).strip()}")
+            return stale[1]
+
+        with self._lock:
+            # A write that invalidated one of our tags while the query ran may
+            # not be reflected in `value`; serve it once but do not keep it.
+            if generation != self._generation or versions != [self._tag_versions.get(tag, 0) for tag in tags]:
+                return value
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+        return value
+
+    def _recently_invalidated(self, tags):
+        cutoff = time.monotonic() - self.primary_window
+        if self._cleared_at is not None and self._cleared_at > cutoff:
+            return True
+        return any(
+            self._invalidated_at.get(tag, cutoff) > cutoff or self._table_invalidated_at.get(tag[0], cutoff) > cutoff
+            for tag in tags
+        )
+
+    def _note_invalidated(self, times, key):
+        now = time.monotonic()
+        times[key] = now
+        if len(times) > 10000:
+            for stale in [k for k, at in times.items() if now - at > self.primary_window]:
+                del times[stale]
+
+    def invalidate(self, *tags):
+        """Evicts every entry carrying any of the given tags."""
+        with self._lock:
+            for tag in tags:
+                self._note_invalidated(self._invalidated_at, tag)
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+
+    def invalidate_table(self, table):
+        """Evicts every entry carrying a tag of `table`."""
+        with self._lock:
+            self._generation += 1
+            self._note_invalidated(self._table_invalidated_at, table)
+            for tag in [tag for tag in self._keys_by_tag if tag[0] == table]:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._cleared_at = time.monotonic()
+            self._entries.clear()
+            self._keys_by_tag.clear()
+            self._tag_versions.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+query_cache = QueryCache()
+
+def get_cache_stats():
+    """Returns hit/miss counters for the query result cache."""
+    return query_cache.stats()
+
+def clear_cache():
+    """Drops every cached query result."""
+    query_cache.clear()
+
+def _invalidate(table, employee_id=None, goal_id=None):
+    """Evicts cached reads of `table` touched by a write for the given employee/goal."""
+    tags = [(table, "all")]
+    if employee_id is not None:
+        tags.append((table, "employee", employee_id))
+    if goal_id is not None:
+        tags.append((table, "goal", goal_id))
+    query_cache.invalidate(*tags)
+
+# --- Cross-Process Invalidation ---
+# Table triggers (migration 6) NOTIFY this channel with a JSON payload such
+# as {"tables": ["goals"], "employees": [3], "goals": [17]} when a write
+# commits, or {"tables": [...], "all": true} when whole tables changed. A
+# listener thread per process evicts the matching cache entries, so writes
+# made by other processes, imports and ad-hoc SQL do not leave stale reads.
+CHANGE_CHANNEL = "pms_changes"
+CHANGE_LISTENER_POLL_SECONDS = 5.0
+CHANGE_LISTENER_RETRY_SECONDS = 2.0
+
+def apply_change_notification(payload):
+    """Evicts the cache entries named by one pms_changes payload."""
+    change = json.loads(payload)
+    for table in change['tables']:
+        if change.get('all'):
+            query_cache.invalidate_table(table)
+            continue
+        tags = [(table, "all")]
+        tags += [(table, "employee", employee_id) for employee_id in change.get('employees') or ()]
+        tags += [(table, "goal", goal_id) for goal_id in change.get('goals') or ()]
+        query_cache.invalidate(*tags)
+
+class ChangeListener(threading.Thread):
+    """
+    Background thread that LISTENs on CHANGE_CHANNEL over its own connection.
+    Whenever the connection is (re)established the whole cache is dropped,
+    since notifications sent while it was down are lost.
+    """
+
+    def __init__(self, connect=_connect, channel=CHANGE_CHANNEL):
+        super().__init__(name="pms-change-listener", daemon=True)
+        self._connect = connect
+        self.channel = channel
+        self._stop_event = threading.Event()
+        self._conn = None
+        self.stats = {'notifications': 0, 'connects': 0, 'errors': 0, 'last_error': None}
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except (psycopg2.Error, OSError, ValueError, KeyError) as e:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = str(e)
+                print(f"Error in change listener: {e}")
+                self._close()
+                self._stop_event.wait(CHANGE_LISTENER_RETRY_SECONDS)
+        self._close()
+
+    def _listen(self):
+        self._conn = self._connect()
+        self._conn.autocommit = True
+        with self._conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel};")
+        self.stats['connects'] += 1
+        query_cache.clear()
+        while not self._stop_event.is_set():
+            if select.select([self._conn], [], [], CHANGE_LISTENER_POLL_SECONDS) == ([], [], []):
+                continue
+            self._conn.poll()
+            while self._conn.notifies:
+                notify = self._conn.notifies.pop(0)
+                apply_change_notification(notify.payload)
+                self.stats['notifications'] += 1
+
+    def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.closed:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self.join(timeout)
+
+_change_listener = None
+_change_listener_lock = threading.Lock()
+
+def start_change_listener():
+    """Starts this process's change listener if it is not already running and returns it."""
+    global _change_listener
+    with _change_listener_lock:
+        if _change_listener is None or not _change_listener.is_alive():
+            _change_listener = ChangeListener()
+            _change_listener.start()
+        return _change_listener
+
+def get_change_listener_stats():
+    """Returns the listener's counters, or None when no listener runs in this process."""
+    listener = _change_listener
+    if listener is None:
+        return None
+    return dict(listener.stats, running=listener.is_alive())
+
+# --- Concurrent Fetching ---
+# Independent reads for one page run on a shared thread pool, each on its own
+# pooled connection, so page latency tracks the slowest query rather than
+# the sum of all of them.
+FETCH_WORKERS = int(os.environ.get("PMS_FETCH_WORKERS", str(DB_POOL_MAX_SIZE)))
+FETCH_CHECKPOINT_SECONDS = 0.25
+
+_fetch_executor = None
+_fetch_executor_lock = threading.Lock()
+
+def _get_fetch_executor():
+    global _fetch_executor
+    if _fetch_executor is None:
+        with _fetch_executor_lock:
+            if _fetch_executor is None:
+                _fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="pms-fetch")
+    return _fetch_executor
+
+def fetch_bundle(requests, checkpoint=None):
+    """
+    Runs independent loaders concurrently and returns their results by name.
+    `requests` maps a name to either a zero-argument callable or a
+    (function, arg, ...) tuple. An exception raised by any loader is re-raised.
+    `checkpoint` is called every FETCH_CHECKPOINT_SECONDS while loaders run;
+    if it raises, e.g. because the caller has been told to stop, the
+    session's running statements are cancelled and the exception propagates.
+    """
+    executor = _get_fetch_executor()
+    futures = {}
+    for name, request in requests.items():
+        # Each loader runs in a copy of the caller's context so that the
+        # database session and operation labels follow it to the worker.
+        if callable(request):
+            futures[name] = executor.submit(contextvars.copy_context().run, request)
+        else:
+            function, *args = request
+            futures[name] = executor.submit(contextvars.copy_context().run, function, *args)
+    if checkpoint is not None:
+        pending = set(futures.values())
+        try:
+            while pending:
+                _, pending = wait(pending, timeout=FETCH_CHECKPOINT_SECONDS)
+                if pending:
+                    checkpoint()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            cancel_session_queries(_db_session.get())
+            raise
+    return {name: future.result() for name, future in futures.items()}
+
+# --- DataFrame Reads ---
+# The *_frame() reads build their DataFrame chunk by chunk instead of going
+# through one fetchall() list of tuples. The result set itself stays in
+# libpq's compact buffer; only one chunk at a time becomes Python tuples.
+def _read_frame(sql, params, columns):
+    """Runs `sql` and returns its rows as a DataFrame with `columns`, see storage.frame_from_chunks()."""
+    with db_cursor(read_only=True) as cur:
+        cur.execute(sql, params)
+        return frame_from_chunks(iter(lambda: cur.fetchmany(FRAME_CHUNK_SIZE), []), columns)
+
+# "auto" upgrades the schema when a server process starts (prepare_schema()).
+# Deployments that run `python migrations.py upgrade` and `python
+# partitioning.py maintain` themselves set "check": processes then only read
+# schema_version, without DDL or the migration lock.
+SCHEMA_UPGRADE = os.environ.get("PMS_SCHEMA_UPGRADE", "auto")
+
+@instrumented
+def create_tables():
+    """
+    Brings the database schema up to date by applying any pending migrations
+    and, if the tables are partitioned, creating the partitions of the coming
+    review cycles. Safe to call repeatedly; see migrations.py for the
+    versioned schema and partitioning.py for the partitions. Returns False
+    on failure.
+    """
+    import migrations
+    import partitioning
+    try:
+        migrations.upgrade()
+        partitioning.maintain()
+        return True
+    except psycopg2.Error as e:
+        print(f"Error creating tables: {e}")
+        return False
+
+@instrumented
+def prepare_schema():
+    """
+    Readies the schema for a new server process according to SCHEMA_UPGRADE:
+    create_tables(), or in "check" mode only a check that no migration is
+    pending. Returns whether the schema is ready.
+    """
+    if SCHEMA_UPGRADE != "check":
+        return create_tables()
+    import migrations
+    try:
+        pending = migrations.pending_versions()
+    except psycopg2.Error as e:
+        print(f"Error checking the schema version: {e}")
+        return False
+    if pending:
+        print(f"Pending schema migrations {pending}; run `python migrations.py upgrade`.")
+        return False
+    return True
+
+# --- Manager and Employee Management ---
+@instrumented
+def get_all_employees():
+    """Reads and returns a list of all employees."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute("SELECT id, name FROM employees ORDER BY name;")
+            return cur.fetchall()
+    try:
+        return query_cache.fetch(("get_all_employees",), [("employees", "all")], load)
+    except psycopg2.Error as e:
+        print(f"Error fetching employees: {e}")
+        return []
+
+@instrumented
+def add_employee(name, manager_id=None):
+    """Creates a new employee, optionally reporting to `manager_id`."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("INSERT INTO employees (name, manager_id) VALUES (%s, %s) RETURNING id;", (name, manager_id))
+            employee_id = cur.fetchone()[0]
+        _invalidate("employees", employee_id)
+        return employee_id
+    except psycopg2.Error as e:
+        print(f"Error adding employee: {e}")
+        return None
+
+@instrumented
+def get_employee(employee_id):
+    """Returns (id, name) of one employee, or None if there is no such employee."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute("SELECT id, name FROM employees WHERE id = %s;", (employee_id,))
+            return cur.fetchone()
+    try:
+        return query_cache.fetch(("get_employee", employee_id), [("employees", "employee", employee_id)], load)
+    except psycopg2.Error as e:
+        print(f"Error fetching employee: {e}")
+        return None
+
+# --- Employee Search ---
+_trigram_search = None
+
+def _trigram_search_available(cur):
+    """
+    Whether pg_trgm is installed; checked once per process (see migration 5)
+    on the caller's cursor, so that the caller does not hold one pooled
+    connection while it waits for a second.
+    """
+    global _trigram_search
+    if _trigram_search is None:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');")
+        _trigram_search = cur.fetchone()[0]
+    return _trigram_search
+
+@instrumented
+def search_employees(query, limit=EMPLOYEE_SEARCH_LIMIT):
+    """
+    Returns up to `limit` (id, name) employees matching `query`, best first:
+    names starting with it, then names with a word starting with it, then
+    other substring matches. With pg_trgm installed, misspelt names match too
+    and ties are ranked by trigram similarity. An empty query returns the
+    first employees by name.
+    """
+    term = (query or "").strip().lower()
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    def load():
+        with db_cursor(read_only=True) as cur:
+            if not term:
+                cur.execute("SELECT id, name FROM employees ORDER BY name, id LIMIT %s;", (limit,))
+                return cur.fetchall()
+            params = {
+                'term': term,
+                'prefix': escape_like(term) + "%",
+                'word': "% " + escape_like(term) + "%",
+                'contains': "%" + escape_like(term) + "%",
+                'limit': limit,
+            }
+            # Prefix matches come first, straight from the prefix index; the
+            # broader match only runs if they do not fill the limit.
+            where = "lower(name) LIKE %(contains)s"
+            rank = "lower(name) LIKE %(word)s DESC"
+            if _trigram_search_available(cur):
+                where = f"({where} OR lower(name) %% %(term)s)"
+                rank += ", similarity(lower(name), %(term)s) DESC"
+            cur.execute(
+                f"""
+                (SELECT id, name FROM employees WHERE lower(name) LIKE %(prefix)s
+                 ORDER BY name, id LIMIT %(limit)s)
+                UNION ALL
+                (SELECT id, name FROM employees WHERE {where} AND lower(name) NOT LIKE %(prefix)s
+                 ORDER BY {rank}, name, id LIMIT %(limit)s)
+                LIMIT %(limit)s;
+                """,
+                params
+            )
+            return cur.fetchall()
+    try:
+        return query_cache.fetch(("search_employees", term, limit), [("employees", "all")], load)
+    except psycopg2.Error as e:
+        print(f"Error searching employees: {e}")
+        return []
+
+# --- Reporting Lines and Teams ---
+# A manager's team is everyone below them in the reporting tree. Team reads
+# join through the trigger-maintained employee_hierarchy closure table
+# (migration 8), so they cost one index range scan however deep the tree is.
+@instrumented
+def set_manager(employee_id, manager_id):
+    """
+    Makes `employee_id` report to `manager_id` (None for nobody). Returns
+    False if either employee is missing or the change would form a cycle.
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute("UPDATE employees SET manager_id = %s WHERE id = %s RETURNING id;", (manager_id, employee_id))
+            updated = cur.fetchone() is not None
+        _invalidate("employees", employee_id)
+        return updated
+    except psycopg2.Error as e:
+        print(f"Error setting manager: {e}")
+        return False
+
+@instrumented
+def get_manager(employee_id):
+    """Returns (id, name) of the employee's manager, or None."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(
+                "SELECT m.id, m.name FROM employees e JOIN employees m ON m.id = e.manager_id WHERE e.id = %s;",
+                (employee_id,)
+            )
+            return cur.fetchone()
+    try:
+        return query_cache.fetch(("get_manager", employee_id), [("employees", "employee", employee_id)], load)
+    except psycopg2.Error as e:
+        print(f"Error fetching manager: {e}")
+        return None
+
+@instrumented
+def get_team(manager_id):
+    """Returns (id, name, manager_id, depth) for everyone below a manager, nearest first."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(
+                """
+                SELECT e.id, e.name, e.manager_id, h.depth
+                FROM employee_hierarchy h
+                JOIN employees e ON e.id = h.descendant_id
+                WHERE h.ancestor_id = %s AND h.depth > 0
+                ORDER BY h.depth, e.name, e.id;
+                """,
+                (manager_id,)
+            )
+            return cur.fetchall()
+    try:
+        return query_cache.fetch(("get_team", manager_id), [("employees", "all")], load)
+    except psycopg2.Error as e:
+        print(f"Error fetching team: {e}")
+        return []
+
+_TEAM_GOALS_SQL = """
+    SELECT g.id, e.name, g.description, g.due_date, g.status
+    FROM employee_hierarchy h
+    JOIN employees e ON e.id = h.descendant_id
+    JOIN goals g ON g.employee_id = h.descendant_id
+    WHERE h.ancestor_id = %s AND h.depth > 0
+    ORDER BY g.due_date DESC, g.id;
+"""
+
+_TEAM_TASKS_SQL = """
+    SELECT t.id, e.name, g.description, t.description, t.is_approved
+    FROM employee_hierarchy h
+    JOIN employees e ON e.id = h.descendant_id
+    JOIN tasks t ON t.employee_id = h.descendant_id
+    JOIN goals g ON g.id = t.goal_id
+    WHERE h.ancestor_id = %s AND h.depth > 0
+    ORDER BY t.created_at DESC, t.id DESC;
+"""
+
+@instrumented
+def read_team_goals(manager_id):
+    """Returns read_goals() rows for the goals of a manager's whole team."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(_TEAM_GOALS_SQL, (manager_id,))
+            return cur.fetchall()
+    try:
+        return query_cache.fetch(("read_team_goals", manager_id), [("employees", "all"), ("goals", "all")], load)
+    except psycopg2.Error as e:
+        print(f"Error reading team goals: {e}")
+        return []
+
+@instrumented
+def read_team_goals_frame(manager_id):
+    """Returns read_team_goals() as a DataFrame with GOAL_FRAME_COLUMNS."""
+    def load():
+        return _read_frame(_TEAM_GOALS_SQL, (manager_id,), GOAL_FRAME_COLUMNS)
+    try:
+        return query_cache.fetch(("read_team_goals_frame", manager_id), [("employees", "all"), ("goals", "all")], load)
+    except psycopg2.Error as e:
+        print(f"Error reading team goals: {e}")
+        return frame_from_chunks([], GOAL_FRAME_COLUMNS)
+
+@instrumented
+def read_team_tasks(manager_id):
+    """
+    Returns (id, employee name, goal description, description, is_approved)
+    for the tasks of a manager's whole team, newest first.
+    """
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(_TEAM_TASKS_SQL, (manager_id,))
+            return cur.fetchall()
+    tags = [("employees", "all"), ("goals", "all"), ("tasks", "all")]
+    try:
+        return query_cache.fetch(("read_team_tasks", manager_id), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading team tasks: {e}")
+        return []
+
+@instrumented
+def read_team_tasks_frame(manager_id):
+    """Returns read_team_tasks() as a DataFrame with TEAM_TASK_FRAME_COLUMNS."""
+    def load():
+        return _read_frame(_TEAM_TASKS_SQL, (manager_id,), TEAM_TASK_FRAME_COLUMNS)
+    tags = [("employees", "all"), ("goals", "all"), ("tasks", "all")]
+    try:
+        return query_cache.fetch(("read_team_tasks_frame", manager_id), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading team tasks: {e}")
+        return frame_from_chunks([], TEAM_TASK_FRAME_COLUMNS)
+
+@instrumented
+def get_team_goal_status_counts(manager_id):
+    """Returns {status: goal count} over a manager's whole team."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            # Summed from the per-employee goal_status_summary rows rather
+            # than counted from goals.
+            cur.execute(
+                """
+                SELECT s.status, SUM(s.goal_count)::BIGINT
+                FROM employee_hierarchy h
+                JOIN goal_status_summary s ON s.employee_id = h.descendant_id
+                WHERE h.ancestor_id = %s AND h.depth > 0 AND s.goal_count > 0
+                GROUP BY s.status;
+                """,
+                (manager_id,)
+            )
+            return dict(cur.fetchall())
+    try:
+        return query_cache.fetch(("get_team_goal_status_counts", manager_id), [("employees", "all"), ("goals", "all")], load)
+    except psycopg2.Error as e:
+        print(f"Error fetching team status counts: {e}")
+        return {}
+
+# --- CRUD for Goals ---
+@instrumented
+def create_goal(employee_id, description, due_date, status="Draft"):
+    """Creates a new goal for an employee."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO goals (employee_id, description, due_date, status) VALUES (%s, %s, %s, %s);",
+                (employee_id, description, due_date, status)
+            )
+        _invalidate("goals", employee_id)
+        return True
+    except psycopg2.Error as e:
+        print(f"Error creating goal: {e}")
+        return False
+
+def _goals_query(employee_id, since=None):
+    """Returns the (sql, params) of read_goals()."""
+    conditions, params = [], []
+    if employee_id:
+        conditions.append("g.employee_id = %s")
+        params.append(employee_id)
+    if since:
+        # A constant bound on created_at lets PostgreSQL skip the partitions
+        # of earlier review cycles (see partitioning.py).
+        conditions.append("g.created_at >= %s")
+        params.append(since)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    return f"SELECT g.id, e.name, g.description, g.due_date, g.status FROM goals g JOIN employees e ON g.employee_id = e.id {where}ORDER BY g.due_date DESC;", tuple(params)
+
+@instrumented
+def read_goals(employee_id=None, since=None):
+    """Reads and returns goals. Can be filtered by employee_id and creation date."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(*_goals_query(employee_id, since))
+            return cur.fetchall()
+    tags = [("goals", "employee", employee_id)] if employee_id else [("goals", "all")]
+    try:
+        return query_cache.fetch(("read_goals", employee_id or None, since), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading goals: {e}")
+        return []
+
+@instrumented
+def read_goals_frame(employee_id=None):
+    """Returns read_goals() as a DataFrame with GOAL_FRAME_COLUMNS."""
+    def load():
+        return _read_frame(*_goals_query(employee_id), GOAL_FRAME_COLUMNS)
+    tags = [("goals", "employee", employee_id)] if employee_id else [("goals", "all")]
+    try:
+        return query_cache.fetch(("read_goals_frame", employee_id or None), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading goals: {e}")
+        return frame_from_chunks([], GOAL_FRAME_COLUMNS)
+
+@instrumented
+def update_goal_status(goal_id, status):
+    """Updates the status of a specific goal."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE goals SET status = %s WHERE id = %s RETURNING employee_id;",
+                (status, goal_id)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return False
+        _invalidate("goals", row[0], goal_id)
+        return True
+    except psycopg2.Error as e:
+        print(f"Error updating goal status: {e}")
+        return False
+
+@instrumented
+def update_goal_status_many(goal_ids, status):
+    """Sets the status of many goals in one statement and returns the ids that changed."""
+    goal_ids = list(goal_ids)
+    if not goal_ids:
+        return []
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE goals SET status = %s WHERE id = ANY(%s) AND status IS DISTINCT FROM %s RETURNING id, employee_id;",
+                (status, goal_ids, status)
+            )
+            changed = cur.fetchall()
+        for goal_id, employee_id in changed:
+            _invalidate("goals", employee_id, goal_id)
+        return [goal_id for goal_id, _ in changed]
+    except psycopg2.Error as e:
+        print(f"Error updating goal statuses: {e}")
+        return []
+
+@instrumented
+def delete_goal(goal_id):
+    """Deletes a goal and its associated tasks and feedback."""
+    try:
+        with db_cursor() as cur:
+            cur.execute("DELETE FROM goals WHERE id = %s RETURNING employee_id;", (goal_id,))
+            row = cur.fetchone()
+        if row is None:
+            return False
+        # Tasks and feedback of the goal are removed by ON DELETE CASCADE.
+        for table in ("goals", "tasks", "feedback"):
+            _invalidate(table, row[0], goal_id)
+        return True
+    except psycopg2.Error as e:
+        print(f"Error deleting goal: {e}")
+        return False
+
+# --- CRUD for Tasks ---
+@instrumented
+def create_task(goal_id, employee_id, description):
+    """Creates a new task for a goal."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO tasks (goal_id, employee_id, description) VALUES (%s, %s, %s);",
+                (goal_id, employee_id, description)
+            )
+        _invalidate("tasks", employee_id, goal_id)
+        return True
+    except psycopg2.Error as e:
+        print(f"Error creating task: {e}")
+        return False
+
+def _tasks_query(goal_id, employee_id, since=None):
+    """Returns the (sql, params) of read_tasks() and its cache key suffix and tags."""
+    # See _goals_query() on the created_at bound.
+    recent, recent_params = (" AND t.created_at >= %s", (since,)) if since else ("", ())
+    if goal_id:
+        return (f"SELECT t.id, t.description, t.is_approved FROM tasks t WHERE t.goal_id = %s{recent} ORDER BY t.created_at DESC;", (goal_id,) + recent_params,
+                ("goal", goal_id), [("tasks", "goal", goal_id)])
+    if employee_id:
+        return (f"SELECT t.id, g.description, t.description, t.is_approved FROM tasks t JOIN goals g ON t.goal_id = g.id WHERE t.employee_id = %s{recent} ORDER BY t.created_at DESC;", (employee_id,) + recent_params,
+                ("employee", employee_id), [("tasks", "employee", employee_id)])
+    return (f"SELECT t.id, t.description, t.is_approved FROM tasks t{recent.replace(' AND', ' WHERE')} ORDER BY t.created_at DESC;", recent_params,
+            ("all",), [("tasks", "all")])
+
+@instrumented
+def read_tasks(goal_id=None, employee_id=None, since=None):
+    """Reads and returns tasks, can be filtered by goal or employee and by creation date."""
+    sql, params, key, tags = _tasks_query(goal_id, employee_id, since)
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+    try:
+        return query_cache.fetch(("read_tasks",) + key + (since,), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading tasks: {e}")
+        return []
+
+@instrumented
+def read_tasks_frame(goal_id=None, employee_id=None):
+    """Returns read_tasks() as a DataFrame with storage.task_frame_columns()."""
+    sql, params, key, tags = _tasks_query(goal_id, employee_id)
+    columns = task_frame_columns(goal_id, employee_id)
+    def load():
+        return _read_frame(sql, params, columns)
+    try:
+        return query_cache.fetch(("read_tasks_frame",) + key, tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading tasks: {e}")
+        return frame_from_chunks([], columns)
+
+@instrumented
+def update_task_approval(task_id, is_approved):
+    """Updates the approval status of a task."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE tasks SET is_approved = %s WHERE id = %s RETURNING employee_id, goal_id;",
+                (is_approved, task_id)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return False
+        _invalidate("tasks", row[0], row[1])
+        return True
+    except psycopg2.Error as e:
+        print(f"Error updating task approval: {e}")
+        return False
+
+@instrumented
+def update_task_approval_many(task_ids, is_approved):
+    """Sets the approval flag of many tasks in one statement and returns the ids that changed."""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return []
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "UPDATE tasks SET is_approved = %s WHERE id = ANY(%s) AND is_approved IS DISTINCT FROM %s RETURNING id, employee_id, goal_id;",
+                (is_approved, task_ids, is_approved)
+            )
+            changed = cur.fetchall()
+        for _, employee_id, goal_id in changed:
+            _invalidate("tasks", employee_id, goal_id)
+        return [task_id for task_id, _, _ in changed]
+    except psycopg2.Error as e:
+        print(f"Error updating task approvals: {e}")
+        return []
+
+# --- CRUD for Feedback ---
+@instrumented
+def create_feedback(goal_id, manager_id, feedback_text):
+    """Creates new feedback for a goal."""
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "INSERT INTO feedback (goal_id, manager_id, feedback_text) VALUES (%s, %s, %s) "
+                "RETURNING (SELECT employee_id FROM goals WHERE goals.id = feedback.goal_id);",
+                (goal_id, manager_id, feedback_text)
+            )
+            employee_id = cur.fetchone()[0]
+        _invalidate("feedback", employee_id, goal_id)
+        return True
+    except psycopg2.Error as e:
+        print(f"Error creating feedback: {e}")
+        return False
+
+def is_transient_error(error):
+    """
+    Whether a statement that raised `error` may succeed if retried: lost or
+    refused connections (including an open circuit breaker), pool timeouts,
+    cancelled statements and deadlocks or serialization failures, as opposed
+    to rows the database rejects.
+    """
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.pool.PoolError))
+
+@instrumented
+def create_feedback_many(entries, raise_errors=False):
+    """
+    Inserts many (goal_id, manager_id, feedback_text) rows in one statement.
+    With raise_errors, a failure raises instead of returning False, so that
+    callers can tell transient errors from rejected rows (see
+    is_transient_error()).
+    """
+    entries = list(entries)
+    if not entries:
+        return True
+    try:
+        with db_cursor() as cur:
+            rows = psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO feedback (goal_id, manager_id, feedback_text) VALUES %s "
+                "RETURNING goal_id, (SELECT employee_id FROM goals WHERE goals.id = feedback.goal_id);",
+                entries,
+                fetch=True
+            )
+        for goal_id, employee_id in set(rows):
+            _invalidate("feedback", employee_id, goal_id)
+        return True
+    except psycopg2.Error as e:
+        if raise_errors:
+            raise
+        print(f"Error creating feedback: {e}")
+        return False
+
+@instrumented
+def read_feedback(goal_id=None):
+    """Reads feedback, filtered by goal_id."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(
+                "SELECT id, feedback_text, created_at FROM feedback WHERE goal_id = %s ORDER BY created_at DESC;",
+                (goal_id,)
+            )
+            return cur.fetchall()
+    try:
+        return query_cache.fetch(("read_feedback", goal_id), [("feedback", "goal", goal_id)], load)
+    except psycopg2.Error as e:
+        print(f"Error reading feedback: {e}")
+        return []
+
+@instrumented
+def read_feedback_for_goals(goal_ids):
+    """Reads feedback for many goals in one query, keyed by goal_id."""
+    goal_ids = list(goal_ids)
+    if not goal_ids:
+        return {}
+    def load():
+        feedback_by_goal = {goal_id: [] for goal_id in goal_ids}
+        with db_cursor(read_only=True) as cur:
+            cur.execute(
+                "SELECT goal_id, id, feedback_text, created_at FROM feedback WHERE goal_id = ANY(%s) ORDER BY goal_id, created_at DESC;",
+                (goal_ids,)
+            )
+            for goal_id, feedback_id, feedback_text, created_at in cur:
+                feedback_by_goal[goal_id].append((feedback_id, feedback_text, created_at))
+        return feedback_by_goal
+    tags = [("feedback", "goal", goal_id) for goal_id in goal_ids]
+    try:
+        return query_cache.fetch(("read_feedback_for_goals", tuple(goal_ids)), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading feedback: {e}")
+        return {goal_id: [] for goal_id in goal_ids}
+
+# --- Keyset Pagination ---
+# Paginated reads walk the same ORDER BY as their unpaginated counterparts,
+# with the row id as a tie-breaker, and resume from an opaque continuation
+# token instead of an OFFSET, so every page costs the same however deep it is.
+def _keyset_condition(sort_column, id_column, token):
+    """
+    Returns the WHERE fragment and parameters that resume a
+    `ORDER BY sort_column DESC, id_column DESC` scan after `token`.
+    PostgreSQL sorts NULLs first in descending order, so a NULL cursor value
+    means the scan is still inside the leading block of NULL rows.
+    """
+    sort_value, row_id = decode_page_token(token)
+    if sort_value is None:
+        return f"(({sort_column} IS NULL AND {id_column} < %s) OR {sort_column} IS NOT NULL)", [row_id]
+    return f"({sort_column}, {id_column}) < (%s, %s)", [sort_value, row_id]
+
+def _read_page(base_sql, where, params, sort_column, id_column, sort_index, page_size, page_token):
+    """Runs one keyset page of `base_sql` and returns (rows, next_page_token)."""
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    where, params = list(where), list(params)
+    if page_token:
+        condition, condition_params = _keyset_condition(sort_column, id_column, page_token)
+        where.append(condition)
+        params.extend(condition_params)
+    sql = base_sql
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_column} DESC, {id_column} DESC LIMIT %s;"
+    # One extra row tells us whether another page exists.
+    params.append(page_size + 1)
+    with db_cursor(read_only=True) as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    next_token = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_token = encode_page_token(last[sort_index], last[0])
+    return rows, next_token
+
+@instrumented
+def read_goals_page(employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+    """
+    Reads one page of goals in read_goals() order.
+    Returns (rows, next_page_token); next_page_token is None on the last page.
+    """
+    def load():
+        # due_date is the fourth column of each row
+        return _read_page(
+            "SELECT g.id, e.name, g.description, g.due_date, g.status FROM goals g JOIN employees e ON g.employee_id = e.id",
+            ["g.employee_id = %s"] if employee_id else [],
+            [employee_id] if employee_id else [],
+            "g.due_date", "g.id", 3, page_size, page_token
+        )
+    tags = [("goals", "employee", employee_id)] if employee_id else [("goals", "all")]
+    try:
+        return query_cache.fetch(("read_goals_page", employee_id or None, page_size, page_token), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading goals: {e}")
+        return [], None
+
+@instrumented
+def read_tasks_page(goal_id=None, employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+    """
+    Reads one page of tasks in read_tasks() order, with the same columns.
+    Returns (rows, next_page_token); next_page_token is None on the last page.
+    """
+    def load():
+        # created_at is fetched as a trailing column for the page token and stripped below
+        if goal_id:
+            rows, token = _read_page(
+                "SELECT t.id, t.description, t.is_approved, t.created_at FROM tasks t",
+                ["t.goal_id = %s"], [goal_id], "t.created_at", "t.id", 3, page_size, page_token
+            )
+        elif employee_id:
+            rows, token = _read_page(
+                "SELECT t.id, g.description, t.description, t.is_approved, t.created_at FROM tasks t JOIN goals g ON t.goal_id = g.id",
+                ["t.employee_id = %s"], [employee_id], "t.created_at", "t.id", 4, page_size, page_token
+            )
+        else:
+            rows, token = _read_page(
+                "SELECT t.id, t.description, t.is_approved, t.created_at FROM tasks t",
+                [], [], "t.created_at", "t.id", 3, page_size, page_token
+            )
+        return [row[:-1] for row in rows], token
+    if goal_id:
+        key, tags = ("goal", goal_id), [("tasks", "goal", goal_id)]
+    elif employee_id:
+        key, tags = ("employee", employee_id), [("tasks", "employee", employee_id)]
+    else:
+        key, tags = ("all",), [("tasks", "all")]
+    try:
+        return query_cache.fetch(("read_tasks_page",) + key + (page_size, page_token), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error reading tasks: {e}")
+        return [], None
+
+@instrumented
+def read_feedback_page(goal_id, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+    """
+    Reads one page of feedback for a goal in read_feedback() order.
+    Returns (rows, next_page_token); next_page_token is None on the last page.
+    """
+    def load():
+        return _read_page(
+            "SELECT f.id, f.feedback_text, f.created_at FROM feedback f",
+            ["f.goal_id = %s"], [goal_id], "f.created_at", "f.id", 2, page_size, page_token
+        )
+    try:
+        return query_cache.fetch(("read_feedback_page", goal_id, page_size, page_token), [("feedback", "goal", goal_id)], load)
+    except psycopg2.Error as e:
+        print(f"Error reading feedback: {e}")
+        return [], None
+
+# --- Reporting and Business Insights ---
+@instrumented
+def get_performance_history(employee_id, since=None):
+    """Retrieves the goals and associated feedback of an employee, optionally only those created since a date."""
+    # See _goals_query() on the created_at bounds.
+    recent, recent_params = (" AND created_at >= %s", (since,)) if since else ("", ())
+    def load():
+        with db_cursor(read_only=True) as cur:
+            # The goals, then the feedback on all of them in one query. A
+            # join would probe the feedback index once per goal, and once per
+            # partition when the tables are partitioned (see partitioning.py).
+            cur.execute(
+                f"SELECT id, description, due_date, status, created_at FROM goals "
+                f"WHERE employee_id = %s{recent} ORDER BY created_at DESC, id;",
+                (employee_id,) + recent_params
+            )
+            history = [
+                {
+                    'goal_id': goal_id,
+                    'description': description,
+                    'due_date': due_date,
+                    'status': status,
+                    'created_at': created_at,
+                    'feedbacks': []
+                }
+                for goal_id, description, due_date, status, created_at in cur.fetchall()
+            ]
+            if history:
+                feedbacks = {entry['goal_id']: entry['feedbacks'] for entry in history}
+                cur.execute(
+                    f"SELECT goal_id, feedback_text, created_at FROM feedback "
+                    f"WHERE goal_id = ANY(%s){recent} ORDER BY created_at DESC;",
+                    (list(feedbacks),) + recent_params
+                )
+                for goal_id, feedback_text, created_at in cur:
+                    feedbacks[goal_id].append((feedback_text, created_at))
+            return history
+    tags = [("goals", "employee", employee_id), ("feedback", "employee", employee_id)]
+    try:
+        return query_cache.fetch(("get_performance_history", employee_id, since), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error fetching performance history: {e}")
+        return []
+
+@instrumented
+def get_goal_status_counts(employee_id=None):
+    """Returns a count of goals by status."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            if employee_id:
+                cur.execute("SELECT status, COUNT(*) FROM goals WHERE employee_id = %s GROUP BY status;", (employee_id,))
+            else:
+                cur.execute("SELECT status, COUNT(*) FROM goals GROUP BY status;")
+            return dict(cur.fetchall())
+    tags = [("goals", "employee", employee_id)] if employee_id else [("goals", "all")]
+    try:
+        return query_cache.fetch(("get_goal_status_counts", employee_id or None), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error fetching status counts: {e}")
+        return {}
+
+@instrumented
+def get_avg_days_to_complete_goal(employee_id=None):
+    """Returns the average number of days to complete a goal."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            if employee_id:
+                cur.execute("SELECT AVG(EXTRACT(EPOCH FROM (due_date - created_at))) / 86400 FROM goals WHERE employee_id = %s AND status = 'Completed';", (employee_id,))
+            else:
+                cur.execute("SELECT AVG(EXTRACT(EPOCH FROM (due_date - created_at))) / 86400 FROM goals WHERE status = 'Completed';")
+            return cur.fetchone()[0]
+    tags = [("goals", "employee", employee_id)] if employee_id else [("goals", "all")]
+    try:
+        return query_cache.fetch(("get_avg_days_to_complete_goal", employee_id or None), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error fetching average completion time: {e}")
+        return None
+
+@instrumented
+def get_max_min_due_date():
+    """Returns the earliest and latest goal due dates."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute("SELECT MIN(due_date), MAX(due_date) FROM goals;")
+            return cur.fetchone()
+    try:
+        min_date, max_date = query_cache.fetch(("get_max_min_due_date",), [("goals", "all")], load)
+        return min_date, max_date
+    except psycopg2.Error as e:
+        print(f"Error fetching min/max dates: {e}")
+        return None, None
+
+@instrumented
+def get_total_tasks_approved():
+    """Returns the total number of approved tasks."""
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute("SELECT COUNT(*) FROM tasks WHERE is_approved = TRUE;")
+            return cur.fetchone()[0]
+    try:
+        return query_cache.fetch(("get_total_tasks_approved",), [("tasks", "all")], load)
+    except psycopg2.Error as e:
+        print(f"Error fetching total approved tasks: {e}")
+        return 0
+
+
+# goal_summary keeps the organisation-wide totals under this employee_id.
+ORGANISATION_SUMMARY_ID = 0
+
+@instrumented
+def get_dashboard_summary(employee_id=None):
+    """
+    Returns every Business Insights metric for an employee (or, without one,
+    for the whole organisation) as a DashboardSummary, read in one query from
+    the trigger-maintained summary tables.
+    """
+    scope_id = employee_id or ORGANISATION_SUMMARY_ID
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(
+                """
+                SELECT s.completion_seconds_sum, s.completion_count, s.approved_tasks,
+                       s.min_due_date, s.max_due_date,
+                       (SELECT COALESCE(json_object_agg(status, goal_count), '{}'::json)
+                        FROM goal_status_summary
+                        WHERE employee_id = k.employee_id AND goal_count > 0)
+                FROM (SELECT %s::INTEGER AS employee_id) k
+                LEFT JOIN goal_summary s ON s.employee_id = k.employee_id;
+                """,
+                (scope_id,)
+            )
+            seconds_sum, completion_count, approved_tasks, min_due_date, max_due_date, status_counts = cur.fetchone()
+        return DashboardSummary(
+            employee_id=employee_id or None,
+            status_counts=status_counts,
+            total_goals=sum(status_counts.values()),
+            avg_days_to_complete=float(seconds_sum) / completion_count / 86400 if completion_count else None,
+            approved_tasks=approved_tasks or 0,
+            min_due_date=min_due_date,
+            max_due_date=max_due_date,
+        )
+    if employee_id:
+        tags = [("goals", "employee", employee_id), ("tasks", "employee", employee_id)]
+    else:
+        tags = [("goals", "all"), ("tasks", "all")]
+    try:
+        return query_cache.fetch(("get_dashboard_summary", employee_id or None), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error fetching dashboard summary: {e}")
+        return DashboardSummary(employee_id=employee_id or None)
+
+@instrumented
+def get_goal_trends(employee_id=None, period="week", since=None):
+    """
+    Returns (bucket, created, completed, cancelled) goal counts per week or
+    month, oldest first, read from the trigger-maintained goal_trend_rollup
+    table: a year of history is at most 53 rows, however many goals exist.
+    """
+    if period not in TREND_PERIODS:
+        raise ValueError(f"Unknown trend period: {period!r}")
+    scope_id = employee_id or ORGANISATION_SUMMARY_ID
+    def load():
+        with db_cursor(read_only=True) as cur:
+            cur.execute(
+                """
+                SELECT bucket, created_count, completed_count, cancelled_count
+                FROM goal_trend_rollup
+                WHERE employee_id = %s AND period = %s
+                  AND (%s::DATE IS NULL OR bucket >= date_trunc(%s, %s::DATE))
+                  AND (created_count <> 0 OR completed_count <> 0 OR cancelled_count <> 0)
+                ORDER BY bucket;
+                """,
+                (scope_id, period, since, period, since)
+            )
+            return cur.fetchall()
+    tags = [("goals", "employee", employee_id)] if employee_id else [("goals", "all")]
+    try:
+        return query_cache.fetch(("get_goal_trends", employee_id or None, period, since), tags, load)
+    except psycopg2.Error as e:
+        print(f"Error fetching goal trends: {e}")
+        return []
+
+# --- Full-Text Search ---
+# Each searchable table carries a generated, GIN-indexed search_vector
+# (migrations 10 and 11). Per kind: table, goal id, owning employee (None for
+# the goal's owner), created_at, text and document columns.
+_SEARCH_SOURCES = {
+    "goals": ("goals g", "g.id", "g.employee_id", "g.created_at", "g.description", "g.search_vector"),
+    "tasks": ("tasks t", "t.goal_id", "t.employee_id", "t.created_at", "t.description", "t.search_vector"),
+    "feedback": ("feedback f", "f.goal_id", None, "f.created_at", "f.feedback_text", "f.search_vector"),
+}
+_SEARCH_HEADLINE_OPTIONS = f"StartSel={SEARCH_HIGHLIGHT}, StopSel={SEARCH_HIGHLIGHT}, MaxWords=25, MinWords=10"
+
+@instrumented
+def search_records(query, kinds=SEARCH_KINDS, employee_id=None, status=None, date_from=None, date_to=None,
+                   page_size=DEFAULT_PAGE_SIZE, page_token=None):
+    """
+    Full-text search over goals, tasks and feedback, with web-search syntax
+    ("quoted phrases", OR, -excluded). Returns (rows, next_page_token) of
+    (kind, id, goal_id, employee name, goal status, created_at, snippet),
+    ordered by ts_rank; snippets mark matched words with SEARCH_HIGHLIGHT.
+    """
+    kinds = tuple(kinds)
+    unknown = set(kinds) - set(SEARCH_KINDS)
+    if unknown:
+        raise ValueError(f"Unknown search kinds: {sorted(unknown)!r}")
+    text = (query or "").strip()
+    if not text or not kinds:
+        return [], None
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    params = {
+        'query': text, 'employee_id': employee_id, 'status': status, 'date_from': date_from, 'date_to': date_to,
+        'options': _SEARCH_HEADLINE_OPTIONS, 'limit': page_size + 1,
+    }
+    tsquery = "websearch_to_tsquery('english', %(query)s)"
+    branches = []
+    for kind in kinds:
+        source, goal_column, employee_column, created_column, text_column, vector_column = _SEARCH_SOURCES[kind]
+        where = [f"{vector_column} @@ {tsquery}"]
+        # Goal filters are a semi-join, so matches are ranked straight from
+        # the table; goals are only joined for the returned page.
+        goal_filters = []
+        if employee_id:
+            if employee_column:
+                where.append(f"{employee_column} = %(employee_id)s")
+            else:
+                goal_filters.append("employee_id = %(employee_id)s")
+        if status:
+            goal_filters.append("status = %(status)s")
+        if goal_filters:
+            where.append(f"{goal_column} IN (SELECT id FROM goals WHERE {' AND '.join(goal_filters)})")
+        if date_from is not None:
+            where.append(f"{created_column} >= %(date_from)s")
+        if date_to is not None:
+            where.append(f"{created_column} < %(date_to)s::date + 1")
+        alias = source.split()[1]
+        branches.append(
+            f"SELECT '{kind}' AS kind, {alias}.id, {goal_column} AS goal_id, {employee_column or 'NULL::INT'} AS employee_id, "
+            f"{created_column} AS created_at, {text_column} AS body, ts_rank({vector_column}, {tsquery}) AS rank "
+            f"FROM {source} WHERE {' AND '.join(where)}"
+        )
+    resume = ""
+    if page_token:
+        rank, (kind, row_id) = decode_page_token(page_token)
+        resume = "WHERE (rank, kind, id) < (%(rank)s::real, %(kind)s, %(row_id)s)"
+        params.update(rank=rank, kind=kind, row_id=row_id)
+    def load():
+        with db_cursor(read_only=True) as cur:
+            # ts_headline, the costly part, only runs on the returned page.
+            cur.execute(
+                f"""
+                SELECT m.kind, m.id, m.goal_id, e.name, g.status, m.created_at,
+                       ts_headline('english', m.body, {tsquery}, %(options)s), m.rank
+                FROM (
+                    SELECT * FROM ({" UNION ALL ".join(branches)}) matches
+                    {resume}
+                    ORDER BY rank DESC, kind DESC, id DESC
+                    LIMIT %(limit)s
+                ) m
+                JOIN goals g ON g.id = m.goal_id
+                LEFT JOIN employees e ON e.id = COALESCE(m.employee_id, g.employee_id)
+                ORDER BY m.rank DESC, m.kind DESC, m.id DESC;
+                """,
+                params
+            )
+            rows = cur.fetchall()
+        next_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_token = encode_page_token(last[7], [last[0], last[1]])
+        return [row[:-1] for row in rows], next_token
+    scope = ("employee", employee_id) if employee_id else ("all",)
+    # Every result shows its goal's status, so goal changes evict it too.
+    tags = [(table,) + scope for table in set(kinds) | {"goals"}]
+    key = ("search_records", text, kinds, employee_id or None, status, date_from, date_to, page_size, page_token)
+    try:
+        return query_cache.fetch(key, tags, load)
+    except psycopg2.Error as e:
+        print(f"Error searching records: {e}")
+        return [], None
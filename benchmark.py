@@ -0,0 +1,404 @@
+"""
+Benchmark harness for the backend functions.
+
+Loads a seeded synthetic data set into a scratch database at one or more
+scales, times every backend read (and a few writes) against it and writes
+p50/p95/p99 latency, rows/sec and Python allocation figures as JSON. The
+full scale is 10k employees, 1M goals, 5M tasks and 2M feedback rows;
+--scale picks fractions of it. Usage:
+
+    python benchmark.py --database pms_bench --scale 0.01,0.1 --output bench.json
+    python benchmark.py --database pms_bench --scale 0.01 --compare bench.json
+    python benchmark.py --storage sqlite::memory: --scale 0.01
+
+Loading TRUNCATEs every PMS table in the target database, so it refuses to
+run against the application database (backend.DB_NAME). --storage runs the
+same workloads against another engine (see storage.py) in-process.
+"""
+import argparse
+import csv
+import io
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import time
+import tracemalloc
+from array import array
+from datetime import date, datetime, timedelta
+
+import psycopg2
+
+import backend
+import migrations
+import storage
+
+FULL_SCALE = {
+    'employees': 10_000,
+    'goals': 1_000_000,
+    'tasks': 5_000_000,
+    'feedback': 2_000_000,
+}
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn",
+               "Priya", "Wei", "Olu", "Mateo", "Aisha", "Noah", "Lena", "Kenji", "Sofia", "Omar"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Okafor", "Patel", "Kim", "Novak", "Silva", "Haddad", "Larsen",
+              "Nguyen", "Rossi", "Muller", "Sato", "Ivanova", "Dubois", "Khan", "Cohen", "Mensah", "Lopez"]
+WORDS = ["improve", "deliver", "customer", "quality", "roadmap", "latency", "onboarding", "revenue",
+         "migration", "training", "review", "mentoring", "release", "security", "costs", "support"]
+STATUSES = [('Draft', 3), ('In Progress', 4), ('Completed', 2), ('Cancelled', 1)]
+
+# Data is generated relative to a fixed date so that runs are reproducible.
+BASE_DATE = date(2026, 1, 1)
+# Trend workloads chart the year of generated history before BASE_DATE.
+TREND_SINCE = BASE_DATE - timedelta(days=365)
+# The `since` workloads read the last review cycle of the generated data.
+RECENT_SINCE = storage.review_cycle_start(BASE_DATE, cycles_back=1)
+
+COPY_CHUNK_SIZE = 1 << 16
+
+# Fan-out of the generated reporting tree: 10k employees are 5 levels deep.
+REPORTS_PER_MANAGER = 8
+
+# Regressions beyond this ratio of the baseline p95 are reported by --compare.
+REGRESSION_THRESHOLD = 1.2
+
+class _CsvStream(io.RawIOBase):
+    """A file object that renders generated rows as CSV for COPY, chunk by chunk."""
+
+    def __init__(self, rows):
+        self._chunks = self._render(rows)
+        self._buffer = b""
+
+    def _render(self, rows):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow(row)
+            if out.tell() >= COPY_CHUNK_SIZE:
+                yield out.getvalue().encode()
+                out.seek(0)
+                out.truncate()
+        if out.tell():
+            yield out.getvalue().encode()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+def _timestamp(rng, days_back):
+    return datetime.combine(BASE_DATE, datetime.min.time()) - timedelta(seconds=rng.randrange(days_back * 86400))
+
+def _manager_of(employee_id):
+    """Employees form a complete tree with REPORTS_PER_MANAGER reports per manager under employee 1."""
+    return (employee_id - 2) // REPORTS_PER_MANAGER + 1 if employee_id > 1 else None
+
+def scaled_sizes(scale):
+    return {table: max(1, int(count * scale)) for table, count in FULL_SCALE.items()}
+
+def load_dataset(sizes, seed=42, store=None):
+    """
+    Replaces the contents of every PMS table with generated rows and returns
+    the load time per table. Ids are dense (1..n) because identities restart.
+    `store` selects a non-PostgreSQL engine to load instead.
+    """
+    rng = random.Random(seed)
+    n_employees, n_goals = sizes['employees'], sizes['goals']
+    timings = {}
+    # Tasks must belong to their goal's employee, so remember each goal's owner.
+    goal_owner = array('i', (rng.randint(1, n_employees) for _ in range(n_goals)))
+    statuses, weights = zip(*STATUSES)
+
+    generators = {
+        'employees': lambda: (
+            (f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}", _manager_of(i))
+            for i in range(1, n_employees + 1)
+        ),
+        'goals': lambda: (
+            (goal_owner[i], _sentence(rng, 6),
+             BASE_DATE + timedelta(days=rng.randint(-365, 365)) if rng.random() > 0.05 else None,
+             rng.choices(statuses, weights)[0], _timestamp(rng, 730))
+            for i in range(n_goals)
+        ),
+        'tasks': lambda: (
+            (goal_id, goal_owner[goal_id - 1], _sentence(rng, 8), rng.random() < 0.4, _timestamp(rng, 730))
+            for goal_id in (rng.randint(1, n_goals) for _ in range(sizes['tasks']))
+        ),
+        'feedback': lambda: (
+            (rng.randint(1, n_goals), rng.randint(1, n_employees), _sentence(rng, 12), _timestamp(rng, 730))
+            for _ in range(sizes['feedback'])
+        ),
+    }
+    columns = {
+        'employees': "name, manager_id",
+        'goals': "employee_id, description, due_date, status, created_at",
+        'tasks': "goal_id, employee_id, description, is_approved, created_at",
+        'feedback': "goal_id, manager_id, feedback_text, created_at",
+    }
+    if store is not None and store.engine == "sqlite":
+        store.truncate()
+        for table in ('employees', 'goals', 'tasks', 'feedback'):
+            started = time.perf_counter()
+            store.copy_rows(table, columns[table].split(", "), generators[table]())
+            timings[table] = time.perf_counter() - started
+        return timings
+    with backend.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE employees, goals, tasks, feedback RESTART IDENTITY CASCADE;")
+            cur.execute("TRUNCATE goal_summary, goal_status_summary, goal_trend_rollup;")
+    for table in ('employees', 'goals', 'tasks', 'feedback'):
+        started = time.perf_counter()
+        with backend.db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.copy_expert(
+                    f"COPY {table} ({columns[table]}) FROM STDIN WITH (FORMAT csv);",
+                    _CsvStream(generators[table]()), size=COPY_CHUNK_SIZE
+                )
+        timings[table] = time.perf_counter() - started
+    conn = backend._connect()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE;")
+    finally:
+        conn.close()
+    backend.clear_cache()
+    return timings
+
+def _workloads(sizes, store):
+    """
+    Returns (name, iterations, call) triples; call(rng) runs the function of
+    `store` once with randomly chosen arguments and returns its result.
+    """
+    employee = lambda rng: rng.randint(1, sizes['employees'])
+    goal = lambda rng: rng.randint(1, sizes['goals'])
+    task = lambda rng: rng.randint(1, sizes['tasks'])
+    # Managers are the inner nodes of the reporting tree; the rest have no reports.
+    n_managers = max(1, _manager_of(sizes['employees']))
+    manager = lambda rng: rng.randint(1, n_managers)
+    report = lambda rng: rng.randint(min(n_managers + 1, sizes['employees']), sizes['employees'])
+    # Unfiltered reads return whole tables; run them less often on big data.
+    full_scan_iterations = 20 if sizes['goals'] <= 100_000 else 3
+    return [
+        ("get_all_employees", 20, lambda rng: store.get_all_employees()),
+        ("search_employees(prefix)", 100, lambda rng: store.search_employees(rng.choice(FIRST_NAMES)[:3])),
+        ("search_employees(substring)", 100, lambda rng: store.search_employees(rng.choice(LAST_NAMES)[1:4])),
+        # The generated text has a small vocabulary: every word matches a large
+        # share of all rows, the worst case for ranking.
+        ("search_records(word)", full_scan_iterations, lambda rng: store.search_records(rng.choice(WORDS))[0]),
+        ("search_records(3 words)", 20, lambda rng: store.search_records(" ".join(rng.sample(WORDS, 3)))[0]),
+        ("search_records(employee_id)", 100,
+         lambda rng: store.search_records(" ".join(rng.sample(WORDS, 2)), employee_id=employee(rng))[0]),
+        ("read_goals(employee_id)", 100, lambda rng: store.read_goals(employee(rng))),
+        ("read_goals(employee_id, since)", 100, lambda rng: store.read_goals(employee(rng), since=RECENT_SINCE)),
+        ("read_goals()", full_scan_iterations, lambda rng: store.read_goals()),
+        ("read_goals_frame()", full_scan_iterations, lambda rng: store.read_goals_frame()),
+        ("read_goals_page(employee_id)", 100, lambda rng: store.read_goals_page(employee(rng))[0]),
+        ("read_goals_page()", 100, lambda rng: store.read_goals_page()[0]),
+        ("read_tasks(goal_id)", 100, lambda rng: store.read_tasks(goal_id=goal(rng))),
+        ("read_tasks(employee_id)", 100, lambda rng: store.read_tasks(employee_id=employee(rng))),
+        ("read_tasks(employee_id, since)", 100, lambda rng: store.read_tasks(employee_id=employee(rng), since=RECENT_SINCE)),
+        ("read_tasks()", full_scan_iterations, lambda rng: store.read_tasks()),
+        ("read_tasks_frame()", full_scan_iterations, lambda rng: store.read_tasks_frame()),
+        ("read_tasks_page(employee_id)", 100, lambda rng: store.read_tasks_page(employee_id=employee(rng))[0]),
+        ("read_feedback(goal_id)", 100, lambda rng: store.read_feedback(goal(rng))),
+        ("read_feedback_for_goals(50)", 100,
+         lambda rng: [f for fs in store.read_feedback_for_goals(rng.sample(range(1, sizes['goals'] + 1), min(50, sizes['goals']))).values() for f in fs]),
+        ("get_team(manager)", 100, lambda rng: store.get_team(manager(rng))),
+        ("read_team_goals(manager)", 100, lambda rng: store.read_team_goals(manager(rng))),
+        ("read_team_goals(root)", full_scan_iterations, lambda rng: store.read_team_goals(1)),
+        ("read_team_goals_frame(root)", full_scan_iterations, lambda rng: store.read_team_goals_frame(1)),
+        ("read_team_tasks(manager)", 100, lambda rng: store.read_team_tasks(manager(rng))),
+        ("get_team_goal_status_counts(manager)", 100, lambda rng: store.get_team_goal_status_counts(manager(rng))),
+        ("get_team_goal_status_counts(root)", 20, lambda rng: store.get_team_goal_status_counts(1)),
+        ("get_performance_history", 100, lambda rng: store.get_performance_history(employee(rng))),
+        ("get_performance_history(since)", 100, lambda rng: store.get_performance_history(employee(rng), RECENT_SINCE)),
+        ("get_goal_status_counts(employee_id)", 100, lambda rng: store.get_goal_status_counts(employee(rng))),
+        ("get_goal_status_counts()", 20, lambda rng: store.get_goal_status_counts()),
+        ("get_avg_days_to_complete_goal()", 20, lambda rng: [store.get_avg_days_to_complete_goal()]),
+        ("get_max_min_due_date", 20, lambda rng: list(store.get_max_min_due_date())),
+        ("get_total_tasks_approved", 20, lambda rng: [store.get_total_tasks_approved()]),
+        ("get_dashboard_summary(employee_id)", 100, lambda rng: [store.get_dashboard_summary(employee(rng))]),
+        ("get_dashboard_summary()", 100, lambda rng: [store.get_dashboard_summary()]),
+        ("get_goal_trends(employee_id)", 100, lambda rng: store.get_goal_trends(employee(rng), "week", TREND_SINCE)),
+        ("get_goal_trends()", 100, lambda rng: store.get_goal_trends(None, rng.choice(storage.TREND_PERIODS), TREND_SINCE)),
+        # What a new session pays before its page renders: the DDL it used to
+        # run, and the once-per-process check that replaced it.
+        ("create_tables", 20, lambda rng: [store.create_tables()]),
+        ("ensure_schema", 100, lambda rng: [store.ensure_schema()]),
+        ("set_manager", 100, lambda rng: [store.set_manager(report(rng), manager(rng))]),
+        ("create_goal", 100, lambda rng: [store.create_goal(employee(rng), "Benchmark goal", BASE_DATE)]),
+        ("update_goal_status", 100, lambda rng: [store.update_goal_status(goal(rng), "In Progress")]),
+        ("update_task_approval", 100, lambda rng: [store.update_task_approval(task(rng), True)]),
+        ("create_feedback", 100, lambda rng: [store.create_feedback(goal(rng), employee(rng), "Benchmark feedback")]),
+    ]
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def _row_count(result):
+    return len(result) if hasattr(result, '__len__') else 1
+
+def run_workload(name, iterations, call, seed, warm_cache=False, alloc_iterations=5):
+    """Times one workload and returns its result record."""
+    rng = random.Random(f"{seed}:{name}")
+    latencies, rows = [], 0
+    for _ in range(iterations):
+        if not warm_cache:
+            backend.clear_cache()
+        started = time.perf_counter()
+        result = call(rng)
+        latencies.append(time.perf_counter() - started)
+        rows += _row_count(result)
+
+    # Allocations are measured in a separate pass so tracing does not skew latency.
+    peaks, allocated = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(min(alloc_iterations, iterations)):
+            if not warm_cache:
+                backend.clear_cache()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = call(rng)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            allocated.append(current - before)
+            del result
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'function': name,
+        'iterations': iterations,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'rows_per_call': rows / iterations,
+        'rows_per_sec': rows / total if total else None,
+        'alloc_peak_bytes': max(peaks) if peaks else None,
+        'alloc_retained_bytes': statistics.fmean(allocated) if allocated else None,
+    }
+
+def run(scales, seed=42, warm_cache=False, only=None, load=True, store=None):
+    """Runs every workload at each scale and returns the JSON-ready report."""
+    store = store or storage.PostgresStorage()
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'seed': seed,
+            'warm_cache': warm_cache,
+            'python': platform.python_version(),
+            'storage': store.engine,
+        },
+        'runs': [],
+    }
+    if store.engine == "postgres":
+        report['meta']['database'] = backend.DB_NAME
+        with backend.db_cursor() as cur:
+            cur.execute("SHOW server_version;")
+            report['meta']['postgres'] = cur.fetchone()[0]
+    elif store.engine == "sqlite":
+        report['meta']['sqlite'] = sqlite3.sqlite_version
+    for scale in scales:
+        sizes = scaled_sizes(scale)
+        print(f"Scale {scale}: {sizes}")
+        load_seconds = load_dataset(sizes, seed, store) if load else {}
+        results = []
+        for name, iterations, call in _workloads(sizes, store):
+            if only and not any(pattern in name for pattern in only):
+                continue
+            result = run_workload(name, iterations, call, seed, warm_cache)
+            results.append(result)
+            print(f"  {name:<40} p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                  f"p99 {result['p99_ms']:9.2f} ms")
+        report['runs'].append({'scale': scale, 'sizes': sizes, 'load_seconds': load_seconds, 'results': results})
+    return report
+
+def compare(report, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns (scale, function, baseline_p95, p95) for every p95 regression beyond `threshold`."""
+    previous = {
+        (run['scale'], result['function']): result
+        for run in baseline['runs'] for result in run['results']
+    }
+    regressions = []
+    for run in report['runs']:
+        for result in run['results']:
+            before = previous.get((run['scale'], result['function']))
+            if before and before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * threshold:
+                regressions.append((run['scale'], result['function'], before['p95_ms'], result['p95_ms']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PMS backend functions.")
+    parser.add_argument("--database", default=None,
+                        help="scratch database to load and benchmark (its tables are truncated)")
+    parser.add_argument("--storage", default="postgres",
+                        help="storage engine, e.g. sqlite::memory: or sqlite:bench.db (default: postgres)")
+    parser.add_argument("--scale", default="0.01,0.1",
+                        help="comma-separated fractions of the full data set (default: 0.01,0.1)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="keep the query cache between iterations instead of measuring the database path")
+    parser.add_argument("--only", action="append", help="only run functions whose name contains this (repeatable)")
+    parser.add_argument("--no-load", action="store_true", help="benchmark the data already loaded")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--compare", default=None, help="baseline JSON report to check for p95 regressions")
+    args = parser.parse_args(argv)
+
+    if args.storage == "postgres":
+        if not args.database:
+            parser.error("the postgres engine requires --database")
+        if args.database == backend.DB_NAME:
+            parser.error(f"refusing to truncate the application database {args.database!r}")
+        backend.DB_NAME = args.database
+    scales = [float(scale) for scale in args.scale.split(",")]
+
+    try:
+        store = storage.open_storage(args.storage)
+        if store.engine == "postgres":
+            migrations.upgrade()
+        else:
+            store.create_tables()
+        report = run(scales, seed=args.seed, warm_cache=args.warm_cache, only=args.only,
+                     load=not args.no_load, store=store)
+    except (psycopg2.Error, sqlite3.Error) as e:
+        print(f"Error running benchmark: {e}")
+        return 1
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            regressions = compare(report, json.load(baseline_file))
+        for scale, name, before, after in regressions:
+            print(f"REGRESSION scale {scale} {name}: p95 {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            return 2
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,333 @@
+"""
+Bulk ingestion of employees, goals and tasks.
+
+Input rows are streamed from CSV or JSONL through PostgreSQL COPY into a
+temporary staging table, validated there with set-based statements
+(employee names resolved to ids, goal references checked, dates and
+statuses parsed) and merged into the real tables in a single transaction.
+Rows that fail validation are reported by row number instead of aborting
+the load. Usage:
+
+    python bulk_import.py goals goals.csv --errors goal_errors.csv
+    python bulk_import.py tasks tasks.jsonl --strict
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import psycopg2
+
+import backend
+from instrumentation import instrumented
+
+# Columns accepted for each kind of import. An employee can be referenced
+# either by `employee_id` or by `employee` (exact, unambiguous name); an
+# imported employee's `manager_id` must already exist.
+IMPORT_COLUMNS = {
+    "employees": ["name", "manager_id"],
+    "goals": ["employee_id", "employee", "description", "due_date", "status"],
+    "tasks": ["goal_id", "employee_id", "employee", "description", "is_approved"],
+}
+
+GOAL_STATUSES = ('Draft', 'In Progress', 'Completed', 'Cancelled')
+
+# Errors kept in the returned report; the rest are only counted (and still
+# passed to `on_error` when one is given).
+MAX_REPORTED_ERRORS = 1000
+
+COPY_CHUNK_SIZE = 1 << 16
+
+class BulkImportError(Exception):
+    """Raised for unusable input (unknown kind or format) before anything is loaded."""
+
+def _detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson") else "csv"
+
+def _iter_records(stream, fmt):
+    """Yields input records as dicts, one at a time."""
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise BulkImportError(f"line {line_no}: invalid JSON: {e}") from e
+            if not isinstance(record, dict):
+                raise BulkImportError(f"line {line_no}: expected a JSON object")
+            yield record
+    else:
+        raise BulkImportError(f"Unsupported input format: {fmt!r}")
+
+def _cell(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    value = str(value).strip()
+    return value or None
+
+class _CopyStream(io.RawIOBase):
+    """A read-only file object that renders records as staging-table CSV on demand."""
+
+    def __init__(self, records, columns):
+        self._rows = self._render(records, columns)
+        self._buffer = b""
+        self.rows = 0
+
+    def _render(self, records, columns):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row_no, record in enumerate(records, start=1):
+            # Missing and blank cells are written unquoted so COPY reads NULL.
+            writer.writerow([row_no] + [_cell(record.get(column)) for column in columns])
+            self.rows = row_no
+            if out.tell() >= COPY_CHUNK_SIZE:
+                yield out.getvalue().encode()
+                out.seek(0)
+                out.truncate()
+        if out.tell():
+            yield out.getvalue().encode()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._rows, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+_TRY_DATE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION pg_temp.pms_try_date(value TEXT) RETURNS DATE AS $$
+    BEGIN
+        RETURN value::DATE;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+# Sets resolved_employee_id from employee_id or an unambiguous name, and
+# records a reason on rows where neither works.
+_RESOLVE_EMPLOYEE = [
+    """
+    UPDATE import_staging s SET resolved_employee_id = e.id
+    FROM employees e
+    WHERE s.error IS NULL AND s.employee_id IS NOT NULL
+      AND e.id = CASE WHEN s.employee_id ~ '^[0-9]{1,9}$' THEN s.employee_id::INTEGER END;
+    """,
+    """
+    UPDATE import_staging s SET resolved_employee_id = n.id
+    FROM (SELECT name, MIN(id) AS id FROM employees GROUP BY name HAVING COUNT(*) = 1) n
+    WHERE s.error IS NULL AND s.employee_id IS NULL AND s.employee IS NOT NULL
+      AND n.name = s.employee;
+    """,
+]
+
+_UNRESOLVED_EMPLOYEE_ERROR = """
+    UPDATE import_staging s SET error = CASE
+        WHEN s.employee_id IS NOT NULL THEN 'unknown employee_id ' || s.employee_id
+        WHEN s.employee IS NULL THEN 'employee or employee_id is required'
+        WHEN EXISTS (SELECT 1 FROM employees e WHERE e.name = s.employee)
+            THEN 'employee name ' || quote_literal(s.employee) || ' matches several employees; use employee_id'
+        ELSE 'unknown employee ' || quote_literal(s.employee)
+    END
+    WHERE s.error IS NULL AND s.resolved_employee_id IS NULL;
+"""
+
+_VALIDATE = {
+    "employees": [
+        "UPDATE import_staging SET error = 'name is required' WHERE name IS NULL;",
+        "UPDATE import_staging SET error = 'name is longer than 255 characters' WHERE error IS NULL AND length(name) > 255;",
+        """
+        UPDATE import_staging s SET resolved_manager_id = e.id
+        FROM employees e
+        WHERE s.error IS NULL AND s.manager_id IS NOT NULL
+          AND e.id = CASE WHEN s.manager_id ~ '^[0-9]{1,9}$' THEN s.manager_id::INTEGER END;
+        """,
+        """
+        UPDATE import_staging SET error = 'unknown manager_id ' || manager_id
+        WHERE error IS NULL AND manager_id IS NOT NULL AND resolved_manager_id IS NULL;
+        """,
+    ],
+    "goals": [
+        "UPDATE import_staging SET error = 'description is required' WHERE description IS NULL;",
+        *_RESOLVE_EMPLOYEE,
+        _UNRESOLVED_EMPLOYEE_ERROR,
+        """
+        UPDATE import_staging SET parsed_due_date = pg_temp.pms_try_date(due_date)
+        WHERE error IS NULL AND due_date IS NOT NULL;
+        """,
+        """
+        UPDATE import_staging SET error = 'invalid due_date ' || quote_literal(due_date)
+        WHERE error IS NULL AND due_date IS NOT NULL AND parsed_due_date IS NULL;
+        """,
+        """
+        UPDATE import_staging SET error = 'invalid status ' || quote_literal(status)
+        WHERE error IS NULL AND status IS NOT NULL AND status <> ALL(%(statuses)s);
+        """,
+    ],
+    "tasks": [
+        "UPDATE import_staging SET error = 'description is required' WHERE description IS NULL;",
+        """
+        UPDATE import_staging s SET resolved_goal_id = g.id, goal_employee_id = g.employee_id
+        FROM goals g
+        WHERE s.error IS NULL
+          AND g.id = CASE WHEN s.goal_id ~ '^[0-9]{1,9}$' THEN s.goal_id::INTEGER END;
+        """,
+        """
+        UPDATE import_staging SET error = CASE WHEN goal_id IS NULL THEN 'goal_id is required'
+                                               ELSE 'unknown goal_id ' || goal_id END
+        WHERE error IS NULL AND resolved_goal_id IS NULL;
+        """,
+        # Tasks without an explicit employee belong to the goal's owner.
+        """
+        UPDATE import_staging SET resolved_employee_id = goal_employee_id
+        WHERE error IS NULL AND employee_id IS NULL AND employee IS NULL;
+        """,
+        *_RESOLVE_EMPLOYEE,
+        _UNRESOLVED_EMPLOYEE_ERROR,
+        """
+        UPDATE import_staging SET error = 'invalid is_approved ' || quote_literal(is_approved)
+        WHERE error IS NULL AND is_approved IS NOT NULL
+          AND lower(is_approved) NOT IN ('true', 'false', 't', 'f', 'yes', 'no', 'y', 'n', '1', '0');
+        """,
+    ],
+}
+
+_MERGE = {
+    "employees": """
+        INSERT INTO employees (name, manager_id)
+        SELECT name, resolved_manager_id FROM import_staging WHERE error IS NULL ORDER BY row_no;
+    """,
+    "goals": """
+        INSERT INTO goals (employee_id, description, due_date, status)
+        SELECT resolved_employee_id, description, parsed_due_date, COALESCE(status, 'Draft')
+        FROM import_staging WHERE error IS NULL ORDER BY row_no;
+    """,
+    "tasks": """
+        INSERT INTO tasks (goal_id, employee_id, description, is_approved)
+        SELECT resolved_goal_id, resolved_employee_id, description,
+               COALESCE(lower(is_approved) IN ('true', 't', 'yes', 'y', '1'), FALSE)
+        FROM import_staging WHERE error IS NULL ORDER BY row_no;
+    """,
+}
+
+_RESOLVED_COLUMNS = {
+    "employees": ["resolved_manager_id INTEGER"],
+    "goals": ["resolved_employee_id INTEGER", "parsed_due_date DATE"],
+    "tasks": ["resolved_goal_id INTEGER", "goal_employee_id INTEGER", "resolved_employee_id INTEGER"],
+}
+
+@instrumented
+def import_records(kind, records, strict=False, on_error=None):
+    """
+    Loads an iterable of dict records of the given kind ('employees', 'goals'
+    or 'tasks') and returns a report dict with the number of rows read,
+    inserted and rejected plus the first MAX_REPORTED_ERRORS (row, message)
+    pairs. `on_error(row, message)` is called for every rejected row. With
+    `strict=True` nothing is inserted if any row is rejected.
+    """
+    if kind not in IMPORT_COLUMNS:
+        raise BulkImportError(f"Unknown import kind: {kind!r}")
+    columns = IMPORT_COLUMNS[kind]
+    staging_columns = ", ".join(
+        ["row_no BIGINT PRIMARY KEY"] + [f"{c} TEXT" for c in columns]
+        + _RESOLVED_COLUMNS[kind] + ["error TEXT"]
+    )
+    report = {'kind': kind, 'read': 0, 'inserted': 0, 'rejected': 0, 'errors': []}
+    stream = _CopyStream(records, columns)
+
+    with backend.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE import_staging ({staging_columns}) ON COMMIT DROP;")
+            cur.execute(_TRY_DATE_FUNCTION)
+            cur.copy_expert(
+                f"COPY import_staging (row_no, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv);",
+                stream, size=COPY_CHUNK_SIZE
+            )
+            report['read'] = stream.rows
+            cur.execute("ANALYZE import_staging;")
+            for statement in _VALIDATE[kind]:
+                cur.execute(statement, {'statuses': list(GOAL_STATUSES)})
+
+        with conn.cursor(name="import_errors") as errors:
+            errors.itersize = 5000
+            errors.execute("SELECT row_no, error FROM import_staging WHERE error IS NOT NULL ORDER BY row_no;")
+            for row_no, message in errors:
+                report['rejected'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append((row_no, message))
+                if on_error is not None:
+                    on_error(row_no, message)
+
+        if strict and report['rejected']:
+            conn.rollback()
+            return report
+        with conn.cursor() as cur:
+            cur.execute(_MERGE[kind])
+            report['inserted'] = cur.rowcount
+
+    # Rows for arbitrarily many employees changed; drop cached reads wholesale.
+    backend.clear_cache()
+    return report
+
+def import_file(kind, path, fmt=None, strict=False, on_error=None):
+    """Streams a CSV or JSONL file (or '-' for stdin) through import_records()."""
+    fmt = fmt or ("csv" if path == "-" else _detect_format(path))
+    if path == "-":
+        return import_records(kind, _iter_records(sys.stdin, fmt), strict=strict, on_error=on_error)
+    with open(path, newline="", encoding="utf-8") as stream:
+        return import_records(kind, _iter_records(stream, fmt), strict=strict, on_error=on_error)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import employees, goals or tasks.")
+    parser.add_argument("kind", choices=sorted(IMPORT_COLUMNS))
+    parser.add_argument("path", help="CSV or JSONL file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None,
+                        help="input format (default: from the file extension)")
+    parser.add_argument("--errors", default=None, help="write rejected rows to this CSV file")
+    parser.add_argument("--strict", action="store_true", help="import nothing if any row is rejected")
+    args = parser.parse_args(argv)
+
+    error_file = open(args.errors, "w", newline="", encoding="utf-8") if args.errors else None
+    try:
+        on_error = None
+        if error_file is not None:
+            error_writer = csv.writer(error_file)
+            error_writer.writerow(["row", "error"])
+            on_error = lambda row_no, message: error_writer.writerow([row_no, message])
+        report = import_file(args.kind, args.path, fmt=args.format, strict=args.strict, on_error=on_error)
+    except (BulkImportError, psycopg2.Error, OSError) as e:
+        print(f"Error importing {args.kind}: {e}")
+        return 1
+    finally:
+        if error_file is not None:
+            error_file.close()
+
+    print(f"Read {report['read']} row(s), inserted {report['inserted']}, rejected {report['rejected']}.")
+    if error_file is None:
+        for row_no, message in report['errors'][:20]:
+            print(f"  row {row_no}: {message}")
+        if report['rejected'] > 20:
+            print(f"  ... {report['rejected'] - 20} more (use --errors to save them all)")
+    if args.strict and report['rejected']:
+        print("Nothing was imported because --strict was given.")
+    return 1 if report['rejected'] and args.strict else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
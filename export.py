@@ -0,0 +1,242 @@
+"""
+Streaming export of goals, tasks, feedback and performance history.
+
+Rows are read through a server-side (named) cursor, on a read replica when
+one is configured, and written out in chunks, so memory use stays flat
+however large the export is. Supported
+formats are CSV, JSONL and Parquet (the latter requires pyarrow). Usage:
+
+    python export.py history review.parquet
+    python export.py goals goals.csv --employee 3 --employee 7 --from 2026-01-01 --to 2026-06-30
+"""
+import argparse
+import csv
+import io
+import json
+import os
+from datetime import date
+
+import psycopg2
+
+import backend
+from instrumentation import instrumented
+
+EXPORT_CHUNK_SIZE = 10000
+
+# Each dataset is a SELECT, the column that the date range filters on, the
+# column holding the employee the rows belong to, and the output columns
+# with their Parquet types.
+EXPORT_DATASETS = {
+    "goals": {
+        "sql": """
+            SELECT g.id, g.employee_id, e.name, g.description, g.due_date, g.status, g.created_at
+            FROM goals g JOIN employees e ON e.id = g.employee_id
+        """,
+        "date_column": "g.created_at",
+        "employee_column": "g.employee_id",
+        "order_by": "g.id",
+        "columns": [("id", "int64"), ("employee_id", "int64"), ("employee_name", "string"),
+                    ("description", "string"), ("due_date", "date"), ("status", "string"),
+                    ("created_at", "timestamp")],
+    },
+    "tasks": {
+        "sql": """
+            SELECT t.id, t.goal_id, t.employee_id, e.name, t.description, t.is_approved, t.created_at
+            FROM tasks t JOIN employees e ON e.id = t.employee_id
+        """,
+        "date_column": "t.created_at",
+        "employee_column": "t.employee_id",
+        "order_by": "t.id",
+        "columns": [("id", "int64"), ("goal_id", "int64"), ("employee_id", "int64"),
+                    ("employee_name", "string"), ("description", "string"), ("is_approved", "bool"),
+                    ("created_at", "timestamp")],
+    },
+    "feedback": {
+        "sql": """
+            SELECT f.id, f.goal_id, g.employee_id, f.manager_id, f.feedback_text, f.created_at
+            FROM feedback f JOIN goals g ON g.id = f.goal_id
+        """,
+        "date_column": "f.created_at",
+        "employee_column": "g.employee_id",
+        "order_by": "f.id",
+        "columns": [("id", "int64"), ("goal_id", "int64"), ("employee_id", "int64"),
+                    ("manager_id", "int64"), ("feedback_text", "string"), ("created_at", "timestamp")],
+    },
+    # Organisation-wide get_performance_history(): one row per goal/feedback pair.
+    "history": {
+        "sql": """
+            SELECT g.id, g.employee_id, e.name, g.description, g.due_date, g.status, g.created_at,
+                   f.id, f.feedback_text, f.created_at
+            FROM goals g
+            JOIN employees e ON e.id = g.employee_id
+            LEFT JOIN feedback f ON f.goal_id = g.id
+        """,
+        "date_column": "g.created_at",
+        "employee_column": "g.employee_id",
+        "order_by": "g.employee_id, g.id, f.created_at",
+        "columns": [("goal_id", "int64"), ("employee_id", "int64"), ("employee_name", "string"),
+                    ("goal_description", "string"), ("due_date", "date"), ("status", "string"),
+                    ("goal_created_at", "timestamp"), ("feedback_id", "int64"),
+                    ("feedback_text", "string"), ("feedback_created_at", "timestamp")],
+    },
+}
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+class ExportError(Exception):
+    """Raised for an unknown dataset or format, or when pyarrow is missing for Parquet."""
+
+def _build_query(dataset, employee_ids, date_from, date_to):
+    spec = EXPORT_DATASETS[dataset]
+    where, params = [], []
+    if employee_ids:
+        where.append(f"{spec['employee_column']} = ANY(%s)")
+        params.append(list(employee_ids))
+    if date_from is not None:
+        where.append(f"{spec['date_column']} >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        # date_to is inclusive of the whole day
+        where.append(f"{spec['date_column']} < %s::date + 1")
+        params.append(date_to)
+    sql = spec["sql"]
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + f" ORDER BY {spec['order_by']}", params
+
+def iter_chunks(dataset, employee_ids=None, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields lists of up to `chunk_size` row tuples of a dataset, streamed from the server."""
+    if dataset not in EXPORT_DATASETS:
+        raise ExportError(f"Unknown dataset: {dataset!r}")
+    sql, params = _build_query(dataset, employee_ids, date_from, date_to)
+    with backend.db_connection(read_only=True) as conn:
+        with conn.cursor(name=f"export_{dataset}") as cur:
+            cur.itersize = chunk_size
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+def _json_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+class _CsvWriter:
+    def __init__(self, out, names):
+        self._text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(names)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()
+
+class _JsonlWriter:
+    def __init__(self, out, names):
+        self._out = out
+        self._names = names
+
+    def write(self, rows):
+        lines = [
+            json.dumps({name: _json_value(value) for name, value in zip(self._names, row)})
+            for row in rows
+        ]
+        self._out.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+    def close(self):
+        self._out.flush()
+
+class _ParquetWriter:
+    def __init__(self, out, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ExportError("Parquet export requires pyarrow (pip install pyarrow)") from e
+        types = {
+            "int64": pa.int64(), "string": pa.string(), "date": pa.date32(),
+            "timestamp": pa.timestamp("us"), "bool": pa.bool_(),
+        }
+        self._pa = pa
+        self._schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self._writer = pq.ParquetWriter(out, self._schema)
+
+    def write(self, rows):
+        arrays = [
+            self._pa.array([row[i] for row in rows], type=column.type)
+            for i, column in enumerate(self._schema)
+        ]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+@instrumented
+def export_dataset(dataset, out, fmt="csv", employee_ids=None, date_from=None, date_to=None,
+                   chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Streams a dataset into the binary file object `out` and returns the number
+    of rows written. `employee_ids` restricts the export to those employees and
+    `date_from`/`date_to` (inclusive) filter on the rows' creation date.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ExportError(f"Unknown dataset: {dataset!r}")
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format: {fmt!r}")
+    columns = EXPORT_DATASETS[dataset]["columns"]
+    names = [name for name, _ in columns]
+    if fmt == "csv":
+        writer = _CsvWriter(out, names)
+    elif fmt == "jsonl":
+        writer = _JsonlWriter(out, names)
+    else:
+        writer = _ParquetWriter(out, columns)
+    count = 0
+    try:
+        for rows in iter_chunks(dataset, employee_ids, date_from, date_to, chunk_size):
+            writer.write(rows)
+            count += len(rows)
+    finally:
+        writer.close()
+    return count
+
+def export_to_file(dataset, path, fmt=None, **filters):
+    """Exports a dataset to `path`, taking the format from the extension unless given."""
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower() or "csv"
+    with open(path, "wb") as out:
+        return export_dataset(dataset, out, fmt=fmt, **filters)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export PMS data to CSV, JSONL or Parquet.")
+    parser.add_argument("dataset", choices=sorted(EXPORT_DATASETS))
+    parser.add_argument("path", help="output file")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default=None,
+                        help="output format (default: from the file extension)")
+    parser.add_argument("--employee", type=int, action="append", dest="employee_ids",
+                        help="only export this employee id (repeatable)")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, default=None,
+                        help="only rows created on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, default=None,
+                        help="only rows created on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        count = export_to_file(
+            args.dataset, args.path, fmt=args.format, employee_ids=args.employee_ids,
+            date_from=args.date_from, date_to=args.date_to, chunk_size=args.chunk_size
+        )
+    except (ExportError, psycopg2.Error, OSError) as e:
+        print(f"Error exporting {args.dataset}: {e}")
+        return 1
+    print(f"Exported {count} row(s) to {args.path}.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
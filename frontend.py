@@ -1,264 +1,783 @@
-import streamlit as st
-import pandas as pd
-from datetime import datetime
-from backend import (
-    create_tables, get_all_employees, add_employee,
-    create_goal, read_goals, update_goal_status, delete_goal,
-    create_task, read_tasks, update_task_approval,
-    create_feedback, read_feedback,
-    get_performance_history, get_goal_status_counts,
-    get_avg_days_to_complete_goal, get_max_min_due_date,
-    get_total_tasks_approved
-)
-
-# --- Initial Setup and Session State Management ---
-if 'init_db' not in st.session_state:
-    create_tables()
-    st.session_state.init_db = True
-
-if 'user_role' not in st.session_state:
-    st.session_state.user_role = 'Manager'
-
-if 'selected_employee' not in st.session_state:
-    st.session_state.selected_employee = None
-
-st.set_page_config(layout="wide", page_title="Performance Management System")
-
-st.title("Performance Management System")
-
-# --- Sidebar for Navigation and User Selection ---
-with st.sidebar:
-    st.header("Navigation")
-    st.session_state.user_role = st.radio(
-        "Select your role:",
-        ('Manager', 'Employee')
-    )
-    
-    st.subheader("Select Employee")
-    employees = get_all_employees()
-    employee_names = [e[1] for e in employees]
-    employee_map = {e[1]: e[0] for e in employees}
-
-    selected_employee_name = st.selectbox(
-        "Choose an employee:",
-        options=employee_names,
-        index=None
-    )
-    
-    if selected_employee_name:
-        st.session_state.selected_employee = employee_map[selected_employee_name]
-    else:
-        st.session_state.selected_employee = None
-        
-    st.subheader("Add New Employee")
-    new_employee_name = st.text_input("New Employee Name:")
-    if st.button("Add Employee"):
-        if new_employee_name:
-            add_employee(new_employee_name)
-            st.success(f"Added new employee: {new_employee_name}")
-            st.rerun()
-        else:
-            st.error("Please enter a name for the new employee.")
-
-# --- Main Content Area ---
-st.header(f"You are logged in as a: {st.session_state.user_role}")
-
-if st.session_state.selected_employee:
-    st.subheader(f"Viewing data for: {selected_employee_name}")
-
-    # --- Goal & Task Setting Section ---
-    st.divider()
-    st.subheader("Goal & Task Management")
-
-    if st.session_state.user_role == 'Manager':
-        # Manager can set goals
-        with st.expander("Set a New Goal"):
-            with st.form("goal_form"):
-                goal_description = st.text_area("Goal Description:")
-                due_date = st.date_input("Due Date:", min_value=datetime.today())
-                submit_goal = st.form_submit_button("Set Goal")
-                
-                if submit_goal:
-                    if st.session_state.selected_employee and goal_description:
-                        create_goal(st.session_state.selected_employee, goal_description, due_date)
-                        st.success("Goal set successfully!")
-                        st.rerun()
-                    else:
-                        st.error("Please select an employee and provide a description.")
-        
-        st.subheader("Current Goals")
-        goals_data = read_goals(st.session_state.selected_employee)
-        if goals_data:
-            df_goals = pd.DataFrame(goals_data, columns=['ID', 'Employee', 'Description', 'Due Date', 'Status'])
-            st.dataframe(df_goals, use_container_width=True)
-
-            # Manager can update goal status
-            with st.form("goal_status_form"):
-                goal_id_to_update = st.selectbox(
-                    "Select Goal ID to Update Status:",
-                    options=df_goals['ID'].tolist(),
-                    index=None
-                )
-                new_status = st.radio(
-                    "New Status:",
-                    ('Draft', 'In Progress', 'Completed', 'Cancelled')
-                )
-                submit_status = st.form_submit_button("Update Goal Status")
-                
-                if submit_status and goal_id_to_update:
-                    update_goal_status(goal_id_to_update, new_status)
-                    st.success(f"Status for Goal {goal_id_to_update} updated to '{new_status}'")
-                    
-                    # --- Automated Feedback Trigger ---
-                    if new_status == 'Completed':
-                        trigger_feedback_text = "Congratulations on completing this goal! Your hard work is appreciated."
-                        create_feedback(goal_id_to_update, st.session_state.selected_employee, trigger_feedback_text)
-                        st.info("Automated 'Completed' feedback has been generated.")
-                    st.rerun()
-
-    elif st.session_state.user_role == 'Employee':
-        # Employee can log tasks for their goals
-        st.subheader("My Goals")
-        my_goals = read_goals(st.session_state.selected_employee)
-        if my_goals:
-            df_my_goals = pd.DataFrame(my_goals, columns=['ID', 'Employee', 'Description', 'Due Date', 'Status'])
-            st.dataframe(df_my_goals, use_container_width=True)
-            
-            with st.expander("Log a New Task for a Goal"):
-                with st.form("task_form"):
-                    goal_id_for_task = st.selectbox(
-                        "Select a Goal to Log a Task for:",
-                        options=df_my_goals['ID'].tolist(),
-                        format_func=lambda x: f"Goal {x}: {df_my_goals.loc[df_my_goals['ID'] == x, 'Description'].iloc[0][:50]}...",
-                        index=None
-                    )
-                    task_description = st.text_area("Task Description:")
-                    submit_task = st.form_submit_button("Log Task")
-                    
-                    if submit_task and goal_id_for_task and task_description:
-                        create_task(goal_id_for_task, st.session_state.selected_employee, task_description)
-                        st.success("Task logged for manager approval!")
-                        st.rerun()
-                    else:
-                        st.error("Please select a goal and provide a task description.")
-        else:
-            st.info("You have no goals assigned yet.")
-
-    # --- Task Approval Section (Manager View) ---
-    if st.session_state.user_role == 'Manager':
-        st.divider()
-        st.subheader("Tasks Awaiting Approval")
-        all_tasks = read_tasks(employee_id=st.session_state.selected_employee)
-        if all_tasks:
-            df_tasks = pd.DataFrame(all_tasks, columns=['Task ID', 'Goal Description', 'Task Description', 'Approved'])
-            st.dataframe(df_tasks, use_container_width=True)
-            
-            with st.form("task_approval_form"):
-                task_id_to_approve = st.selectbox(
-                    "Select Task ID to Approve:",
-                    options=df_tasks['Task ID'].tolist(),
-                    index=None
-                )
-                submit_approval = st.form_submit_button("Approve Task")
-                
-                if submit_approval and task_id_to_approve:
-                    update_task_approval(task_id_to_approve, True)
-                    st.success(f"Task {task_id_to_approve} has been approved.")
-                    st.rerun()
-        else:
-            st.info("No tasks to approve.")
-    
-    # --- Feedback Section ---
-    st.divider()
-    st.subheader("Feedback")
-    
-    if st.session_state.user_role == 'Manager':
-        with st.expander("Provide Feedback"):
-            goals_for_feedback = read_goals(st.session_state.selected_employee)
-            if goals_for_feedback:
-                df_goals_feedback = pd.DataFrame(goals_for_feedback, columns=['ID', 'Employee', 'Description', 'Due Date', 'Status'])
-                with st.form("feedback_form"):
-                    goal_id_for_feedback = st.selectbox(
-                        "Select a Goal to provide feedback on:",
-                        options=df_goals_feedback['ID'].tolist(),
-                        format_func=lambda x: f"Goal {x}: {df_goals_feedback.loc[df_goals_feedback['ID'] == x, 'Description'].iloc[0][:50]}...",
-                        index=None
-                    )
-                    feedback_text = st.text_area("Feedback:")
-                    submit_feedback = st.form_submit_button("Submit Feedback")
-                    
-                    if submit_feedback and goal_id_for_feedback and feedback_text:
-                        create_feedback(goal_id_for_feedback, st.session_state.selected_employee, feedback_text)
-                        st.success("Feedback submitted successfully!")
-                        st.rerun()
-            else:
-                st.info("No goals to provide feedback on.")
-
-    elif st.session_state.user_role == 'Employee':
-        st.subheader("My Feedback History")
-        # Fetch goals for this employee and then their feedback
-        goals_data_for_feedback = read_goals(st.session_state.selected_employee)
-        if goals_data_for_feedback:
-            for goal_id, _, description, _, _ in goals_data_for_feedback:
-                feedback_list = read_feedback(goal_id)
-                if feedback_list:
-                    st.markdown(f"**Feedback for Goal {goal_id}:** {description}")
-                    for _, text, created_at in feedback_list:
-                        st.markdown(f"> **{created_at.strftime('%Y-%m-%d')}**: {text}")
-        else:
-            st.info("No feedback available yet.")
-            
-    # --- Reporting Section ---
-    st.divider()
-    st.subheader("Performance History Report")
-    history_data = get_performance_history(st.session_state.selected_employee)
-    if history_data:
-        for goal in history_data:
-            st.markdown(f"**Goal ID:** {goal['goal_id']}")
-            st.markdown(f"**Description:** {goal['description']}")
-            st.markdown(f"**Due Date:** {goal['due_date']}")
-            st.markdown(f"**Status:** {goal['status']}")
-            st.markdown(f"**Date Created:** {goal['created_at']}")
-            if goal['feedbacks']:
-                st.markdown("**Associated Feedback:**")
-                for feedback_text, created_at in goal['feedbacks']:
-                    st.markdown(f"- {feedback_text} (on {created_at.strftime('%Y-%m-%d')})")
-            st.markdown("---")
-    else:
-        st.info("No performance history to display.")
-
-    # --- Business Insights Section ---
-    st.divider()
-    st.subheader("Business Insights")
-    st.write("Leveraging core database functions to provide actionable insights.")
-
-    # Goal Status Count (COUNT)
-    goal_counts = get_goal_status_counts(st.session_state.selected_employee)
-    if goal_counts:
-        st.metric("Total Goals", sum(goal_counts.values()))
-        df_counts = pd.DataFrame(list(goal_counts.items()), columns=['Status', 'Count'])
-        st.bar_chart(df_counts.set_index('Status'))
-
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        # Average Completion Time (AVG)
-        avg_days = get_avg_days_to_complete_goal(st.session_state.selected_employee)
-        if avg_days is not None:
-            st.metric("Avg Days to Complete Goal", f"{avg_days:.2f} days")
-        else:
-            st.metric("Avg Days to Complete Goal", "N/A")
-
-        # Total Approved Tasks (SUM/COUNT)
-        total_approved_tasks = get_total_tasks_approved()
-        st.metric("Total Approved Tasks", total_approved_tasks)
-
-    with col2:
-        # Min and Max Due Dates (MIN, MAX)
-        min_date, max_date = get_max_min_due_date()
-        if min_date and max_date:
-            st.markdown(f"**Earliest Due Date:** {min_date}")
-            st.markdown(f"**Latest Due Date:** {max_date}")
-
-else:
-    st.warning("Please select an employee from the sidebar to view their information.")
+import time
+run_started = time.perf_counter()
+
+import tempfile
+import uuid
+import streamlit as st
+from datetime import date, datetime, timedelta
+from backend import (
+    fetch_bundle, get_circuit_breaker_stats, get_pool_stats, get_cache_stats, get_change_listener_stats,
+    get_replica_stats, set_db_session, start_change_listener
+)
+import instrumentation
+from storage import DEFAULT_PAGE_SIZE, SEARCH_KINDS, get_storage, review_cycle_start
+from write_behind import get_write_behind, get_write_behind_stats
+# pandas and export.py are imported where they are used, so that a new
+# server process paints its first page before loading them.
+
+# --- Initial Setup and Session State Management ---
+# The first run of every session reports how long it takes to reach each
+# phase of start-up (shown on the admin page).
+startup = instrumentation.StartupTimer(run_started, record='session_started' not in st.session_state)
+st.session_state.session_started = True
+startup.mark('imports')
+
+# The storage engine is chosen with PMS_STORAGE (PostgreSQL by default).
+store = get_storage()
+if store.engine == "postgres":
+    # Evicts cached reads when other server processes write (idempotent per process).
+    start_change_listener()
+
+if 'user_role' not in st.session_state:
+    st.session_state.user_role = 'Manager'
+
+if 'selected_employee' not in st.session_state:
+    st.session_state.selected_employee = None
+
+# Reads after this session's own writes are served by the primary database
+# rather than a possibly lagging replica.
+if 'db_session' not in st.session_state:
+    st.session_state.db_session = uuid.uuid4().hex
+set_db_session(st.session_state.db_session)
+
+st.set_page_config(layout="wide", page_title="Performance Management System")
+
+def page_token(key):
+    """Returns the continuation token of the page currently shown in table `key`."""
+    tokens_key = f"{key}_page_tokens"
+    if tokens_key not in st.session_state:
+        st.session_state[tokens_key] = [None]
+    return st.session_state[tokens_key][-1]
+
+def paginated_table(key, page, columns):
+    """
+    Renders a keyset page, as returned by the read_*_page() functions, with
+    Previous/Next controls and returns it as a DataFrame.
+    """
+    import pandas as pd
+    rows, next_token = page
+    df = pd.DataFrame(rows, columns=columns)
+    if rows:
+        st.dataframe(df, use_container_width=True)
+    page_controls(key, next_token)
+    return df
+
+def page_controls(key, next_token):
+    """Renders the Previous/Next controls of the paged view `key` (see page_token())."""
+    tokens = st.session_state[f"{key}_page_tokens"]
+    if len(tokens) > 1 or next_token:
+        # The callbacks move the page before the rerun, so inside a section
+        # only that section reruns.
+        prev_col, page_col, next_col = st.columns([1, 4, 1])
+        with prev_col:
+            st.button("Previous", key=f"{key}_prev", disabled=len(tokens) == 1, on_click=tokens.pop)
+        with page_col:
+            st.caption(f"Page {len(tokens)}")
+        with next_col:
+            st.button("Next", key=f"{key}_next", disabled=next_token is None, on_click=tokens.append, args=(next_token,))
+
+def option_labels(df, id_column, text_column, width=50):
+    """
+    Returns {id: first `width` characters of text} for a selectbox's
+    format_func, so labelling an option is a lookup rather than a scan of `df`.
+    """
+    return dict(zip(df[id_column].tolist(), df[text_column].str.slice(0, width).tolist()))
+
+# --- Page Sections ---
+# Each section of the page is a fragment, so interacting with its widgets
+# reruns only that section. A section declares the tables it reads, and a
+# write reruns just the sections that read what it wrote (data_changed()).
+# A hidden section neither renders nor queries.
+SECTION_TABLES = {
+    'search': ("employees", "goals", "tasks", "feedback"),
+    'goals': ("employees", "goals"),
+    'tasks': ("goals", "tasks"),
+    'team': ("employees", "goals", "tasks"),
+    'feedback': ("goals", "feedback"),
+    'history': ("goals", "feedback"),
+    'insights': ("goals", "tasks"),
+}
+SECTIONS_HIDDEN_BY_DEFAULT = ('history',)
+ROLE_SECTIONS = {
+    'Manager': ('goals', 'tasks', 'team', 'feedback', 'history', 'insights'),
+    'Employee': ('goals', 'feedback', 'history', 'insights'),
+}
+
+# Review cycles the Performance History Report covers, by option; None is all
+# of them. Recent cycles are a small share of the data (see partitioning.py).
+HISTORY_CYCLES = {'This Cycle': 1, 'Last 4 Cycles': 4, 'All': None}
+
+# How long a status change waits for its own queued automated feedback to be
+# written, so that the rerun it triggers already shows it. Feedback still
+# queued after that is watched by pending_feedback_watch(), every
+# QUEUED_FEEDBACK_POLL_SECONDS.
+QUEUED_FEEDBACK_WAIT_SECONDS = 1.0
+QUEUED_FEEDBACK_POLL_SECONDS = 1.0
+
+def section_visible(name):
+    return st.session_state.get(f"show_{name}", name not in SECTIONS_HIDDEN_BY_DEFAULT)
+
+def section_header(name, title):
+    """Renders a section's title with its Show toggle; returns whether the section is shown."""
+    st.divider()
+    title_col, toggle_col = st.columns([6, 1], vertical_alignment="bottom")
+    title_col.subheader(title)
+    return toggle_col.toggle("Show", value=name not in SECTIONS_HIDDEN_BY_DEFAULT, key=f"show_{name}")
+
+def section_requests(name, employee_id):
+    """Returns the reads section `name` needs, as fetch_bundle() requests."""
+    if name == 'goals':
+        return {'goals_page': (store.read_goals_page, employee_id, DEFAULT_PAGE_SIZE, page_token(goals_table_key(employee_id)))}
+    if name == 'tasks':
+        return {'tasks_page': (store.read_tasks_page, None, employee_id, DEFAULT_PAGE_SIZE, page_token(f"tasks_{employee_id}"))}
+    if name == 'team':
+        return {
+            'manager': (store.get_manager, employee_id),
+            'team': (store.get_team, employee_id),
+            'team_status_counts': (store.get_team_goal_status_counts, employee_id),
+        }
+    if name == 'feedback' and st.session_state.user_role == 'Employee':
+        return {
+            'goals': (store.read_goals, employee_id),
+            'feedback_by_goal': lambda: store.read_feedback_for_goals([g[0] for g in store.read_goals(employee_id)]),
+        }
+    if name == 'history':
+        cycles = HISTORY_CYCLES[st.session_state.get('history_cycles', 'Last 4 Cycles')]
+        since = review_cycle_start(cycles_back=cycles - 1) if cycles else None
+        return {'history': (store.get_performance_history, employee_id, since)}
+    if name == 'insights':
+        scope_employee_id = employee_id if st.session_state.get('insights_scope', 'Selected Employee') == 'Selected Employee' else None
+        return {
+            'summary': (store.get_dashboard_summary, scope_employee_id),
+            'trends': (store.get_goal_trends, scope_employee_id, st.session_state.get('trend_period', 'week'),
+                       date.today() - timedelta(days=365)),
+        }
+    return {}
+
+def prefetch_sections(names, employee_id, checkpoint=None):
+    """
+    Fetches the data of the shown sections among `names` concurrently, in one
+    bundle. `checkpoint` is passed on to fetch_bundle(), see the main content.
+    """
+    requests = {
+        (name, key): request
+        for name in names if section_visible(name)
+        for key, request in section_requests(name, employee_id).items()
+    }
+    prefetched = {}
+    for (name, key), value in fetch_bundle(requests, checkpoint).items():
+        prefetched.setdefault(name, {})[key] = value
+    st.session_state.prefetched = prefetched
+
+def section_data(name, employee_id):
+    """Returns a section's data, prefetched if the section reruns along with others."""
+    prefetched = st.session_state.get('prefetched', {})
+    if name in prefetched:
+        return prefetched.pop(name)
+    return fetch_bundle(section_requests(name, employee_id))
+
+def data_changed(section, employee_id, *tables):
+    """
+    Called by a widget callback of `section` after it wrote `tables`: reruns
+    only that section and the others on the page that read those tables,
+    their data fetched in one bundle.
+    """
+    affected = [
+        name for name in st.session_state.page_sections
+        if name == section or set(SECTION_TABLES[name]) & set(tables)
+    ]
+    prefetch_sections(affected, employee_id)
+    st.rerun(affected)
+
+def notify(section, level, message):
+    """Queues a message for a section's next render; callbacks cannot show one in place."""
+    st.session_state.setdefault(f"{section}_notices", []).append((level, message))
+
+def show_notices(section):
+    for level, message in st.session_state.pop(f"{section}_notices", []):
+        getattr(st, level)(message)
+
+def goals_table_key(employee_id):
+    return f"goals_{employee_id}" if st.session_state.user_role == 'Manager' else f"my_goals_{employee_id}"
+
+def render_admin_page():
+    """Shows the heaviest database statements and the session start-up times of this server process."""
+    import pandas as pd
+    st.title("Database Diagnostics")
+    st.caption("Statistics cover the current server process since it started or was last reset.")
+    if st.button("Reset Statistics"):
+        instrumentation.reset()
+        st.rerun()
+
+    st.subheader("Top Offenders")
+    order_by = st.radio("Order by:", ('total_ms', 'mean_ms', 'max_ms', 'calls', 'acquire_wait_ms'), horizontal=True)
+    top = instrumentation.top_queries(limit=25, order_by=order_by)
+    if top:
+        df_top = pd.DataFrame(top)[['function', 'calls', 'errors', 'total_ms', 'mean_ms', 'max_ms', 'rows', 'acquire_wait_ms', 'fingerprint']]
+        st.dataframe(df_top, use_container_width=True)
+        with st.expander("Latency Histogram"):
+            selected = st.selectbox(
+                "Statement:",
+                options=range(len(top)),
+                format_func=lambda i: f"{top[i]['function']}: {top[i]['fingerprint'][:80]}"
+            )
+            histogram = top[selected]['histogram']
+            df_histogram = pd.DataFrame(
+                {'Statements': list(histogram.values())},
+                index=[f"<= {bound:g} ms" for bound in histogram]
+            )
+            st.bar_chart(df_histogram)
+    else:
+        st.info("No statements recorded yet.")
+
+    st.subheader("Slow Queries")
+    slow = instrumentation.slow_queries()
+    if slow:
+        df_slow = pd.DataFrame(slow)
+        df_slow['timestamp'] = pd.to_datetime(df_slow['timestamp'], unit='s')
+        df_slow['params'] = df_slow['params'].astype(str)
+        st.dataframe(df_slow[['timestamp', 'function', 'duration_ms', 'acquire_wait_ms', 'rows', 'fingerprint', 'params']], use_container_width=True)
+    else:
+        st.info(f"No statements slower than {instrumentation.SLOW_QUERY_MS:g} ms.")
+
+    st.subheader("Session Start-up")
+    startup_report = instrumentation.startup_report()
+    if startup_report:
+        st.dataframe(pd.DataFrame(startup_report), use_container_width=True)
+        st.caption("Milliseconds from the start of a new session's first run to each phase: imports done, "
+                   "title shown (first paint), schema ready and the whole page rendered.")
+    else:
+        st.info("No new sessions recorded yet.")
+
+    write_behind_stats = get_write_behind_stats()
+    if write_behind_stats:
+        st.subheader("Write-Behind Queue")
+        st.json(write_behind_stats)
+
+    if store.engine == "postgres":
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("Connection Pool")
+            st.json(get_pool_stats())
+        with col2:
+            st.subheader("Query Cache")
+            st.json(get_cache_stats())
+            st.caption("Change listener")
+            st.json(get_change_listener_stats())
+        st.subheader("Circuit Breaker")
+        st.json(get_circuit_breaker_stats())
+        replica_stats = get_replica_stats()
+        if replica_stats:
+            st.subheader("Read Replicas")
+            st.dataframe(pd.DataFrame(replica_stats).drop(columns=['pool']), use_container_width=True)
+
+# --- Hidden Admin Page (open the app with ?admin=1) ---
+if st.query_params.get("admin") == "1":
+    render_admin_page()
+    st.stop()
+
+st.title("Performance Management System")
+startup.mark('first_paint')
+
+# The schema is readied once per process rather than per session (see
+# Storage.ensure_schema()), after the title so that the page starts to paint
+# while the first session of a new process waits for it.
+if not store.ensure_schema():
+    st.error("The database schema could not be brought up to date; see the server log.")
+startup.mark('schema_ready')
+
+# --- Sidebar for Navigation and User Selection ---
+with st.sidebar:
+    st.header("Navigation")
+    st.session_state.user_role = st.radio(
+        "Select your role:",
+        ('Manager', 'Employee')
+    )
+    
+    st.subheader("Select Employee")
+    # Only the best matches for the search text are loaded; the picker is
+    # keyed on employee id so that people sharing a name stay distinct.
+    employee_query = st.text_input("Search employees:", placeholder="Start typing a name")
+    employee_names = dict(store.search_employees(employee_query))
+    current_employee = st.session_state.selected_employee
+    if current_employee is not None and current_employee not in employee_names:
+        # Keep the current selection available while the search text changes.
+        current = store.get_employee(current_employee)
+        if current:
+            employee_names[current[0]] = current[1]
+    employee_ids = list(employee_names)
+
+    selected_employee_id = st.selectbox(
+        "Choose an employee:",
+        options=employee_ids,
+        format_func=lambda employee_id: f"{employee_names[employee_id]} (ID {employee_id})",
+        index=employee_ids.index(current_employee) if current_employee in employee_names else None
+    )
+
+    st.session_state.selected_employee = selected_employee_id
+    selected_employee_name = employee_names.get(selected_employee_id)
+        
+    st.subheader("Add New Employee")
+    new_employee_name = st.text_input("New Employee Name:")
+    reports_to_selected = st.checkbox(
+        f"Reports to {selected_employee_name}" if selected_employee_name else "Reports to the selected employee",
+        disabled=selected_employee_id is None
+    )
+    if st.button("Add Employee"):
+        if new_employee_name:
+            store.add_employee(new_employee_name, selected_employee_id if reports_to_selected else None)
+            st.success(f"Added new employee: {new_employee_name}")
+            st.rerun()
+        else:
+            st.error("Please enter a name for the new employee.")
+
+# --- Section Actions ---
+# Writes run in widget callbacks, before the rerun they trigger, so that
+# data_changed() can rerun just the sections that read what they wrote.
+def set_goal(employee_id):
+    goal_description = st.session_state.goal_description
+    if goal_description:
+        store.create_goal(employee_id, goal_description, st.session_state.goal_due_date)
+        notify('goals', 'success', "Goal set successfully!")
+        data_changed('goals', employee_id, "goals")
+    else:
+        notify('goals', 'error', "Please provide a description.")
+
+def update_goal_status(employee_id):
+    goal_ids_to_update = st.session_state.goal_ids_to_update
+    new_status = st.session_state.new_goal_status
+    if not goal_ids_to_update:
+        return
+    changed_goal_ids = store.update_goal_status_many(goal_ids_to_update, new_status)
+    notify('goals', 'success', f"Status for {len(changed_goal_ids)} goal(s) updated to '{new_status}'")
+    changed_tables = ["goals"]
+
+    # --- Automated Feedback Trigger ---
+    if new_status == 'Completed' and changed_goal_ids:
+        trigger_feedback_text = "Congratulations on completing this goal! Your hard work is appreciated."
+        # Written in the background; rerunning the feedback section before
+        # the worker has written it would render it without the feedback.
+        submission = get_write_behind().submit_many("feedback", (
+            (goal_id, employee_id, trigger_feedback_text)
+            for goal_id in changed_goal_ids
+        ))
+        if not submission.wait(QUEUED_FEEDBACK_WAIT_SECONDS):
+            notify('goals', 'info', "Automated 'Completed' feedback has been queued and will show up shortly.")
+            st.session_state.pending_feedback = submission
+            # A full run, so that the page starts watching the submission.
+            st.rerun()
+        if submission.ok:
+            notify('goals', 'info', "Automated 'Completed' feedback has been added.")
+            changed_tables.append("feedback")
+        else:
+            notify('goals', 'warning', "Automated 'Completed' feedback could not be saved.")
+    data_changed('goals', employee_id, *changed_tables)
+
+@st.fragment(run_every=QUEUED_FEEDBACK_POLL_SECONDS)
+def pending_feedback_watch():
+    """
+    Reruns the page once the automated feedback that update_goal_status()
+    stopped waiting for has been written or given up on.
+    """
+    submission = st.session_state.get('pending_feedback')
+    if submission is None or not submission.done():
+        return
+    del st.session_state.pending_feedback
+    if not submission.ok:
+        notify('goals', 'warning', "Automated 'Completed' feedback could not be saved.")
+    st.rerun()
+
+def log_task(employee_id):
+    goal_id_for_task = st.session_state.task_goal_id
+    task_description = st.session_state.task_description
+    if goal_id_for_task and task_description:
+        store.create_task(goal_id_for_task, employee_id, task_description)
+        notify('goals', 'success', "Task logged for manager approval!")
+        data_changed('goals', employee_id, "tasks")
+    else:
+        notify('goals', 'error', "Please select a goal and provide a task description.")
+
+def approve_tasks(employee_id):
+    task_ids_to_approve = st.session_state.task_ids_to_approve
+    if task_ids_to_approve:
+        approved_task_ids = store.update_task_approval_many(task_ids_to_approve, True)
+        notify('tasks', 'success', f"{len(approved_task_ids)} task(s) have been approved.")
+        data_changed('tasks', employee_id, "tasks")
+
+def set_manager(employee_id):
+    if store.set_manager(employee_id, st.session_state.new_manager_id):
+        notify('team', 'success', "Reporting line updated.")
+        data_changed('team', employee_id, "employees")
+    else:
+        notify('team', 'error', "The reporting line could not be changed; an employee cannot report to their own team.")
+
+def submit_feedback(employee_id):
+    goal_id_for_feedback = st.session_state.feedback_goal_id
+    feedback_text = st.session_state.feedback_text
+    if goal_id_for_feedback and feedback_text:
+        store.create_feedback(goal_id_for_feedback, employee_id, feedback_text)
+        notify('feedback', 'success', "Feedback submitted successfully!")
+        data_changed('feedback', employee_id, "feedback")
+
+# --- Search Section ---
+@st.fragment(key='search')
+def search_section(selected_employee_id, selected_employee_name):
+    # Collapsed, the search neither renders nor queries.
+    search_expander = st.expander("Search Goals, Tasks and Feedback", key='search_open', on_change="rerun")
+    with search_expander:
+        if not search_expander.open:
+            return
+        search_query = st.text_input(
+            "Search for:", key='search_query', placeholder='e.g. billing latency, "code review" or deploy -staging'
+        )
+        kinds_col, status_col, from_col, to_col = st.columns(4)
+        with kinds_col:
+            search_kinds = st.multiselect("Search in:", SEARCH_KINDS, default=SEARCH_KINDS, format_func=str.capitalize)
+        with status_col:
+            search_status = st.selectbox("Goal status:", ('Any', 'Draft', 'In Progress', 'Completed', 'Cancelled'))
+        with from_col:
+            search_from = st.date_input("Created from:", value=None)
+        with to_col:
+            search_to = st.date_input("Created until:", value=None)
+        search_selected_only = st.checkbox(
+            f"Only {selected_employee_name}'s records" if selected_employee_name else "Only the selected employee's records",
+            disabled=selected_employee_id is None
+        )
+        if search_query.strip():
+            search_args = (
+                search_query.strip(), tuple(search_kinds), selected_employee_id if search_selected_only else None,
+                None if search_status == 'Any' else search_status, search_from, search_to
+            )
+            # Changing the search starts again from its first page.
+            search_key = f"search_{abs(hash(search_args))}"
+            results, next_search_token = store.search_records(*search_args, DEFAULT_PAGE_SIZE, page_token(search_key))
+            if not results:
+                st.info("No goals, tasks or feedback match your search.")
+            for kind, item_id, goal_id, owner_name, goal_status, created_at, snippet in results:
+                # Snippets mark the matched words in Markdown bold.
+                st.markdown(
+                    f"**{kind.rstrip('s').capitalize()} #{item_id}** · {owner_name} · Goal #{goal_id} ({goal_status}) · "
+                    f"{created_at:%Y-%m-%d}  \n{snippet}"
+                )
+            page_controls(search_key, next_search_token)
+
+# --- Goal & Task Setting Section ---
+@st.fragment(key='goals')
+def goals_section(employee_id):
+    if not section_header('goals', "Goal & Task Management"):
+        return
+    show_notices('goals')
+    data = section_data('goals', employee_id)
+
+    if st.session_state.user_role == 'Manager':
+        # Manager can set goals
+        with st.expander("Set a New Goal"):
+            with st.form("goal_form"):
+                st.text_area("Goal Description:", key='goal_description')
+                st.date_input("Due Date:", min_value=datetime.today(), key='goal_due_date')
+                st.form_submit_button("Set Goal", on_click=set_goal, args=(employee_id,))
+
+        st.subheader("Current Goals")
+        df_goals = paginated_table(
+            goals_table_key(employee_id),
+            data['goals_page'],
+            ['ID', 'Employee', 'Description', 'Due Date', 'Status']
+        )
+        if not df_goals.empty:
+            # Manager can update the status of several goals at once
+            with st.form("goal_status_form"):
+                st.multiselect(
+                    "Select Goal IDs to Update Status:",
+                    options=df_goals['ID'].tolist(),
+                    key='goal_ids_to_update'
+                )
+                st.radio(
+                    "New Status:",
+                    ('Draft', 'In Progress', 'Completed', 'Cancelled'),
+                    key='new_goal_status'
+                )
+                st.form_submit_button("Update Goal Status", on_click=update_goal_status, args=(employee_id,))
+
+    elif st.session_state.user_role == 'Employee':
+        # Employee can log tasks for their goals
+        st.subheader("My Goals")
+        df_my_goals = paginated_table(
+            goals_table_key(employee_id),
+            data['goals_page'],
+            ['ID', 'Employee', 'Description', 'Due Date', 'Status']
+        )
+        if not df_my_goals.empty:
+            goal_labels = option_labels(df_my_goals, 'ID', 'Description')
+            with st.expander("Log a New Task for a Goal"):
+                with st.form("task_form"):
+                    st.selectbox(
+                        "Select a Goal to Log a Task for:",
+                        options=df_my_goals['ID'].tolist(),
+                        format_func=lambda x: f"Goal {x}: {goal_labels[x]}...",
+                        index=None,
+                        key='task_goal_id'
+                    )
+                    st.text_area("Task Description:", key='task_description')
+                    st.form_submit_button("Log Task", on_click=log_task, args=(employee_id,))
+        else:
+            st.info("You have no goals assigned yet.")
+
+# --- Task Approval Section (Manager View) ---
+@st.fragment(key='tasks')
+def tasks_section(employee_id):
+    if not section_header('tasks', "Tasks Awaiting Approval"):
+        return
+    show_notices('tasks')
+    data = section_data('tasks', employee_id)
+    df_tasks = paginated_table(
+        f"tasks_{employee_id}",
+        data['tasks_page'],
+        ['Task ID', 'Goal Description', 'Task Description', 'Approved']
+    )
+    if not df_tasks.empty:
+        with st.form("task_approval_form"):
+            st.multiselect(
+                "Select Task IDs to Approve:",
+                options=df_tasks.loc[~df_tasks['Approved'].astype(bool), 'Task ID'].tolist(),
+                key='task_ids_to_approve'
+            )
+            st.form_submit_button("Approve Tasks", on_click=approve_tasks, args=(employee_id,))
+    else:
+        st.info("No tasks to approve.")
+
+# --- Team Section (Manager View) ---
+# Team data covers everyone below the selected employee in the reporting tree.
+@st.fragment(key='team')
+def team_section(employee_id):
+    import pandas as pd
+    if not section_header('team', "Team Overview"):
+        return
+    show_notices('team')
+    data = section_data('team', employee_id)
+    manager = data['manager']
+    st.markdown(f"**Reports to:** {f'{manager[1]} (ID {manager[0]})' if manager else 'Nobody'}")
+    # The expanders below query only while they are open.
+    reporting_expander = st.expander("Change Reporting Line", key='reporting_line_open', on_change="rerun")
+    with reporting_expander:
+        if reporting_expander.open:
+            manager_query = st.text_input("Search for the new manager:", key="manager_query")
+            manager_names = {None: "Nobody (top level)"}
+            manager_names.update(row for row in store.search_employees(manager_query) if row[0] != employee_id)
+            st.selectbox(
+                "New manager:",
+                options=list(manager_names),
+                format_func=lambda manager_id: manager_names[manager_id] if manager_id is None else f"{manager_names[manager_id]} (ID {manager_id})",
+                key='new_manager_id'
+            )
+            st.button("Set Manager", on_click=set_manager, args=(employee_id,))
+
+    team = data['team']
+    if team:
+        col1, col2 = st.columns(2)
+        col1.metric("Team Size", len(team))
+        col2.metric("Direct Reports", sum(1 for row in team if row[3] == 1))
+        team_status_counts = data['team_status_counts']
+        if team_status_counts:
+            df_team_counts = pd.DataFrame(list(team_status_counts.items()), columns=['Status', 'Count'])
+            st.bar_chart(df_team_counts.set_index('Status'))
+        with st.expander("Team Members"):
+            st.dataframe(pd.DataFrame(team, columns=['ID', 'Name', 'Manager ID', 'Level']), use_container_width=True)
+        team_goals_expander = st.expander("Team Goals", key='team_goals_open', on_change="rerun")
+        with team_goals_expander:
+            if team_goals_expander.open:
+                st.dataframe(store.read_team_goals_frame(employee_id), use_container_width=True)
+        team_tasks_expander = st.expander("Team Tasks", key='team_tasks_open', on_change="rerun")
+        with team_tasks_expander:
+            if team_tasks_expander.open:
+                st.dataframe(store.read_team_tasks_frame(employee_id), use_container_width=True)
+    else:
+        st.info("No one reports to this employee.")
+
+# --- Feedback Section ---
+@st.fragment(key='feedback')
+def feedback_section(employee_id):
+    if not section_header('feedback', "Feedback"):
+        return
+    show_notices('feedback')
+    data = section_data('feedback', employee_id)
+
+    if st.session_state.user_role == 'Manager':
+        feedback_expander = st.expander("Provide Feedback", key='provide_feedback_open', on_change="rerun")
+        with feedback_expander:
+            df_goals_feedback = store.read_goals_frame(employee_id) if feedback_expander.open else None
+            if df_goals_feedback is not None and not df_goals_feedback.empty:
+                goal_labels = option_labels(df_goals_feedback, 'ID', 'Description')
+                with st.form("feedback_form"):
+                    st.selectbox(
+                        "Select a Goal to provide feedback on:",
+                        options=df_goals_feedback['ID'].tolist(),
+                        format_func=lambda x: f"Goal {x}: {goal_labels[x]}...",
+                        index=None,
+                        key='feedback_goal_id'
+                    )
+                    st.text_area("Feedback:", key='feedback_text')
+                    st.form_submit_button("Submit Feedback", on_click=submit_feedback, args=(employee_id,))
+            elif df_goals_feedback is not None:
+                st.info("No goals to provide feedback on.")
+
+    elif st.session_state.user_role == 'Employee':
+        st.subheader("My Feedback History")
+        goals_data_for_feedback = data['goals']
+        if goals_data_for_feedback:
+            feedback_by_goal = data['feedback_by_goal']
+            for goal_id, _, description, _, _ in goals_data_for_feedback:
+                feedback_list = feedback_by_goal.get(goal_id)
+                if feedback_list:
+                    st.markdown(f"**Feedback for Goal {goal_id}:** {description}")
+                    for _, text, created_at in feedback_list:
+                        st.markdown(f"> **{created_at.strftime('%Y-%m-%d')}**: {text}")
+        else:
+            st.info("No feedback available yet.")
+
+# --- Reporting Section ---
+@st.fragment(key='history')
+def history_section(employee_id):
+    if not section_header('history', "Performance History Report"):
+        return
+    st.radio("Review cycles:", tuple(HISTORY_CYCLES), index=1, horizontal=True, key='history_cycles')
+    history_data = section_data('history', employee_id)['history']
+    if history_data:
+        for goal in history_data:
+            st.markdown(f"**Goal ID:** {goal['goal_id']}")
+            st.markdown(f"**Description:** {goal['description']}")
+            st.markdown(f"**Due Date:** {goal['due_date']}")
+            st.markdown(f"**Status:** {goal['status']}")
+            st.markdown(f"**Date Created:** {goal['created_at']}")
+            if goal['feedbacks']:
+                st.markdown("**Associated Feedback:**")
+                for feedback_text, created_at in goal['feedbacks']:
+                    st.markdown(f"- {feedback_text} (on {created_at.strftime('%Y-%m-%d')})")
+            st.markdown("---")
+    else:
+        st.info("No performance history to display.")
+
+# Exports stream from PostgreSQL server-side cursors.
+@st.fragment(key='export')
+def export_section(employee_id):
+    from export import EXPORT_DATASETS, EXPORT_FORMATS, export_dataset
+    with st.expander("Export Data"):
+        with st.form("export_form"):
+            export_name = st.selectbox("Dataset:", sorted(EXPORT_DATASETS), index=sorted(EXPORT_DATASETS).index('history'))
+            export_format = st.selectbox("Format:", EXPORT_FORMATS)
+            export_all_employees = st.checkbox("All employees")
+            export_range = st.date_input("Created between (optional):", value=())
+            submit_export = st.form_submit_button("Prepare Export")
+
+        if submit_export:
+            # The export streams into a temporary file; only the finished
+            # file is handed to Streamlit, which serves it from memory.
+            export_file = tempfile.TemporaryFile()
+            row_count = export_dataset(
+                export_name,
+                export_file,
+                fmt=export_format,
+                employee_ids=None if export_all_employees else [employee_id],
+                date_from=export_range[0] if len(export_range) == 2 else None,
+                date_to=export_range[1] if len(export_range) == 2 else None
+            )
+            export_file.seek(0)
+            st.download_button(
+                f"Download {row_count} row(s)",
+                data=export_file.read(),
+                file_name=f"{export_name}.{export_format}"
+            )
+            export_file.close()
+
+# --- Business Insights Section ---
+@st.fragment(key='insights')
+def insights_section(employee_id):
+    import pandas as pd
+    if not section_header('insights', "Business Insights"):
+        return
+    st.write("Leveraging core database functions to provide actionable insights.")
+
+    st.radio(
+        "Scope:",
+        ('Selected Employee', 'Organisation'),
+        horizontal=True,
+        key='insights_scope'
+    )
+    data = section_data('insights', employee_id)
+    summary = data['summary']
+
+    # Goal Status Count (COUNT)
+    if summary.status_counts:
+        st.metric("Total Goals", summary.total_goals)
+        df_counts = pd.DataFrame(list(summary.status_counts.items()), columns=['Status', 'Count'])
+        st.bar_chart(df_counts.set_index('Status'))
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Average Completion Time (AVG)
+        if summary.avg_days_to_complete is not None:
+            st.metric("Avg Days to Complete Goal", f"{summary.avg_days_to_complete:.2f} days")
+        else:
+            st.metric("Avg Days to Complete Goal", "N/A")
+
+        # Total Approved Tasks (SUM/COUNT)
+        st.metric("Total Approved Tasks", summary.approved_tasks)
+
+    with col2:
+        # Min and Max Due Dates (MIN, MAX)
+        if summary.min_due_date and summary.max_due_date:
+            st.markdown(f"**Earliest Due Date:** {summary.min_due_date}")
+            st.markdown(f"**Latest Due Date:** {summary.max_due_date}")
+
+    # Goal Trends (pre-aggregated per week/month)
+    st.radio(
+        "Goal trends over the last year, per:",
+        ('week', 'month'),
+        format_func=str.title,
+        horizontal=True,
+        key='trend_period'
+    )
+    if data['trends']:
+        df_trends = pd.DataFrame(data['trends'], columns=['Period', 'Created', 'Completed', 'Cancelled'])
+        st.line_chart(df_trends.set_index('Period'))
+    else:
+        st.info("No goals were created, completed or cancelled in the last year.")
+
+# --- Main Content Area ---
+st.header(f"You are logged in as a: {st.session_state.user_role}")
+if store.engine == "postgres" and get_circuit_breaker_stats()['state'] != 'closed':
+    st.warning("The database is not reachable right now. Recently loaded data is shown and changes cannot be saved until it is back.")
+
+st.session_state.page_sections = ['search']
+search_section(selected_employee_id, selected_employee_name)
+
+if st.session_state.selected_employee:
+    st.subheader(f"Viewing data for: {selected_employee_name}")
+
+    employee_id = st.session_state.selected_employee
+    sections = ROLE_SECTIONS[st.session_state.user_role]
+    st.session_state.page_sections = ['search', *sections]
+    # A full run fetches every shown section's data concurrently in one
+    # bundle; a section rerunning on its own fetches just its own. Streamlit
+    # only stops a run it has been asked to rerun when the script sends
+    # something, so the bundle clears a placeholder while it waits: a user who
+    # moves on mid-load cancels the queries instead of waiting for them.
+    loading = st.empty()
+    prefetch_sections(sections, employee_id, checkpoint=loading.empty)
+
+    goals_section(employee_id)
+    if st.session_state.user_role == 'Manager':
+        tasks_section(employee_id)
+        team_section(employee_id)
+    feedback_section(employee_id)
+    history_section(employee_id)
+    if store.engine == "postgres":
+        export_section(employee_id)
+    insights_section(employee_id)
+
+else:
+    st.warning("Please select an employee from the sidebar to view their information.")
+
+if 'pending_feedback' in st.session_state:
+    pending_feedback_watch()
+startup.mark('first_run')
@@ -0,0 +1,353 @@
+"""
+In-process instrumentation for database calls.
+
+Every statement executed through the backend's connections is recorded with
+the backend function that issued it, a normalized SQL fingerprint, its
+duration, the number of rows it returned or touched and the time spent
+waiting for a pooled connection. Statistics are aggregated per
+(function, fingerprint) with a latency histogram, slow statements are
+logged with their parameters redacted, and every event is passed to the
+registered metrics hooks (see add_metrics_hook() and render_prometheus()).
+New sessions also record how long their first run takes to reach each phase
+of start-up (see StartupTimer and startup_report()).
+"""
+import contextvars
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2.extensions
+
+SLOW_QUERY_MS = float(os.environ.get("PMS_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("PMS_SLOW_QUERY_LOG_SIZE", "200"))
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+UNLABELLED = "<unlabelled>"
+
+slow_query_logger = logging.getLogger("pms.slow_query")
+
+_current_operation = contextvars.ContextVar("pms_operation", default=UNLABELLED)
+
+# --- Operation Labels ---
+@contextmanager
+def operation(name):
+    """Attributes statements executed inside the block to `name`."""
+    token = _current_operation.set(name)
+    try:
+        yield
+    finally:
+        _current_operation.reset(token)
+
+def current_operation():
+    return _current_operation.get()
+
+def instrumented(function):
+    """Decorator that labels the statements a function executes with its name."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with operation(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+# --- SQL Fingerprints ---
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s")
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(sql):
+    """Normalizes a statement so that executions differing only in values group together."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        sql = str(sql)
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    return _WHITESPACE.sub(" ", sql).strip().rstrip(";")
+
+def redact(params):
+    """Replaces parameter values with their type (and size) so logs never contain data."""
+    def describe(value):
+        if value is None:
+            return None
+        if isinstance(value, (list, tuple)):
+            return f"<{type(value).__name__} of {len(value)}>"
+        if isinstance(value, (str, bytes)):
+            return f"<{type(value).__name__} len={len(value)}>"
+        return f"<{type(value).__name__}>"
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: describe(value) for key, value in params.items()}
+    return [describe(value) for value in params]
+
+# --- Statistics ---
+class _Stat:
+    __slots__ = ("calls", "errors", "total_ms", "max_ms", "rows", "acquire_wait_ms", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.acquire_wait_ms = 0.0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS_MS)
+
+class QueryStats:
+    """Thread-safe aggregate of statement events keyed by (function, fingerprint)."""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_log_size=SLOW_QUERY_LOG_SIZE):
+        self.slow_query_ms = slow_query_ms
+        self._stats = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def record(self, sql, params, duration_ms, rows=None, acquire_wait_ms=0.0, error=None):
+        event = {
+            'function': current_operation(),
+            'fingerprint': fingerprint(sql),
+            'duration_ms': duration_ms,
+            'rows': rows,
+            'acquire_wait_ms': acquire_wait_ms,
+            'error': error,
+            'timestamp': time.time(),
+        }
+        key = (event['function'], event['fingerprint'])
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = self._stats[key] = _Stat()
+            stat.calls += 1
+            stat.total_ms += duration_ms
+            stat.max_ms = max(stat.max_ms, duration_ms)
+            stat.acquire_wait_ms += acquire_wait_ms
+            if rows is not None and rows >= 0:
+                stat.rows += rows
+            if error is not None:
+                stat.errors += 1
+            for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+                if duration_ms <= bound:
+                    stat.buckets[i] += 1
+                    break
+            hooks = list(self._hooks)
+        if duration_ms >= self.slow_query_ms:
+            event['params'] = redact(params)
+            with self._lock:
+                self._slow.append(event)
+            slow_query_logger.warning(
+                "slow query in %s: %.1f ms (acquire wait %.1f ms, rows %s): %s params=%s",
+                event['function'], duration_ms, acquire_wait_ms, rows, event['fingerprint'], event['params']
+            )
+        for hook in hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                print(f"Error in metrics hook {hook!r}: {e}")
+
+    def add_hook(self, hook):
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def top(self, limit=20, order_by='total_ms'):
+        """Returns the heaviest (function, fingerprint) groups as dicts, heaviest first."""
+        with self._lock:
+            rows = [
+                {
+                    'function': function,
+                    'fingerprint': sql,
+                    'calls': stat.calls,
+                    'errors': stat.errors,
+                    'total_ms': stat.total_ms,
+                    'mean_ms': stat.total_ms / stat.calls,
+                    'max_ms': stat.max_ms,
+                    'rows': stat.rows,
+                    'acquire_wait_ms': stat.acquire_wait_ms,
+                    'histogram': dict(zip(HISTOGRAM_BUCKETS_MS, stat.buckets)),
+                }
+                for (function, sql), stat in self._stats.items()
+            ]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:limit]
+
+    def slow_queries(self):
+        """Returns the most recent slow statements, newest first."""
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+    def render_prometheus(self):
+        """Renders the aggregates in the Prometheus text exposition format."""
+        def label(value):
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+        lines = [
+            "# HELP pms_db_query_duration_seconds Database statement latency.",
+            "# TYPE pms_db_query_duration_seconds histogram",
+        ]
+        with self._lock:
+            items = [(key, stat.calls, stat.total_ms, list(stat.buckets), stat.rows, stat.errors, stat.acquire_wait_ms)
+                     for key, stat in self._stats.items()]
+        for (function, sql), calls, total_ms, buckets, rows, errors, wait_ms in items:
+            labels = f'function="{label(function)}",query="{label(sql)}"'
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BUCKETS_MS, buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound / 1000)
+                lines.append(f'pms_db_query_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"pms_db_query_duration_seconds_sum{{{labels}}} {total_ms / 1000}")
+            lines.append(f"pms_db_query_duration_seconds_count{{{labels}}} {calls}")
+        lines += ["# HELP pms_db_query_rows_total Rows returned or affected.", "# TYPE pms_db_query_rows_total counter"]
+        lines += [f'pms_db_query_rows_total{{function="{label(f)}",query="{label(q)}"}} {r}' for (f, q), _, _, _, r, _, _ in items]
+        lines += ["# HELP pms_db_query_errors_total Failed statements.", "# TYPE pms_db_query_errors_total counter"]
+        lines += [f'pms_db_query_errors_total{{function="{label(f)}",query="{label(q)}"}} {e}' for (f, q), _, _, _, _, e, _ in items]
+        lines += ["# HELP pms_db_acquire_wait_seconds_total Time spent waiting for a pooled connection.",
+                  "# TYPE pms_db_acquire_wait_seconds_total counter"]
+        lines += [f'pms_db_acquire_wait_seconds_total{{function="{label(f)}",query="{label(q)}"}} {w / 1000}' for (f, q), _, _, _, _, _, w in items]
+        return "\n".join(lines) + "\n"
+
+query_stats = QueryStats()
+
+def add_metrics_hook(hook):
+    """Registers `hook(event)` to be called with a dict for every statement executed."""
+    query_stats.add_hook(hook)
+
+def remove_metrics_hook(hook):
+    query_stats.remove_hook(hook)
+
+def top_queries(limit=20, order_by='total_ms'):
+    return query_stats.top(limit, order_by)
+
+def slow_queries():
+    return query_stats.slow_queries()
+
+# --- Start-up Timings ---
+# Recent samples kept per phase for the start-up percentiles.
+STARTUP_SAMPLE_SIZE = 1000
+STARTUP_QUANTILES = (0.5, 0.95, 0.99)
+
+class StartupTimings:
+    """
+    Thread-safe recent samples of how long new sessions take to reach each
+    phase of their first run, in milliseconds since the run started.
+    """
+
+    def __init__(self, sample_size=STARTUP_SAMPLE_SIZE):
+        self._samples = {}
+        self._sample_size = sample_size
+        self._lock = threading.Lock()
+
+    def record(self, phase, duration_ms):
+        with self._lock:
+            samples = self._samples.get(phase)
+            if samples is None:
+                samples = self._samples[phase] = deque(maxlen=self._sample_size)
+            samples.append(duration_ms)
+
+    def report(self):
+        """Returns a dict per phase, in the order phases were first reached, with percentiles of its samples."""
+        with self._lock:
+            items = [(phase, sorted(samples)) for phase, samples in self._samples.items()]
+        rows = []
+        for phase, samples in items:
+            row = {'phase': phase, 'sessions': len(samples)}
+            for quantile in STARTUP_QUANTILES:
+                row[f'p{quantile * 100:g}_ms'] = samples[min(len(samples) - 1, int(quantile * len(samples)))]
+            row['max_ms'] = samples[-1]
+            rows.append(row)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP pms_session_startup_seconds Time from the start of a new session's first run to each phase.",
+            "# TYPE pms_session_startup_seconds summary",
+        ]
+        for row in self.report():
+            labels = f'phase="{row["phase"]}"'
+            for quantile in STARTUP_QUANTILES:
+                lines.append(f'pms_session_startup_seconds{{{labels},quantile="{quantile:g}"}} {row[f"p{quantile * 100:g}_ms"] / 1000}')
+            lines.append(f"pms_session_startup_seconds_count{{{labels}}} {row['sessions']}")
+        return "\n".join(lines) + "\n"
+
+class StartupTimer:
+    """
+    Marks the phases of one run started at `started` (a time.perf_counter()
+    value), each phase once; does nothing unless `record` is true, so a
+    script can mark its phases on every run and record only a session's first.
+    """
+
+    def __init__(self, started, record=True, timings=None):
+        self.started = started
+        self.record = record
+        self._timings = startup_timings if timings is None else timings
+        self._marked = set()
+
+    def mark(self, phase):
+        if self.record and phase not in self._marked:
+            self._marked.add(phase)
+            self._timings.record(phase, (time.perf_counter() - self.started) * 1000)
+
+startup_timings = StartupTimings()
+
+def startup_report():
+    return startup_timings.report()
+
+def render_prometheus():
+    return query_stats.render_prometheus() + startup_timings.render_prometheus()
+
+def reset():
+    query_stats.reset()
+    startup_timings.reset()
+
+# --- psycopg2 Integration ---
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """A cursor that reports every execute/copy to query_stats."""
+
+    def _timed(self, run, sql, params):
+        # The first statement on a fresh checkout carries the pool wait.
+        wait_ms = getattr(self.connection, 'pending_acquire_wait_ms', 0.0)
+        self.connection.pending_acquire_wait_ms = 0.0
+        started = time.perf_counter()
+        try:
+            result = run()
+        except Exception as e:
+            query_stats.record(sql, params, (time.perf_counter() - started) * 1000,
+                               acquire_wait_ms=wait_ms, error=type(e).__name__)
+            raise
+        query_stats.record(sql, params, (time.perf_counter() - started) * 1000,
+                           rows=self.rowcount, acquire_wait_ms=wait_ms)
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(lambda: super(InstrumentedCursor, self).execute(query, vars), query, vars)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(lambda: super(InstrumentedCursor, self).copy_expert(sql, file, size), sql, None)
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """A connection whose cursors are InstrumentedCursors by default."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
+        self.pending_acquire_wait_ms = 0.0
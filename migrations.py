@@ -0,0 +1,851 @@
+"""
+Versioned schema migrations for the PMS database.
+
+Each migration has an integer version and is applied at most once; applied
+versions are recorded in the schema_version table. Run from the command line:
+
+    python migrations.py upgrade     # apply every pending migration
+    python migrations.py status      # list applied and pending migrations
+
+The app applies pending migrations when a server process starts. Deployments
+that run `upgrade` themselves can set PMS_SCHEMA_UPGRADE=check so that server
+processes only check schema_version (see backend.prepare_schema()).
+"""
+import argparse
+import time
+from collections import namedtuple
+
+import psycopg2
+
+import backend
+
+# Arbitrary application-wide key so that concurrent runners serialize.
+MIGRATION_LOCK_KEY = 4_771_001
+# Serializes reporting line changes (migration 12).
+HIERARCHY_LOCK_KEY = 4_771_002
+# How often a runner waiting for another's migration lock tries again.
+MIGRATION_LOCK_POLL_SECONDS = 0.2
+
+# A migration step is either a SQL string or a callable taking a cursor.
+# Transactional migrations run all their steps and the version bookkeeping in
+# one transaction. Non-transactional ones (needed for CREATE INDEX
+# CONCURRENTLY) run each step in autocommit mode, so every step must be
+# idempotent on its own.
+Migration = namedtuple("Migration", ["version", "name", "steps", "transactional"])
+
+def optional_extension(extension):
+    """
+    Returns a step that installs an extension if the server ships it.
+    Features built on it must check pg_extension and degrade without it.
+    """
+    def step(cur):
+        cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = %s;", (extension,))
+        if cur.fetchone() is None:
+            print(f"Extension {extension} is not available on this server; skipping it.")
+            return
+        cur.execute(f"CREATE EXTENSION IF NOT EXISTS {extension};")
+    step.__name__ = f"create extension {extension}"
+    return step
+
+def _index_valid(cur, name):
+    """Returns whether index `name` is valid, or None if it does not exist."""
+    cur.execute(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = %s AND pg_catalog.pg_table_is_visible(c.oid);",
+        (name,)
+    )
+    row = cur.fetchone()
+    return None if row is None else row[0]
+
+def _build_index(cur, name, table, definition, where):
+    valid = _index_valid(cur, name)
+    if valid:
+        return
+    if valid is not None:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+    sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}"
+    if where:
+        sql += f" WHERE {where}"
+    cur.execute(sql + ";")
+
+def _build_partitioned_index(cur, name, table, definition, where):
+    """
+    Partitioned tables (see partitioning.py) do not support CREATE INDEX
+    CONCURRENTLY: the index is created on the parent alone, where it stays
+    invalid, built concurrently on each partition and attached to it, which
+    makes it valid once every partition has its index.
+    """
+    if _index_valid(cur, name):
+        return
+    sql = f"CREATE INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}"
+    if where:
+        sql += f" WHERE {where}"
+    cur.execute(sql + ";")
+    cur.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass;",
+        (table,)
+    )
+    for (partition,) in cur.fetchall():
+        partition_index = name.replace(table, partition, 1) if name.startswith(table) else f"{partition}_{name}"
+        _build_index(cur, partition_index, partition, definition, where)
+        cur.execute(
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = %s::regclass;",
+            (partition_index, name)
+        )
+        if cur.fetchone() is None:
+            cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index};")
+
+def concurrent_index(name, table, definition, where=None, requires=None):
+    """
+    Returns a step that builds an index with CREATE INDEX CONCURRENTLY.
+    An invalid index left behind by an interrupted build is dropped first so
+    the step can simply be retried. With `requires`, the index is skipped
+    unless that extension is installed.
+    """
+    def step(cur):
+        if requires:
+            cur.execute("SELECT 1 FROM pg_extension WHERE extname = %s;", (requires,))
+            if cur.fetchone() is None:
+                return
+        cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+        row = cur.fetchone()
+        if row and row[0]:
+            _build_partitioned_index(cur, name, table, definition, where)
+        else:
+            _build_index(cur, name, table, definition, where)
+    step.__name__ = f"create index {name}"
+    return step
+
+MIGRATIONS = [
+    Migration(1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS employees (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS goals (
+            id SERIAL PRIMARY KEY,
+            employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+            description TEXT NOT NULL,
+            due_date DATE,
+            status VARCHAR(50) NOT NULL DEFAULT 'Draft',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            goal_id INTEGER REFERENCES goals(id) ON DELETE CASCADE,
+            employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+            description TEXT NOT NULL,
+            is_approved BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS feedback (
+            id SERIAL PRIMARY KEY,
+            goal_id INTEGER REFERENCES goals(id) ON DELETE CASCADE,
+            manager_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+            feedback_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+    ], True),
+    Migration(2, "indexes for hot read queries", [
+        # read_goals(employee_id): filter + ORDER BY due_date
+        concurrent_index("goals_employee_due_date_idx", "goals", "(employee_id, due_date)"),
+        # get_performance_history(employee_id): filter + ORDER BY created_at
+        concurrent_index("goals_employee_created_at_idx", "goals", "(employee_id, created_at)"),
+        # read_tasks(employee_id=...)
+        concurrent_index("tasks_employee_created_at_idx", "tasks", "(employee_id, created_at)"),
+        # read_tasks(goal_id=...)
+        concurrent_index("tasks_goal_created_at_idx", "tasks", "(goal_id, created_at)"),
+        # read_feedback(goal_id) and read_feedback_for_goals()
+        concurrent_index("feedback_goal_created_at_idx", "feedback", "(goal_id, created_at)"),
+        # get_total_tasks_approved(): small index covering only approved tasks
+        concurrent_index("tasks_approved_idx", "tasks", "(employee_id)", where="is_approved"),
+    ], False),
+    Migration(3, "keyset pagination indexes", [
+        # read_goals_page()/read_tasks_page() without a filter walk these
+        # backwards; the id column makes the page order fully index-ordered.
+        concurrent_index("goals_due_date_id_idx", "goals", "(due_date, id)"),
+        concurrent_index("tasks_created_at_id_idx", "tasks", "(created_at, id)"),
+    ], False),
+    Migration(4, "dashboard summary tables", [
+        # Per-employee and organisation-wide (employee_id 0) aggregates behind
+        # get_dashboard_summary(). Counters are maintained as deltas by
+        # statement-level triggers; min/max due dates are re-read from the
+        # (employee_id, due_date) and (due_date, id) indexes.
+        """
+        CREATE TABLE IF NOT EXISTS goal_summary (
+            employee_id INTEGER PRIMARY KEY,
+            completion_seconds_sum NUMERIC NOT NULL DEFAULT 0,
+            completion_count BIGINT NOT NULL DEFAULT 0,
+            approved_tasks BIGINT NOT NULL DEFAULT 0,
+            min_due_date DATE,
+            max_due_date DATE
+        );
+
+        CREATE TABLE IF NOT EXISTS goal_status_summary (
+            employee_id INTEGER NOT NULL,
+            status VARCHAR(50) NOT NULL,
+            goal_count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (employee_id, status)
+        );
+
+        DO $$ BEGIN
+            CREATE TYPE pms_summary_delta AS (
+                employee_id INTEGER,
+                status VARCHAR(50),
+                goal_count INTEGER,
+                completion_seconds NUMERIC,
+                completion_count INTEGER,
+                approved_tasks INTEGER,
+                touches_goals BOOLEAN
+            );
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION pms_goal_delta(g goals, sign INTEGER) RETURNS pms_summary_delta AS $$
+            SELECT ROW(
+                g.employee_id, g.status, sign,
+                CASE WHEN g.status = 'Completed' THEN sign * EXTRACT(EPOCH FROM (g.due_date - g.created_at)) END,
+                CASE WHEN g.status = 'Completed' AND g.due_date IS NOT NULL AND g.created_at IS NOT NULL THEN sign ELSE 0 END,
+                0, TRUE
+            )::pms_summary_delta;
+        $$ LANGUAGE sql IMMUTABLE;
+
+        CREATE OR REPLACE FUNCTION pms_task_delta(t tasks, sign INTEGER) RETURNS pms_summary_delta AS $$
+            SELECT ROW(
+                t.employee_id, NULL, 0, NULL, 0,
+                CASE WHEN t.is_approved THEN sign ELSE 0 END, FALSE
+            )::pms_summary_delta;
+        $$ LANGUAGE sql IMMUTABLE;
+
+        CREATE OR REPLACE FUNCTION pms_apply_summary_deltas(deltas pms_summary_delta[]) RETURNS void AS $$
+        BEGIN
+            INSERT INTO goal_status_summary (employee_id, status, goal_count)
+            SELECT scope.employee_id, d.status, SUM(d.goal_count)
+            FROM unnest(deltas) d, LATERAL (VALUES (d.employee_id), (0)) AS scope(employee_id)
+            WHERE d.status IS NOT NULL AND scope.employee_id IS NOT NULL
+            GROUP BY scope.employee_id, d.status
+            HAVING SUM(d.goal_count) <> 0
+            ORDER BY 1, 2
+            ON CONFLICT (employee_id, status)
+            DO UPDATE SET goal_count = goal_status_summary.goal_count + EXCLUDED.goal_count;
+
+            INSERT INTO goal_summary (employee_id, completion_seconds_sum, completion_count, approved_tasks)
+            SELECT scope.employee_id, COALESCE(SUM(d.completion_seconds), 0),
+                   SUM(d.completion_count), SUM(d.approved_tasks)
+            FROM unnest(deltas) d, LATERAL (VALUES (d.employee_id), (0)) AS scope(employee_id)
+            WHERE scope.employee_id IS NOT NULL
+            GROUP BY scope.employee_id
+            ORDER BY 1
+            ON CONFLICT (employee_id) DO UPDATE SET
+                completion_seconds_sum = goal_summary.completion_seconds_sum + EXCLUDED.completion_seconds_sum,
+                completion_count = goal_summary.completion_count + EXCLUDED.completion_count,
+                approved_tasks = goal_summary.approved_tasks + EXCLUDED.approved_tasks;
+
+            UPDATE goal_summary s SET
+                min_due_date = CASE WHEN s.employee_id = 0
+                    THEN (SELECT MIN(due_date) FROM goals)
+                    ELSE (SELECT MIN(due_date) FROM goals g WHERE g.employee_id = s.employee_id) END,
+                max_due_date = CASE WHEN s.employee_id = 0
+                    THEN (SELECT MAX(due_date) FROM goals)
+                    ELSE (SELECT MAX(due_date) FROM goals g WHERE g.employee_id = s.employee_id) END
+            WHERE s.employee_id IN (
+                SELECT scope.employee_id
+                FROM unnest(deltas) d, LATERAL (VALUES (d.employee_id), (0)) AS scope(employee_id)
+                WHERE d.touches_goals
+            );
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION pms_goals_summary_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pms_apply_summary_deltas(ARRAY(SELECT pms_goal_delta(n, 1) FROM new_rows n));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM pms_apply_summary_deltas(ARRAY(SELECT pms_goal_delta(o, -1) FROM old_rows o));
+            ELSE
+                PERFORM pms_apply_summary_deltas(ARRAY(
+                    SELECT pms_goal_delta(o, -1) FROM old_rows o
+                    UNION ALL
+                    SELECT pms_goal_delta(n, 1) FROM new_rows n
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION pms_tasks_summary_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pms_apply_summary_deltas(ARRAY(SELECT pms_task_delta(n, 1) FROM new_rows n WHERE n.is_approved));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM pms_apply_summary_deltas(ARRAY(SELECT pms_task_delta(o, -1) FROM old_rows o WHERE o.is_approved));
+            ELSE
+                PERFORM pms_apply_summary_deltas(ARRAY(
+                    SELECT pms_task_delta(o, -1) FROM old_rows o WHERE o.is_approved
+                    UNION ALL
+                    SELECT pms_task_delta(n, 1) FROM new_rows n WHERE n.is_approved
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        # Transition tables require one trigger per event.
+        """
+        DROP TRIGGER IF EXISTS goals_summary_insert ON goals;
+        DROP TRIGGER IF EXISTS goals_summary_update ON goals;
+        DROP TRIGGER IF EXISTS goals_summary_delete ON goals;
+        CREATE TRIGGER goals_summary_insert AFTER INSERT ON goals
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_goals_summary_trigger();
+        CREATE TRIGGER goals_summary_update AFTER UPDATE ON goals
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_goals_summary_trigger();
+        CREATE TRIGGER goals_summary_delete AFTER DELETE ON goals
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_goals_summary_trigger();
+
+        DROP TRIGGER IF EXISTS tasks_summary_insert ON tasks;
+        DROP TRIGGER IF EXISTS tasks_summary_update ON tasks;
+        DROP TRIGGER IF EXISTS tasks_summary_delete ON tasks;
+        CREATE TRIGGER tasks_summary_insert AFTER INSERT ON tasks
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_tasks_summary_trigger();
+        CREATE TRIGGER tasks_summary_update AFTER UPDATE ON tasks
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_tasks_summary_trigger();
+        CREATE TRIGGER tasks_summary_delete AFTER DELETE ON tasks
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_tasks_summary_trigger();
+        """,
+        # Backfill after the triggers exist: CREATE TRIGGER holds a lock that
+        # blocks writers until this transaction commits, so nothing is missed.
+        """
+        TRUNCATE goal_summary, goal_status_summary;
+        SELECT pms_apply_summary_deltas(ARRAY(
+            SELECT pms_goal_delta(g, 1) FROM goals g
+            UNION ALL
+            SELECT pms_task_delta(t, 1) FROM tasks t WHERE t.is_approved
+        ));
+        """,
+    ], True),
+    Migration(5, "employee name search indexes", [
+        optional_extension("pg_trgm"),
+        # get_all_employees() and search_employees('') walk names in order
+        concurrent_index("employees_name_id_idx", "employees", "(name, id)"),
+        # search_employees(): case-insensitive prefix matches
+        concurrent_index("employees_lower_name_prefix_idx", "employees", "(lower(name) text_pattern_ops)"),
+        # search_employees(): substring and fuzzy matches, when pg_trgm is installed
+        concurrent_index("employees_lower_name_trgm_idx", "employees", "USING gin (lower(name) gin_trgm_ops)",
+                         requires="pg_trgm"),
+    ], False),
+    Migration(6, "change notifications", [
+        # Every committed write NOTIFYs pms_changes with the tables it touched
+        # and the employee and goal ids involved, so that each app process can
+        # evict exactly the cached reads affected (see backend.ChangeListener).
+        # Payloads over the NOTIFY size limit, TRUNCATE and employee deletes
+        # (which cascade everywhere) ask for whole tables to be evicted.
+        """
+        CREATE OR REPLACE FUNCTION pms_notify_changes(tables TEXT[], employee_ids INTEGER[], goal_ids INTEGER[]) RETURNS void AS $$
+        BEGIN
+            -- 500 ids keep the payload well under the 8000 byte NOTIFY limit.
+            IF employee_ids IS NULL AND goal_ids IS NULL
+               OR COALESCE(cardinality(employee_ids), 0) + COALESCE(cardinality(goal_ids), 0) > 500 THEN
+                PERFORM pg_notify('pms_changes', json_build_object('tables', tables, 'all', TRUE)::TEXT);
+            ELSE
+                PERFORM pg_notify('pms_changes', json_build_object('tables', tables, 'employees', employee_ids, 'goals', goal_ids)::TEXT);
+            END IF;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION pms_change_trigger() RETURNS trigger AS $$
+        DECLARE
+            changed TEXT;
+            employee_column TEXT;
+            goal_column TEXT;
+            employee_ids INTEGER[];
+            goal_ids INTEGER[];
+            tables TEXT[] := ARRAY[TG_TABLE_NAME::TEXT];
+        BEGIN
+            IF TG_OP = 'TRUNCATE' OR (TG_TABLE_NAME = 'employees' AND TG_OP = 'DELETE') THEN
+                IF TG_TABLE_NAME = 'employees' THEN
+                    tables := ARRAY['employees', 'goals', 'tasks', 'feedback'];
+                END IF;
+                PERFORM pms_notify_changes(tables, NULL, NULL);
+                RETURN NULL;
+            END IF;
+            changed := CASE TG_OP
+                WHEN 'INSERT' THEN 'SELECT * FROM new_rows'
+                WHEN 'DELETE' THEN 'SELECT * FROM old_rows'
+                ELSE 'SELECT * FROM old_rows UNION ALL SELECT * FROM new_rows'
+            END;
+            employee_column := CASE TG_TABLE_NAME WHEN 'employees' THEN 'id' WHEN 'feedback' THEN NULL ELSE 'employee_id' END;
+            goal_column := CASE TG_TABLE_NAME WHEN 'employees' THEN NULL WHEN 'goals' THEN 'id' ELSE 'goal_id' END;
+            IF goal_column IS NOT NULL THEN
+                EXECUTE format('SELECT array_agg(DISTINCT %I) FROM (%s) c WHERE %I IS NOT NULL', goal_column, changed, goal_column)
+                    INTO goal_ids;
+            END IF;
+            IF employee_column IS NOT NULL THEN
+                EXECUTE format('SELECT array_agg(DISTINCT %I) FROM (%s) c WHERE %I IS NOT NULL', employee_column, changed, employee_column)
+                    INTO employee_ids;
+            ELSE
+                -- feedback is cached per goal owner
+                SELECT array_agg(DISTINCT employee_id) INTO employee_ids FROM goals WHERE id = ANY(goal_ids);
+            END IF;
+            IF employee_ids IS NULL AND goal_ids IS NULL THEN
+                RETURN NULL;
+            END IF;
+            IF TG_TABLE_NAME = 'goals' AND TG_OP = 'DELETE' THEN
+                -- tasks and feedback of deleted goals go with them (ON DELETE CASCADE)
+                tables := ARRAY['goals', 'tasks', 'feedback'];
+            END IF;
+            PERFORM pms_notify_changes(tables, COALESCE(employee_ids, '{}'), COALESCE(goal_ids, '{}'));
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        # Transition tables require one trigger per event.
+        "".join(
+            f"""
+            DROP TRIGGER IF EXISTS {table}_notify_insert ON {table};
+            DROP TRIGGER IF EXISTS {table}_notify_update ON {table};
+            DROP TRIGGER IF EXISTS {table}_notify_delete ON {table};
+            DROP TRIGGER IF EXISTS {table}_notify_truncate ON {table};
+            CREATE TRIGGER {table}_notify_insert AFTER INSERT ON {table}
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION pms_change_trigger();
+            CREATE TRIGGER {table}_notify_update AFTER UPDATE ON {table}
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION pms_change_trigger();
+            CREATE TRIGGER {table}_notify_delete AFTER DELETE ON {table}
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION pms_change_trigger();
+            CREATE TRIGGER {table}_notify_truncate AFTER TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION pms_change_trigger();
+            """
+            for table in ("employees", "goals", "tasks", "feedback")
+        ),
+    ], True),
+    Migration(7, "goal trend rollups", [
+        # Goals created, completed and cancelled per week and per month, for
+        # each employee and organisation-wide (employee_id 0), behind
+        # get_goal_trends(). Like the dashboard summary tables, the counters
+        # are kept as deltas by statement-level triggers. A completion or
+        # cancellation is dated by status_changed_at, which a row trigger
+        # stamps when the status changes; NULL (every goal that has not
+        # changed status since this migration) means "at creation".
+        """
+        ALTER TABLE goals ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMP;
+
+        CREATE TABLE IF NOT EXISTS goal_trend_rollup (
+            employee_id INTEGER NOT NULL,
+            period VARCHAR(5) NOT NULL,
+            bucket DATE NOT NULL,
+            created_count BIGINT NOT NULL DEFAULT 0,
+            completed_count BIGINT NOT NULL DEFAULT 0,
+            cancelled_count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (employee_id, period, bucket)
+        );
+
+        DO $$ BEGIN
+            CREATE TYPE pms_trend_event AS (
+                employee_id INTEGER,
+                event TEXT,
+                happened_at TIMESTAMP,
+                delta INTEGER
+            );
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION pms_goal_status_changed_trigger() RETURNS trigger AS $$
+        BEGIN
+            NEW.status_changed_at := CURRENT_TIMESTAMP;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION pms_goal_trend_events(g goals, sign INTEGER) RETURNS SETOF pms_trend_event AS $$
+            SELECT ROW(g.employee_id, 'created', g.created_at, sign)::pms_trend_event
+            WHERE g.created_at IS NOT NULL
+            UNION ALL
+            SELECT ROW(g.employee_id, lower(g.status), COALESCE(g.status_changed_at, g.created_at), sign)::pms_trend_event
+            WHERE g.status IN ('Completed', 'Cancelled') AND COALESCE(g.status_changed_at, g.created_at) IS NOT NULL;
+        $$ LANGUAGE sql IMMUTABLE;
+
+        CREATE OR REPLACE FUNCTION pms_apply_trend_events(events pms_trend_event[]) RETURNS void AS $$
+            INSERT INTO goal_trend_rollup (employee_id, period, bucket, created_count, completed_count, cancelled_count)
+            SELECT scope.employee_id, p.period, date_trunc(p.period, e.happened_at)::DATE,
+                   COALESCE(SUM(e.delta) FILTER (WHERE e.event = 'created'), 0),
+                   COALESCE(SUM(e.delta) FILTER (WHERE e.event = 'completed'), 0),
+                   COALESCE(SUM(e.delta) FILTER (WHERE e.event = 'cancelled'), 0)
+            FROM unnest(events) e,
+                 LATERAL (VALUES (e.employee_id), (0)) AS scope(employee_id),
+                 (VALUES ('week'), ('month')) AS p(period)
+            WHERE scope.employee_id IS NOT NULL
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+            ON CONFLICT (employee_id, period, bucket) DO UPDATE SET
+                created_count = goal_trend_rollup.created_count + EXCLUDED.created_count,
+                completed_count = goal_trend_rollup.completed_count + EXCLUDED.completed_count,
+                cancelled_count = goal_trend_rollup.cancelled_count + EXCLUDED.cancelled_count;
+        $$ LANGUAGE sql;
+
+        CREATE OR REPLACE FUNCTION pms_goals_trend_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pms_apply_trend_events(ARRAY(SELECT e FROM new_rows n, pms_goal_trend_events(n, 1) e));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM pms_apply_trend_events(ARRAY(SELECT e FROM old_rows o, pms_goal_trend_events(o, -1) e));
+            ELSE
+                PERFORM pms_apply_trend_events(ARRAY(
+                    SELECT e FROM old_rows o, pms_goal_trend_events(o, -1) e
+                    UNION ALL
+                    SELECT e FROM new_rows n, pms_goal_trend_events(n, 1) e
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        """
+        DROP TRIGGER IF EXISTS goals_status_changed ON goals;
+        CREATE TRIGGER goals_status_changed BEFORE UPDATE OF status ON goals
+            FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+            EXECUTE FUNCTION pms_goal_status_changed_trigger();
+
+        DROP TRIGGER IF EXISTS goals_trend_insert ON goals;
+        DROP TRIGGER IF EXISTS goals_trend_update ON goals;
+        DROP TRIGGER IF EXISTS goals_trend_delete ON goals;
+        CREATE TRIGGER goals_trend_insert AFTER INSERT ON goals
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_goals_trend_trigger();
+        CREATE TRIGGER goals_trend_update AFTER UPDATE ON goals
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_goals_trend_trigger();
+        CREATE TRIGGER goals_trend_delete AFTER DELETE ON goals
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_goals_trend_trigger();
+        """,
+        # Backfill after the triggers exist (see migration 4).
+        """
+        TRUNCATE goal_trend_rollup;
+        SELECT pms_apply_trend_events(ARRAY(SELECT e FROM goals g, pms_goal_trend_events(g, 1) e));
+        """,
+    ], True),
+    Migration(8, "reporting lines", [
+        # employees.manager_id is the reporting line; employee_hierarchy is its
+        # closure: one row per (manager, report at any depth) plus a depth-0
+        # row per employee, so a whole reporting tree is one indexed range of
+        # (ancestor_id, descendant_id). A statement-level trigger rebuilds the
+        # closure rows of every employee whose manager changed, together with
+        # everyone below them, and rejects changes that would form a cycle.
+        """
+        ALTER TABLE employees ADD COLUMN IF NOT EXISTS manager_id INTEGER REFERENCES employees(id) ON DELETE SET NULL;
+        DO $$ BEGIN
+            ALTER TABLE employees ADD CONSTRAINT employees_manager_not_self CHECK (manager_id <> id);
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$;
+
+        CREATE TABLE IF NOT EXISTS employee_hierarchy (
+            ancestor_id INTEGER NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+            descendant_id INTEGER NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (ancestor_id, descendant_id)
+        );
+        CREATE INDEX IF NOT EXISTS employee_hierarchy_descendant_idx ON employee_hierarchy (descendant_id);
+
+        DO $$ BEGIN
+            CREATE TYPE pms_hierarchy_link AS (
+                ancestor_id INTEGER,
+                descendant_id INTEGER,
+                depth INTEGER
+            );
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION pms_rebuild_hierarchy(employee_ids INTEGER[]) RETURNS void AS $$
+        DECLARE
+            affected INTEGER[];
+            links pms_hierarchy_link[];
+            cyclic BOOLEAN;
+        BEGIN
+            -- The employees themselves and everyone below them, as the closure stood.
+            SELECT array_agg(DISTINCT a.id) INTO affected FROM (
+                SELECT unnest(employee_ids) AS id
+                UNION ALL
+                SELECT h.descendant_id FROM employee_hierarchy h WHERE h.ancestor_id = ANY(employee_ids)
+            ) a;
+            IF affected IS NULL THEN
+                RETURN;
+            END IF;
+            DELETE FROM employee_hierarchy WHERE descendant_id = ANY(affected);
+
+            WITH RECURSIVE chain(ancestor_id, descendant_id, depth) AS (
+                SELECT e.id, e.id, 0 FROM employees e WHERE e.id = ANY(affected)
+                UNION ALL
+                SELECT e.manager_id, c.descendant_id, c.depth + 1
+                FROM chain c JOIN employees e ON e.id = c.ancestor_id
+                WHERE e.manager_id IS NOT NULL
+            ) CYCLE ancestor_id SET is_cycle USING path
+            SELECT array_agg(ROW(ancestor_id, descendant_id, depth)::pms_hierarchy_link) FILTER (WHERE NOT is_cycle),
+                   bool_or(is_cycle)
+            INTO links, cyclic
+            FROM chain;
+            IF cyclic THEN
+                RAISE EXCEPTION 'reporting lines would form a cycle' USING ERRCODE = 'check_violation';
+            END IF;
+            INSERT INTO employee_hierarchy (ancestor_id, descendant_id, depth)
+            SELECT l.ancestor_id, l.descendant_id, l.depth FROM unnest(links) l;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION pms_employees_hierarchy_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pms_rebuild_hierarchy(ARRAY(SELECT n.id FROM new_rows n));
+            ELSE
+                PERFORM pms_rebuild_hierarchy(ARRAY(
+                    SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                    WHERE n.manager_id IS DISTINCT FROM o.manager_id
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        # Deleted employees lose their closure rows by ON DELETE CASCADE; their
+        # reports become top-level (ON DELETE SET NULL fires the update trigger).
+        """
+        DROP TRIGGER IF EXISTS employees_hierarchy_insert ON employees;
+        DROP TRIGGER IF EXISTS employees_hierarchy_update ON employees;
+        CREATE TRIGGER employees_hierarchy_insert AFTER INSERT ON employees
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_employees_hierarchy_trigger();
+        CREATE TRIGGER employees_hierarchy_update AFTER UPDATE ON employees
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION pms_employees_hierarchy_trigger();
+        """,
+        # Backfill after the triggers exist (see migration 4).
+        """
+        TRUNCATE employee_hierarchy;
+        SELECT pms_rebuild_hierarchy(ARRAY(SELECT id FROM employees));
+        """,
+    ], True),
+    Migration(9, "reporting line indexes", [
+        # get_team() direct reports and ON DELETE SET NULL of a manager
+        concurrent_index("employees_manager_id_idx", "employees", "(manager_id)"),
+    ], False),
+    Migration(10, "full-text search columns", [
+        # search_records(): English-stemmed documents kept in step with the
+        # text by PostgreSQL itself. Adding a stored column rewrites each
+        # table once, under an exclusive lock.
+        """
+        ALTER TABLE goals ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(description, ''))) STORED;
+        ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(description, ''))) STORED;
+        ALTER TABLE feedback ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(feedback_text, ''))) STORED;
+        """,
+    ], True),
+    Migration(11, "full-text search indexes", [
+        concurrent_index("goals_search_vector_idx", "goals", "USING gin (search_vector)"),
+        concurrent_index("tasks_search_vector_idx", "tasks", "USING gin (search_vector)"),
+        concurrent_index("feedback_search_vector_idx", "feedback", "USING gin (search_vector)"),
+    ], False),
+    Migration(12, "serialized reporting line changes", [
+        # Two transactions changing reporting lines could each pass the cycle
+        # check against a snapshot without the other's change (X under Y and
+        # Y under X). The rebuild now waits for the others to commit first;
+        # in READ COMMITTED its later statements then see their changes.
+        f"""
+        CREATE OR REPLACE FUNCTION pms_rebuild_hierarchy(employee_ids INTEGER[]) RETURNS void AS $$
+        DECLARE
+            affected INTEGER[];
+            links pms_hierarchy_link[];
+            cyclic BOOLEAN;
+        BEGIN
+            PERFORM pg_advisory_xact_lock({HIERARCHY_LOCK_KEY});
+            -- The employees themselves and everyone below them, as the closure stood.
+            SELECT array_agg(DISTINCT a.id) INTO affected FROM (
+                SELECT unnest(employee_ids) AS id
+                UNION ALL
+                SELECT h.descendant_id FROM employee_hierarchy h WHERE h.ancestor_id = ANY(employee_ids)
+            ) a;
+            IF affected IS NULL THEN
+                RETURN;
+            END IF;
+            DELETE FROM employee_hierarchy WHERE descendant_id = ANY(affected);
+
+            WITH RECURSIVE chain(ancestor_id, descendant_id, depth) AS (
+                SELECT e.id, e.id, 0 FROM employees e WHERE e.id = ANY(affected)
+                UNION ALL
+                SELECT e.manager_id, c.descendant_id, c.depth + 1
+                FROM chain c JOIN employees e ON e.id = c.ancestor_id
+                WHERE e.manager_id IS NOT NULL
+            ) CYCLE ancestor_id SET is_cycle USING path
+            SELECT array_agg(ROW(ancestor_id, descendant_id, depth)::pms_hierarchy_link) FILTER (WHERE NOT is_cycle),
+                   bool_or(is_cycle)
+            INTO links, cyclic
+            FROM chain;
+            IF cyclic THEN
+                RAISE EXCEPTION 'reporting lines would form a cycle' USING ERRCODE = 'check_violation';
+            END IF;
+            INSERT INTO employee_hierarchy (ancestor_id, descendant_id, depth)
+            SELECT l.ancestor_id, l.descendant_id, l.depth FROM unnest(links) l;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+    ], True),
+]
+
+def acquire_migration_lock(cur, transaction=False):
+    """
+    Takes the migration lock for the session, or with `transaction` for the
+    current transaction, waiting while another runner holds it. Waiters poll
+    rather than block in pg_advisory_lock(): a blocked statement holds a
+    snapshot, and CREATE INDEX CONCURRENTLY in the holder's migration waits
+    for every older snapshot to go away, a deadlock between the two.
+    """
+    function = "pg_try_advisory_xact_lock" if transaction else "pg_try_advisory_lock"
+    while True:
+        cur.execute(f"SELECT {function}(%s);", (MIGRATION_LOCK_KEY,))
+        if cur.fetchone()[0]:
+            return
+        time.sleep(MIGRATION_LOCK_POLL_SECONDS)
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+def _applied_versions(cur):
+    cur.execute("SELECT version FROM schema_version;")
+    return {row[0] for row in cur.fetchall()}
+
+def pending_versions(migrations=MIGRATIONS):
+    """
+    Returns the versions of the migrations not yet applied. Only reads
+    schema_version, without DDL or the migration lock, so it is cheap enough
+    for every new server process to run.
+    """
+    conn = backend._connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_version') IS NOT NULL;")
+            applied = _applied_versions(cur) if cur.fetchone()[0] else set()
+    finally:
+        conn.close()
+    return sorted(m.version for m in migrations if m.version not in applied)
+
+def _run_step(cur, step):
+    if callable(step):
+        step(cur)
+    else:
+        cur.execute(step)
+
+def _apply(conn, migration):
+    cur = conn.cursor()
+    try:
+        if migration.transactional:
+            cur.execute("BEGIN;")
+            try:
+                for step in migration.steps:
+                    _run_step(cur, step)
+                cur.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (%s, %s);",
+                    (migration.version, migration.name)
+                )
+                cur.execute("COMMIT;")
+            except BaseException:
+                cur.execute("ROLLBACK;")
+                raise
+        else:
+            for step in migration.steps:
+                _run_step(cur, step)
+            cur.execute(
+                "INSERT INTO schema_version (version, name) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING;",
+                (migration.version, migration.name)
+            )
+    finally:
+        cur.close()
+
+def upgrade(target=None, migrations=MIGRATIONS, verbose=False):
+    """
+    Applies all pending migrations up to `target` (default: the latest) in
+    version order and returns the list of versions applied.
+    """
+    conn = backend._connect()
+    conn.autocommit = True
+    cur = conn.cursor()
+    applied_now = []
+    try:
+        acquire_migration_lock(cur)
+        try:
+            _ensure_version_table(cur)
+            applied = _applied_versions(cur)
+            for migration in sorted(migrations, key=lambda m: m.version):
+                if target is not None and migration.version > target:
+                    break
+                if migration.version in applied:
+                    continue
+                if verbose:
+                    print(f"Applying migration {migration.version}: {migration.name}")
+                _apply(conn, migration)
+                applied_now.append(migration.version)
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+    finally:
+        cur.close()
+        conn.close()
+    return applied_now
+
+def status(migrations=MIGRATIONS):
+    """Returns (version, name, applied_at) for every known migration; applied_at is None if pending."""
+    conn = backend._connect()
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        _ensure_version_table(cur)
+        cur.execute("SELECT version, applied_at FROM schema_version;")
+        applied = dict(cur.fetchall())
+    finally:
+        cur.close()
+        conn.close()
+    return [(m.version, m.name, applied.get(m.version)) for m in sorted(migrations, key=lambda m: m.version)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the PMS database schema.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = subparsers.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--target", type=int, default=None, help="stop after this version")
+    subparsers.add_parser("status", help="show applied and pending migrations")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "upgrade":
+            applied = upgrade(target=args.target, verbose=True)
+            print(f"Applied {len(applied)} migration(s)." if applied else "Schema is up to date.")
+        else:
+            for version, name, applied_at in status():
+                state = applied_at.strftime('%Y-%m-%d %H:%M:%S') if applied_at else "pending"
+                print(f"{version:>4}  {name:<40} {state}")
+    except psycopg2.Error as e:
+        print(f"Error running migrations: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,438 @@
+"""
+Range partitioning of goals, tasks and feedback by review cycle.
+
+The three tables grow with every review cycle while most reads only look at
+the recent ones. Partitioned on created_at, one partition per cycle (see
+storage.REVIEW_CYCLE_MONTHS), reads bounded by a `since` date skip the
+partitions of earlier cycles, and closed cycles can be archived by detaching
+their partitions. PostgreSQL only. Run from the command line:
+
+    python partitioning.py convert                  # one-off: rewrite the tables as partitioned ones
+    python partitioning.py maintain                 # create the partitions of the coming cycles
+    python partitioning.py archive --before 2025-01-01 [--dry-run]
+    python partitioning.py status
+
+convert rewrites the tables under an exclusive lock, so run it in a
+maintenance window. A partitioned table cannot have a unique key without its
+partition key, so the foreign keys from tasks and feedback to goals become
+triggers that check and cascade the same way. Rows outside every cycle land
+in a DEFAULT partition, and maintain() moves them out when it creates their
+cycle's partition; the app runs it on start-up (backend.create_tables()),
+and a daily cron job keeps long-running deployments ahead.
+
+Archived partitions are detached into the ARCHIVE_SCHEMA schema, and moved
+to PMS_ARCHIVE_TABLESPACE when that is set, where they can still be queried.
+The dashboard and trend rollups keep counting archived cycles.
+"""
+import argparse
+import os
+import re
+from datetime import date
+
+import psycopg2
+
+import backend
+from migrations import acquire_migration_lock
+from storage import review_cycle_start
+
+PARTITIONED_TABLES = ("goals", "tasks", "feedback")
+# Cycles after the current one whose partitions are created in advance.
+PARTITIONS_AHEAD = 2
+ARCHIVE_SCHEMA = "archive"
+ARCHIVE_TABLESPACE = os.environ.get("PMS_ARCHIVE_TABLESPACE")
+# A cycle is archived only when every goal in it has one of these statuses.
+CLOSED_GOAL_STATUSES = ("Completed", "Cancelled")
+
+# Stand-ins for the foreign keys from tasks and feedback to goals: inserts and
+# updates must name an existing goal, which is locked FOR KEY SHARE as a
+# foreign key check would, and deleting goals deletes their tasks and feedback.
+GOAL_REFERENCE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION pms_goal_reference_trigger() RETURNS trigger AS $$
+DECLARE
+    goal_ids INTEGER[];
+    missing INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT n.goal_id) INTO goal_ids FROM new_rows n WHERE n.goal_id IS NOT NULL;
+    ELSE
+        SELECT array_agg(DISTINCT n.goal_id) INTO goal_ids FROM new_rows n
+        WHERE n.goal_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM old_rows o WHERE o.id = n.id AND o.goal_id = n.goal_id);
+    END IF;
+    IF goal_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+    PERFORM 1 FROM goals g WHERE g.id = ANY(goal_ids) FOR KEY SHARE;
+    SELECT array_agg(m.id) INTO missing FROM unnest(goal_ids) m(id)
+    WHERE NOT EXISTS (SELECT 1 FROM goals g WHERE g.id = m.id);
+    IF missing IS NOT NULL THEN
+        RAISE EXCEPTION 'insert or update on table "%" references missing goals %', TG_TABLE_NAME, missing
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION pms_goal_cascade_trigger() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM tasks WHERE goal_id IN (SELECT id FROM old_rows);
+    DELETE FROM feedback WHERE goal_id IN (SELECT id FROM old_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS goals_cascade_delete ON goals;
+CREATE TRIGGER goals_cascade_delete AFTER DELETE ON goals
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION pms_goal_cascade_trigger();
+""" + "".join(
+    f"""
+    DROP TRIGGER IF EXISTS {table}_goal_reference_insert ON {table};
+    DROP TRIGGER IF EXISTS {table}_goal_reference_update ON {table};
+    CREATE TRIGGER {table}_goal_reference_insert AFTER INSERT ON {table}
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION pms_goal_reference_trigger();
+    CREATE TRIGGER {table}_goal_reference_update AFTER UPDATE ON {table}
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION pms_goal_reference_trigger();
+    """
+    for table in ("tasks", "feedback")
+)
+
+_BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+def partition_name(table, cycle_start):
+    """Returns the name of `table`'s partition for the cycle starting on `cycle_start`."""
+    return f"{table}_{cycle_start:%Y_%m}"
+
+def _cycle_end(cycle_start):
+    return review_cycle_start(cycle_start, cycles_back=-1)
+
+def _is_partitioned(cur, table):
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+def _partitions(cur, table):
+    """Returns (name, cycle start, cycle end) of `table`'s attached cycle partitions, oldest first."""
+    cur.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass;",
+        (table,)
+    )
+    partitions = []
+    for name, bound in cur.fetchall():
+        match = _BOUND_PATTERN.search(bound)
+        if match:
+            partitions.append((name, date.fromisoformat(match.group(1)[:10]), date.fromisoformat(match.group(2)[:10])))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def _columns(cur, table):
+    """Returns the columns of `table` that can be inserted into, i.e. all but generated ones."""
+    cur.execute(
+        "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 "
+        "AND NOT attisdropped AND attgenerated = '' ORDER BY attnum;",
+        (table,)
+    )
+    return ", ".join(name for (name,) in cur.fetchall())
+
+def _create_partition(cur, table, cycle_start):
+    """
+    Creates and attaches the partition of one cycle, first moving that
+    cycle's rows out of the DEFAULT partition, which may not hold rows a new
+    partition covers.
+    """
+    name = partition_name(table, cycle_start)
+    bounds = (cycle_start, _cycle_end(cycle_start))
+    columns = _columns(cur, table)
+    cur.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS);")
+    cur.execute(
+        f"WITH moved AS (DELETE FROM {table}_default WHERE created_at >= %s AND created_at < %s RETURNING {columns}) "
+        f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved;",
+        bounds
+    )
+    cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s);", bounds)
+    return name
+
+def _saved_definitions(cur, table):
+    """
+    Returns the statements that recreate what depends on `table` once a
+    partitioned table has taken its name: functions taking its row type,
+    indexes, foreign keys (except those to other partitioned tables) and
+    triggers. The primary key is recreated separately.
+    """
+    statements = []
+    cur.execute(
+        "SELECT DISTINCT pg_get_functiondef(d.objid) FROM pg_depend d "
+        "WHERE d.classid = 'pg_proc'::regclass AND d.refclassid = 'pg_type'::regclass "
+        "AND d.refobjid = (SELECT reltype FROM pg_class WHERE oid = %s::regclass);",
+        (table,)
+    )
+    statements += [definition for (definition,) in cur.fetchall()]
+    cur.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary AND indisvalid;",
+        (table,)
+    )
+    statements += [definition for (definition,) in cur.fetchall()]
+    cur.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f' AND NOT confrelid::regclass::text = ANY(%s);",
+        (table, list(PARTITIONED_TABLES))
+    )
+    statements += [f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition};" for name, definition in cur.fetchall()]
+    cur.execute("SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal;", (table,))
+    statements += [definition for (definition,) in cur.fetchall()]
+    return statements
+
+def _convert_table(cur, table, cycles):
+    """Replaces `table` by a table partitioned by cycle with the same rows, indexes and triggers."""
+    # The partition key cannot be NULL. Updating (rather than copying with a
+    # default) lets the rollup triggers count the goals from now on.
+    cur.execute(f"UPDATE {table} SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;")
+    columns = _columns(cur, table)
+    saved = _saved_definitions(cur, table)
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id');", (table,))
+    sequence = cur.fetchone()[0]
+
+    staging = f"{table}_partitioned"
+    cur.execute(
+        f"CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS "
+        f"INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE (created_at);"
+    )
+    cur.execute(f"ALTER TABLE {staging} ALTER COLUMN created_at SET NOT NULL;")
+    cur.execute(f"CREATE TABLE {table}_default PARTITION OF {staging} DEFAULT;")
+    for cycle_start in cycles:
+        cur.execute(
+            f"CREATE TABLE {partition_name(table, cycle_start)} PARTITION OF {staging} FOR VALUES FROM (%s) TO (%s);",
+            (cycle_start, _cycle_end(cycle_start))
+        )
+    # No triggers exist on the new table yet, so the copy leaves the
+    # rollups and change notifications alone.
+    cur.execute(f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table};")
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {staging}.id;")
+    # CASCADE drops the functions taking the row type, and the foreign keys
+    # to goals; both are replaced below.
+    cur.execute(f"DROP TABLE {table} CASCADE;")
+    cur.execute(f"ALTER TABLE {staging} RENAME TO {table};")
+    cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, created_at);")
+    for statement in saved:
+        cur.execute(statement)
+    cur.execute(f"ANALYZE {table};")
+
+def _transaction():
+    """Opens a connection whose first transaction holds the schema lock of migrations.py."""
+    conn = backend._connect()
+    with conn.cursor() as cur:
+        acquire_migration_lock(cur, transaction=True)
+    return conn
+
+def convert(ahead=PARTITIONS_AHEAD, verbose=False):
+    """
+    Rewrites goals, tasks and feedback as tables partitioned by review cycle,
+    in one transaction, with partitions from the oldest row's cycle to
+    `ahead` cycles from now. Returns the tables converted; tables already
+    partitioned are left alone.
+    """
+    conn = _transaction()
+    try:
+        with conn.cursor() as cur:
+            tables = [table for table in PARTITIONED_TABLES if not _is_partitioned(cur, table)]
+            if not tables:
+                conn.rollback()
+                return []
+            cur.execute(f"LOCK TABLE {', '.join(tables)} IN ACCESS EXCLUSIVE MODE;")
+            # Every table gets the same cycles, so that a cycle can be
+            # archived from all three at once.
+            cur.execute(" UNION ALL ".join(f"SELECT min(created_at) FROM {table}" for table in tables) + ";")
+            oldest = min((row[0].date() for row in cur.fetchall() if row[0] is not None), default=date.today())
+            cycles = [review_cycle_start(oldest)]
+            while cycles[-1] < review_cycle_start(cycles_back=-ahead):
+                cycles.append(_cycle_end(cycles[-1]))
+            for table in tables:
+                if verbose:
+                    print(f"Partitioning {table} into {len(cycles)} cycle(s)")
+                _convert_table(cur, table, cycles)
+            cur.execute(GOAL_REFERENCE_TRIGGERS)
+        conn.commit()
+        return tables
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def maintain(ahead=PARTITIONS_AHEAD, today=None):
+    """
+    Creates the partitions of the current cycle and the `ahead` cycles after
+    it where missing and returns their names. Does nothing unless the tables
+    have been converted.
+    """
+    conn = _transaction()
+    created = []
+    try:
+        with conn.cursor() as cur:
+            for table in PARTITIONED_TABLES:
+                if not _is_partitioned(cur, table):
+                    continue
+                existing = {name for name, _, _ in _partitions(cur, table)}
+                for cycles_back in range(0, -ahead - 1, -1):
+                    cycle_start = review_cycle_start(today, cycles_back)
+                    if partition_name(table, cycle_start) not in existing:
+                        created.append(_create_partition(cur, table, cycle_start))
+        conn.commit()
+        return created
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _archive_blocker(cur, cycle_start, cycle_end):
+    """Returns why a cycle cannot be archived yet, or None if it can."""
+    goals = partition_name("goals", cycle_start)
+    cur.execute(f"SELECT count(*) FROM {goals} WHERE status <> ALL(%s);", (list(CLOSED_GOAL_STATUSES),))
+    open_goals = cur.fetchone()[0]
+    if open_goals:
+        return f"{open_goals} goal(s) still open"
+    for table in ("tasks", "feedback"):
+        # Archiving must not separate records from their goals.
+        cur.execute(
+            f"SELECT count(*) FROM {table} r JOIN {goals} g ON g.id = r.goal_id "
+            f"WHERE r.created_at < %s OR r.created_at >= %s;",
+            (cycle_start, cycle_end)
+        )
+        later = cur.fetchone()[0]
+        if later:
+            return f"{later} {table} record(s) of other cycles belong to its goals"
+        cur.execute(
+            f"SELECT count(*) FROM {partition_name(table, cycle_start)} r "
+            f"WHERE r.goal_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {goals} g WHERE g.id = r.goal_id);"
+        )
+        foreign = cur.fetchone()[0]
+        if foreign:
+            return f"{foreign} of its {table} record(s) belong to goals of other cycles"
+    return None
+
+def _move_to_archive(cur, name, tablespace):
+    cur.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA};")
+    if tablespace:
+        cur.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{name} SET TABLESPACE {tablespace};")
+        cur.execute(f"SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = '{ARCHIVE_SCHEMA}.{name}'::regclass;")
+        for (index,) in cur.fetchall():
+            cur.execute(f"ALTER INDEX {index} SET TABLESPACE {tablespace};")
+
+def archive(before, dry_run=False, tablespace=ARCHIVE_TABLESPACE):
+    """
+    Archives the review cycles that ended on or before `before`, oldest first
+    and one transaction per cycle: their partitions of all three tables are
+    detached and moved to ARCHIVE_SCHEMA (and `tablespace`). The current
+    cycle is never archived. A cycle is archived only when all its goals are
+    closed and its tasks and feedback are about its own goals; the first
+    cycle that is not stops the run. Returns [(cycle start, outcome)].
+    """
+    limit = min(before, review_cycle_start())
+    conn = _transaction()
+    results = []
+    try:
+        with conn.cursor() as cur:
+            if not _is_partitioned(cur, "goals"):
+                raise ValueError("The tables are not partitioned; run 'python partitioning.py convert' first.")
+            cycles = [(start, end) for _, start, end in _partitions(cur, "goals") if end <= limit]
+            partitions = {table: {start for _, start, _ in _partitions(cur, table)} for table in PARTITIONED_TABLES}
+        conn.commit()
+        for cycle_start, cycle_end in cycles:
+            with conn.cursor() as cur:
+                acquire_migration_lock(cur, transaction=True)
+                reason = _archive_blocker(cur, cycle_start, cycle_end)
+                if reason or dry_run:
+                    conn.rollback()
+                    results.append((cycle_start, reason or "would be archived"))
+                    if reason:
+                        break
+                    continue
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA};")
+                # Referencing tables first, as with foreign keys.
+                for table in ("feedback", "tasks", "goals"):
+                    if cycle_start in partitions[table]:
+                        name = partition_name(table, cycle_start)
+                        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name};")
+                        _move_to_archive(cur, name, tablespace)
+                # Detaching fires no triggers: tell the app processes to
+                # drop everything they cached from these tables.
+                cur.execute("SELECT pms_notify_changes(%s, NULL, NULL);", (list(PARTITIONED_TABLES),))
+            conn.commit()
+            results.append((cycle_start, "archived"))
+        return results
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def status():
+    """
+    Returns (table, partition, cycle start, estimated rows) for every cycle
+    partition, archived ones under ARCHIVE_SCHEMA, and the DEFAULT partitions
+    with no cycle. Empty if the tables are not partitioned.
+    """
+    conn = backend._connect()
+    rows = []
+    try:
+        with conn.cursor() as cur:
+            for table in PARTITIONED_TABLES:
+                if not _is_partitioned(cur, table):
+                    continue
+                cur.execute(
+                    "SELECT n.nspname, c.relname, GREATEST(c.reltuples, 0)::BIGINT FROM pg_class c "
+                    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                    "WHERE c.relkind = 'r' AND (c.relispartition OR n.nspname = %s) "
+                    "AND c.relname ~ %s ORDER BY c.relname;",
+                    (ARCHIVE_SCHEMA, f"^{table}_(default|\\d{{4}}_\\d{{2}})$")
+                )
+                for schema, name, estimate in cur.fetchall():
+                    match = re.search(r"_(\d{4})_(\d{2})$", name)
+                    cycle_start = date(int(match.group(1)), int(match.group(2)), 1) if match else None
+                    qualified = f"{schema}.{name}" if schema == ARCHIVE_SCHEMA else name
+                    rows.append((table, qualified, cycle_start, estimate))
+        conn.rollback()
+    finally:
+        conn.close()
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Partition and archive PMS goals, tasks and feedback by review cycle.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="rewrite the tables as partitioned tables (exclusive lock)")
+    convert_parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD, help="cycles to create in advance")
+    maintain_parser = subparsers.add_parser("maintain", help="create the partitions of the coming cycles")
+    maintain_parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD, help="cycles to create in advance")
+    archive_parser = subparsers.add_parser("archive", help=f"detach closed cycles into the {ARCHIVE_SCHEMA} schema")
+    archive_parser.add_argument("--before", type=date.fromisoformat, required=True, help="archive cycles ended by this date")
+    archive_parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    subparsers.add_parser("status", help="list the partitions")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "convert":
+            tables = convert(ahead=args.ahead, verbose=True)
+            print(f"Partitioned {', '.join(tables)}." if tables else "The tables are already partitioned.")
+        elif args.command == "maintain":
+            created = maintain(ahead=args.ahead)
+            print(f"Created {', '.join(created)}." if created else "No partitions were missing.")
+        elif args.command == "archive":
+            results = archive(args.before, dry_run=args.dry_run)
+            for cycle_start, outcome in results:
+                print(f"{cycle_start}  {outcome}")
+            if not results:
+                print(f"No cycles ended by {args.before}.")
+        else:
+            for table, name, cycle_start, estimate in status():
+                print(f"{table:<10} {name:<30} {str(cycle_start or 'default'):<12} ~{estimate} rows")
+    except (psycopg2.Error, ValueError) as e:
+        print(f"Error running {args.command}: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,821 @@
+"""
+SQLite storage engine.
+
+Runs the PMS schema in-process, from a file or a private ':memory:'
+database, so demos, CI and benchmarks of the application logic need no
+PostgreSQL server. Results match backend.py row for row: dates come back as
+datetime.date, timestamps as datetime.datetime and flags as bool, and
+descending sorts put NULLs first as PostgreSQL does. Select it with
+PMS_STORAGE=sqlite:PATH (see storage.py). Requires SQLite 3.35 or newer for
+RETURNING.
+"""
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from storage import (
+    DEFAULT_PAGE_SIZE, EMPLOYEE_SEARCH_LIMIT, FRAME_CHUNK_SIZE, GOAL_FRAME_COLUMNS, MAX_PAGE_SIZE, SEARCH_HIGHLIGHT,
+    SEARCH_KINDS, TEAM_TASK_FRAME_COLUMNS, TREND_PERIODS, DashboardSummary, Storage, decode_page_token,
+    encode_page_token, escape_like, frame_from_chunks, task_frame_columns
+)
+
+# Batched statements bind at most this many ids each.
+SQLITE_BATCH_SIZE = 500
+
+# SQL for the first day of the week (Monday, as in PostgreSQL) or month of a timestamp.
+TREND_BUCKETS = {
+    "week": "date({0}, 'weekday 0', '-6 days')",
+    "month": "date({0}, 'start of month')",
+}
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter("BOOLEAN", lambda raw: bool(int(raw)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS employees (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(255) NOT NULL,
+    manager_id INTEGER REFERENCES employees(id) ON DELETE SET NULL
+);
+
+CREATE TABLE IF NOT EXISTS goals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+    description TEXT NOT NULL,
+    due_date DATE,
+    status VARCHAR(50) NOT NULL DEFAULT 'Draft',
+    created_at TIMESTAMP,
+    status_changed_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    goal_id INTEGER REFERENCES goals(id) ON DELETE CASCADE,
+    employee_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+    description TEXT NOT NULL,
+    is_approved BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    goal_id INTEGER REFERENCES goals(id) ON DELETE CASCADE,
+    manager_id INTEGER REFERENCES employees(id) ON DELETE CASCADE,
+    feedback_text TEXT NOT NULL,
+    created_at TIMESTAMP
+);
+"""
+
+# Columns added after the first release, for database files created before them.
+ADDED_COLUMNS = [
+    ("goals", "status_changed_at", "TIMESTAMP"),
+    ("employees", "manager_id", "INTEGER REFERENCES employees(id) ON DELETE SET NULL"),
+]
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS employees_name_id_idx ON employees (name, id);
+CREATE INDEX IF NOT EXISTS employees_manager_id_idx ON employees (manager_id);
+CREATE INDEX IF NOT EXISTS goals_employee_due_date_idx ON goals (employee_id, due_date);
+CREATE INDEX IF NOT EXISTS goals_employee_created_at_idx ON goals (employee_id, created_at);
+CREATE INDEX IF NOT EXISTS goals_due_date_id_idx ON goals (due_date, id);
+CREATE INDEX IF NOT EXISTS tasks_employee_created_at_idx ON tasks (employee_id, created_at);
+CREATE INDEX IF NOT EXISTS tasks_goal_created_at_idx ON tasks (goal_id, created_at);
+CREATE INDEX IF NOT EXISTS tasks_created_at_id_idx ON tasks (created_at, id);
+CREATE INDEX IF NOT EXISTS tasks_approved_idx ON tasks (employee_id) WHERE is_approved;
+CREATE INDEX IF NOT EXISTS feedback_goal_created_at_idx ON feedback (goal_id, created_at);
+"""
+
+# Full-text search: an external-content FTS5 index per searchable table (its
+# text column below), kept in step with the table by triggers.
+SEARCH_COLUMNS = {"goals": "description", "tasks": "description", "feedback": "feedback_text"}
+
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+    {column}, content='{table}', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+    INSERT INTO {table}_fts (rowid, {column}) VALUES (new.id, new.{column});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+    INSERT INTO {table}_fts ({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column});
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column} ON {table} BEGIN
+    INSERT INTO {table}_fts ({table}_fts, rowid, {column}) VALUES ('delete', old.id, old.{column});
+    INSERT INTO {table}_fts (rowid, {column}) VALUES (new.id, new.{column});
+END;
+"""
+
+def _chunks(values, size=SQLITE_BATCH_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _placeholders(values):
+    return ", ".join("?" * len(values))
+
+class SQLiteStorage(Storage):
+    """Storage on one SQLite connection, shared by all threads under a lock."""
+
+    engine = "sqlite"
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
+        )
+        self._conn.execute("PRAGMA foreign_keys = ON;")
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._lock = threading.RLock()
+        self._full_text_search = None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _query_frame(self, sql, params, columns):
+        """Returns the rows of `sql` as a DataFrame, built chunk by chunk (see storage.frame_from_chunks())."""
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            return frame_from_chunks(iter(lambda: cur.fetchmany(FRAME_CHUNK_SIZE), []), columns)
+
+    def _write(self, statements):
+        """Runs (sql, params) pairs in one transaction and returns the rows each returned."""
+        with self._lock, self._conn:
+            return [self._conn.execute(sql, params).fetchall() for sql, params in statements]
+
+    def is_transient_error(self, error):
+        # "database is locked" and the like; constraint failures are IntegrityErrors.
+        return isinstance(error, sqlite3.OperationalError)
+
+    def create_tables(self):
+        try:
+            with self._lock:
+                self._conn.executescript(SCHEMA)
+                for table, column, definition in ADDED_COLUMNS:
+                    columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table});")]
+                    if column not in columns:
+                        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+                self._conn.executescript(INDEXES)
+                self._create_search_indexes()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error creating tables: {e}")
+            return False
+
+    def _create_search_indexes(self):
+        """Creates the FTS5 indexes, filled from the existing rows; skipped if SQLite lacks FTS5."""
+        for table, column in SEARCH_COLUMNS.items():
+            script = SEARCH_SCHEMA.format(table=table, column=column)
+            if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?;", (f"{table}_fts",)).fetchone():
+                script += f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild');"
+            try:
+                self._conn.executescript(script)
+            except sqlite3.OperationalError as e:
+                print(f"Full-text search indexes are unavailable, searching with LIKE: {e}")
+                break
+        self._full_text_search = None
+
+    def truncate(self):
+        """Empties every PMS table and restarts the ids at 1."""
+        with self._lock, self._conn:
+            for table in ("feedback", "tasks", "goals", "employees"):
+                self._conn.execute(f"DELETE FROM {table};")
+            self._conn.execute("DELETE FROM sqlite_sequence;")
+
+    def copy_rows(self, table, columns, rows):
+        """Bulk-inserts an iterable of row tuples into `table` in one transaction."""
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({_placeholders(columns)});"
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    # --- Manager and Employee Management ---
+    def get_all_employees(self):
+        try:
+            return self._query("SELECT id, name FROM employees ORDER BY name;")
+        except sqlite3.Error as e:
+            print(f"Error fetching employees: {e}")
+            return []
+
+    def add_employee(self, name, manager_id=None):
+        try:
+            [[(employee_id,)]] = self._write([(
+                "INSERT INTO employees (name, manager_id) VALUES (?, ?) RETURNING id;", (name, manager_id)
+            )])
+            return employee_id
+        except sqlite3.Error as e:
+            print(f"Error adding employee: {e}")
+            return None
+
+    def get_employee(self, employee_id):
+        try:
+            rows = self._query("SELECT id, name FROM employees WHERE id = ?;", (employee_id,))
+            return rows[0] if rows else None
+        except sqlite3.Error as e:
+            print(f"Error fetching employee: {e}")
+            return None
+
+    def search_employees(self, query, limit=EMPLOYEE_SEARCH_LIMIT):
+        """Same ranking as backend.search_employees() without pg_trgm (SQLite has no trigram matching)."""
+        term = (query or "").strip().lower()
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        try:
+            if not term:
+                return self._query("SELECT id, name FROM employees ORDER BY name, id LIMIT ?;", (limit,))
+            prefix = escape_like(term) + "%"
+            return self._query(
+                """
+                SELECT id, name FROM employees
+                WHERE lower(name) LIKE ? ESCAPE '\\'
+                ORDER BY lower(name) LIKE ? ESCAPE '\\' DESC, lower(name) LIKE ? ESCAPE '\\' DESC, name, id
+                LIMIT ?;
+                """,
+                ("%" + escape_like(term) + "%", prefix, "% " + escape_like(term) + "%", limit)
+            )
+        except sqlite3.Error as e:
+            print(f"Error searching employees: {e}")
+            return []
+
+    # --- Reporting Lines and Teams ---
+    # There is no closure table here: teams are walked with a recursive query
+    # over the employees_manager_id_idx index on every call.
+    _TEAM = """
+        WITH RECURSIVE team(id, depth) AS (
+            SELECT id, 1 FROM employees WHERE manager_id = ?
+            UNION ALL
+            SELECT e.id, t.depth + 1 FROM employees e JOIN team t ON e.manager_id = t.id
+        )
+    """
+
+    def set_manager(self, employee_id, manager_id):
+        try:
+            with self._lock, self._conn:
+                if manager_id is not None:
+                    # Walk up from the new manager: meeting the employee means a cycle.
+                    cycle = self._conn.execute(
+                        """
+                        WITH RECURSIVE chain(id) AS (
+                            SELECT ?
+                            UNION ALL
+                            SELECT e.manager_id FROM employees e JOIN chain c ON e.id = c.id
+                            WHERE e.manager_id IS NOT NULL
+                        )
+                        SELECT 1 FROM chain WHERE id = ? LIMIT 1;
+                        """,
+                        (manager_id, employee_id)
+                    ).fetchall()
+                    if cycle:
+                        print("Error setting manager: reporting lines would form a cycle")
+                        return False
+                rows = self._conn.execute(
+                    "UPDATE employees SET manager_id = ? WHERE id = ? RETURNING id;", (manager_id, employee_id)
+                ).fetchall()
+            return bool(rows)
+        except sqlite3.Error as e:
+            print(f"Error setting manager: {e}")
+            return False
+
+    def get_manager(self, employee_id):
+        try:
+            rows = self._query(
+                "SELECT m.id, m.name FROM employees e JOIN employees m ON m.id = e.manager_id WHERE e.id = ?;",
+                (employee_id,)
+            )
+            return rows[0] if rows else None
+        except sqlite3.Error as e:
+            print(f"Error fetching manager: {e}")
+            return None
+
+    def get_team(self, manager_id):
+        try:
+            return self._query(
+                self._TEAM + """
+                SELECT e.id, e.name, e.manager_id, t.depth FROM team t JOIN employees e ON e.id = t.id
+                ORDER BY t.depth, e.name, e.id;
+                """,
+                (manager_id,)
+            )
+        except sqlite3.Error as e:
+            print(f"Error fetching team: {e}")
+            return []
+
+    _TEAM_GOALS = _TEAM + """
+        SELECT g.id, e.name, g.description, g.due_date, g.status
+        FROM team t JOIN employees e ON e.id = t.id JOIN goals g ON g.employee_id = t.id
+        ORDER BY g.due_date DESC NULLS FIRST, g.id;
+    """
+
+    _TEAM_TASKS = _TEAM + """
+        SELECT t.id, e.name, g.description, t.description, t.is_approved
+        FROM team m JOIN employees e ON e.id = m.id
+        JOIN tasks t ON t.employee_id = m.id JOIN goals g ON g.id = t.goal_id
+        ORDER BY t.created_at DESC, t.id DESC;
+    """
+
+    def read_team_goals(self, manager_id):
+        try:
+            return self._query(self._TEAM_GOALS, (manager_id,))
+        except sqlite3.Error as e:
+            print(f"Error reading team goals: {e}")
+            return []
+
+    def read_team_goals_frame(self, manager_id):
+        try:
+            return self._query_frame(self._TEAM_GOALS, (manager_id,), GOAL_FRAME_COLUMNS)
+        except sqlite3.Error as e:
+            print(f"Error reading team goals: {e}")
+            return frame_from_chunks([], GOAL_FRAME_COLUMNS)
+
+    def read_team_tasks(self, manager_id):
+        try:
+            return self._query(self._TEAM_TASKS, (manager_id,))
+        except sqlite3.Error as e:
+            print(f"Error reading team tasks: {e}")
+            return []
+
+    def read_team_tasks_frame(self, manager_id):
+        try:
+            return self._query_frame(self._TEAM_TASKS, (manager_id,), TEAM_TASK_FRAME_COLUMNS)
+        except sqlite3.Error as e:
+            print(f"Error reading team tasks: {e}")
+            return frame_from_chunks([], TEAM_TASK_FRAME_COLUMNS)
+
+    def get_team_goal_status_counts(self, manager_id):
+        try:
+            return dict(self._query(
+                self._TEAM + "SELECT g.status, COUNT(*) FROM team t JOIN goals g ON g.employee_id = t.id GROUP BY g.status;",
+                (manager_id,)
+            ))
+        except sqlite3.Error as e:
+            print(f"Error fetching team status counts: {e}")
+            return {}
+
+    # --- CRUD for Goals ---
+    def create_goal(self, employee_id, description, due_date, status="Draft"):
+        try:
+            self._write([(
+                "INSERT INTO goals (employee_id, description, due_date, status, created_at) VALUES (?, ?, ?, ?, ?);",
+                (employee_id, description, due_date, status, datetime.now())
+            )])
+            return True
+        except sqlite3.Error as e:
+            print(f"Error creating goal: {e}")
+            return False
+
+    @staticmethod
+    def _goals_query(employee_id, since=None):
+        conditions, params = [], []
+        if employee_id:
+            conditions.append("g.employee_id = ?")
+            params.append(employee_id)
+        if since:
+            conditions.append("g.created_at >= ?")
+            params.append(since)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return ("SELECT g.id, e.name, g.description, g.due_date, g.status FROM goals g JOIN employees e ON g.employee_id = e.id"
+                f"{where} ORDER BY g.due_date DESC NULLS FIRST;", tuple(params))
+
+    def read_goals(self, employee_id=None, since=None):
+        try:
+            return self._query(*self._goals_query(employee_id, since))
+        except sqlite3.Error as e:
+            print(f"Error reading goals: {e}")
+            return []
+
+    def read_goals_frame(self, employee_id=None):
+        try:
+            return self._query_frame(*self._goals_query(employee_id), GOAL_FRAME_COLUMNS)
+        except sqlite3.Error as e:
+            print(f"Error reading goals: {e}")
+            return frame_from_chunks([], GOAL_FRAME_COLUMNS)
+
+    def update_goal_status(self, goal_id, status):
+        try:
+            [rows] = self._write([(
+                "UPDATE goals SET status_changed_at = CASE WHEN status IS ? THEN status_changed_at ELSE ? END, "
+                "status = ? WHERE id = ? RETURNING id;",
+                (status, datetime.now(), status, goal_id)
+            )])
+            return bool(rows)
+        except sqlite3.Error as e:
+            print(f"Error updating goal status: {e}")
+            return False
+
+    def update_goal_status_many(self, goal_ids, status):
+        goal_ids = list(goal_ids)
+        now = datetime.now()
+        try:
+            results = self._write([
+                (f"UPDATE goals SET status = ?, status_changed_at = ? "
+                 f"WHERE id IN ({_placeholders(chunk)}) AND status IS NOT ? RETURNING id;",
+                 (status, now, *chunk, status))
+                for chunk in _chunks(goal_ids)
+            ])
+            return [goal_id for rows in results for (goal_id,) in rows]
+        except sqlite3.Error as e:
+            print(f"Error updating goal statuses: {e}")
+            return []
+
+    def delete_goal(self, goal_id):
+        try:
+            # Tasks and feedback of the goal are removed by ON DELETE CASCADE.
+            [rows] = self._write([("DELETE FROM goals WHERE id = ? RETURNING id;", (goal_id,))])
+            return bool(rows)
+        except sqlite3.Error as e:
+            print(f"Error deleting goal: {e}")
+            return False
+
+    # --- CRUD for Tasks ---
+    def create_task(self, goal_id, employee_id, description):
+        try:
+            self._write([(
+                "INSERT INTO tasks (goal_id, employee_id, description, created_at) VALUES (?, ?, ?, ?);",
+                (goal_id, employee_id, description, datetime.now())
+            )])
+            return True
+        except sqlite3.Error as e:
+            print(f"Error creating task: {e}")
+            return False
+
+    @staticmethod
+    def _tasks_query(goal_id, employee_id, since=None):
+        conditions, params = [], []
+        if goal_id:
+            conditions.append("t.goal_id = ?")
+            params.append(goal_id)
+        elif employee_id:
+            conditions.append("t.employee_id = ?")
+            params.append(employee_id)
+        if since:
+            conditions.append("t.created_at >= ?")
+            params.append(since)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        if employee_id and not goal_id:
+            return f"SELECT t.id, g.description, t.description, t.is_approved FROM tasks t JOIN goals g ON t.goal_id = g.id{where} ORDER BY t.created_at DESC;", tuple(params)
+        return f"SELECT t.id, t.description, t.is_approved FROM tasks t{where} ORDER BY t.created_at DESC;", tuple(params)
+
+    def read_tasks(self, goal_id=None, employee_id=None, since=None):
+        try:
+            return self._query(*self._tasks_query(goal_id, employee_id, since))
+        except sqlite3.Error as e:
+            print(f"Error reading tasks: {e}")
+            return []
+
+    def read_tasks_frame(self, goal_id=None, employee_id=None):
+        columns = task_frame_columns(goal_id, employee_id)
+        try:
+            return self._query_frame(*self._tasks_query(goal_id, employee_id), columns)
+        except sqlite3.Error as e:
+            print(f"Error reading tasks: {e}")
+            return frame_from_chunks([], columns)
+
+    def update_task_approval(self, task_id, is_approved):
+        try:
+            [rows] = self._write([("UPDATE tasks SET is_approved = ? WHERE id = ? RETURNING id;", (is_approved, task_id))])
+            return bool(rows)
+        except sqlite3.Error as e:
+            print(f"Error updating task approval: {e}")
+            return False
+
+    def update_task_approval_many(self, task_ids, is_approved):
+        task_ids = list(task_ids)
+        try:
+            results = self._write([
+                (f"UPDATE tasks SET is_approved = ? WHERE id IN ({_placeholders(chunk)}) AND is_approved IS NOT ? RETURNING id;",
+                 (is_approved, *chunk, is_approved))
+                for chunk in _chunks(task_ids)
+            ])
+            return [task_id for rows in results for (task_id,) in rows]
+        except sqlite3.Error as e:
+            print(f"Error updating task approvals: {e}")
+            return []
+
+    # --- CRUD for Feedback ---
+    def create_feedback(self, goal_id, manager_id, feedback_text):
+        return self.create_feedback_many([(goal_id, manager_id, feedback_text)])
+
+    def create_feedback_many(self, entries, raise_errors=False):
+        created_at = datetime.now()
+        try:
+            self._write([
+                ("INSERT INTO feedback (goal_id, manager_id, feedback_text, created_at) VALUES (?, ?, ?, ?);",
+                 (goal_id, manager_id, feedback_text, created_at))
+                for goal_id, manager_id, feedback_text in entries
+            ])
+            return True
+        except sqlite3.Error as e:
+            if raise_errors:
+                raise
+            print(f"Error creating feedback: {e}")
+            return False
+
+    def read_feedback(self, goal_id=None):
+        try:
+            return self._query("SELECT id, feedback_text, created_at FROM feedback WHERE goal_id = ? ORDER BY created_at DESC;", (goal_id,))
+        except sqlite3.Error as e:
+            print(f"Error reading feedback: {e}")
+            return []
+
+    def read_feedback_for_goals(self, goal_ids):
+        goal_ids = list(goal_ids)
+        feedback_by_goal = {goal_id: [] for goal_id in goal_ids}
+        try:
+            for chunk in _chunks(goal_ids):
+                rows = self._query(
+                    f"SELECT goal_id, id, feedback_text, created_at FROM feedback WHERE goal_id IN ({_placeholders(chunk)}) ORDER BY goal_id, created_at DESC;",
+                    chunk
+                )
+                for goal_id, feedback_id, feedback_text, created_at in rows:
+                    feedback_by_goal[goal_id].append((feedback_id, feedback_text, created_at))
+            return feedback_by_goal
+        except sqlite3.Error as e:
+            print(f"Error reading feedback: {e}")
+            return {goal_id: [] for goal_id in goal_ids}
+
+    # --- Keyset Pagination ---
+    def _read_page(self, base_sql, where, params, sort_column, id_column, sort_index, parse, page_size, page_token):
+        """Same contract as backend._read_page(); `parse` turns the token's sort value back into a date/datetime."""
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        where, params = list(where), list(params)
+        if page_token:
+            sort_value, row_id = decode_page_token(page_token)
+            if sort_value is None:
+                where.append(f"(({sort_column} IS NULL AND {id_column} < ?) OR {sort_column} IS NOT NULL)")
+                params.append(row_id)
+            else:
+                where.append(f"({sort_column}, {id_column}) < (?, ?)")
+                params.extend([parse(sort_value), row_id])
+        sql = base_sql
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort_column} DESC NULLS FIRST, {id_column} DESC LIMIT ?;"
+        params.append(page_size + 1)
+        rows = self._query(sql, params)
+        next_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_token = encode_page_token(last[sort_index], last[0])
+        return rows, next_token
+
+    def read_goals_page(self, employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        try:
+            return self._read_page(
+                "SELECT g.id, e.name, g.description, g.due_date, g.status FROM goals g JOIN employees e ON g.employee_id = e.id",
+                ["g.employee_id = ?"] if employee_id else [],
+                [employee_id] if employee_id else [],
+                "g.due_date", "g.id", 3, date.fromisoformat, page_size, page_token
+            )
+        except sqlite3.Error as e:
+            print(f"Error reading goals: {e}")
+            return [], None
+
+    def read_tasks_page(self, goal_id=None, employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        try:
+            if goal_id:
+                rows, token = self._read_page(
+                    "SELECT t.id, t.description, t.is_approved, t.created_at FROM tasks t",
+                    ["t.goal_id = ?"], [goal_id], "t.created_at", "t.id", 3, datetime.fromisoformat, page_size, page_token
+                )
+            elif employee_id:
+                rows, token = self._read_page(
+                    "SELECT t.id, g.description, t.description, t.is_approved, t.created_at FROM tasks t JOIN goals g ON t.goal_id = g.id",
+                    ["t.employee_id = ?"], [employee_id], "t.created_at", "t.id", 4, datetime.fromisoformat, page_size, page_token
+                )
+            else:
+                rows, token = self._read_page(
+                    "SELECT t.id, t.description, t.is_approved, t.created_at FROM tasks t",
+                    [], [], "t.created_at", "t.id", 3, datetime.fromisoformat, page_size, page_token
+                )
+            return [row[:-1] for row in rows], token
+        except sqlite3.Error as e:
+            print(f"Error reading tasks: {e}")
+            return [], None
+
+    def read_feedback_page(self, goal_id, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        try:
+            return self._read_page(
+                "SELECT f.id, f.feedback_text, f.created_at FROM feedback f",
+                ["f.goal_id = ?"], [goal_id], "f.created_at", "f.id", 2, datetime.fromisoformat, page_size, page_token
+            )
+        except sqlite3.Error as e:
+            print(f"Error reading feedback: {e}")
+            return [], None
+
+    # --- Reporting and Business Insights ---
+    def get_performance_history(self, employee_id, since=None):
+        try:
+            rows = self._query(
+                """
+                SELECT g.id, g.description, g.due_date, g.status, g.created_at,
+                       f.feedback_text, f.created_at
+                FROM goals g
+                LEFT JOIN feedback f ON f.goal_id = g.id AND (:since IS NULL OR f.created_at >= :since)
+                WHERE g.employee_id = :employee_id AND (:since IS NULL OR g.created_at >= :since)
+                ORDER BY g.created_at DESC NULLS FIRST, g.id, f.created_at DESC NULLS FIRST;
+                """,
+                {'employee_id': employee_id, 'since': since}
+            )
+        except sqlite3.Error as e:
+            print(f"Error fetching performance history: {e}")
+            return []
+        history = []
+        for goal_id, description, due_date, status, created_at, feedback_text, feedback_created_at in rows:
+            if not history or history[-1]['goal_id'] != goal_id:
+                history.append({
+                    'goal_id': goal_id,
+                    'description': description,
+                    'due_date': due_date,
+                    'status': status,
+                    'created_at': created_at,
+                    'feedbacks': []
+                })
+            if feedback_text is not None:
+                history[-1]['feedbacks'].append((feedback_text, feedback_created_at))
+        return history
+
+    def get_goal_status_counts(self, employee_id=None):
+        try:
+            if employee_id:
+                return dict(self._query("SELECT status, COUNT(*) FROM goals WHERE employee_id = ? GROUP BY status;", (employee_id,)))
+            return dict(self._query("SELECT status, COUNT(*) FROM goals GROUP BY status;"))
+        except sqlite3.Error as e:
+            print(f"Error fetching status counts: {e}")
+            return {}
+
+    def get_avg_days_to_complete_goal(self, employee_id=None):
+        sql = "SELECT AVG(julianday(due_date) - julianday(created_at)) FROM goals WHERE status = 'Completed'"
+        try:
+            if employee_id:
+                return self._query(sql + " AND employee_id = ?;", (employee_id,))[0][0]
+            return self._query(sql + ";")[0][0]
+        except sqlite3.Error as e:
+            print(f"Error fetching average completion time: {e}")
+            return None
+
+    def get_max_min_due_date(self):
+        try:
+            [(min_date, max_date)] = self._query('SELECT MIN(due_date) AS "min_due_date [DATE]", MAX(due_date) AS "max_due_date [DATE]" FROM goals;')
+            return min_date, max_date
+        except sqlite3.Error as e:
+            print(f"Error fetching min/max dates: {e}")
+            return None, None
+
+    def get_total_tasks_approved(self):
+        try:
+            return self._query("SELECT COUNT(*) FROM tasks WHERE is_approved;")[0][0]
+        except sqlite3.Error as e:
+            print(f"Error fetching total approved tasks: {e}")
+            return 0
+
+    def get_dashboard_summary(self, employee_id=None):
+        """Computes the summary from the base tables; there are no summary tables to maintain here."""
+        scope = "WHERE employee_id = ?" if employee_id else ""
+        params = (employee_id,) if employee_id else ()
+        try:
+            with self._lock:
+                status_counts = dict(self._query(f"SELECT status, COUNT(*) FROM goals {scope} GROUP BY status;", params))
+                [(avg_days, min_due_date, max_due_date)] = self._query(
+                    f"""
+                    SELECT AVG(CASE WHEN status = 'Completed' THEN julianday(due_date) - julianday(created_at) END),
+                           MIN(due_date) AS "min_due_date [DATE]", MAX(due_date) AS "max_due_date [DATE]"
+                    FROM goals {scope};
+                    """,
+                    params
+                )
+                approved_tasks = self._query(f"SELECT COUNT(*) FROM tasks {scope or 'WHERE TRUE'} AND is_approved;", params)[0][0]
+        except sqlite3.Error as e:
+            print(f"Error fetching dashboard summary: {e}")
+            return DashboardSummary(employee_id=employee_id or None)
+        return DashboardSummary(
+            employee_id=employee_id or None,
+            status_counts=status_counts,
+            total_goals=sum(status_counts.values()),
+            avg_days_to_complete=avg_days,
+            approved_tasks=approved_tasks,
+            min_due_date=min_due_date,
+            max_due_date=max_due_date,
+        )
+
+    def get_goal_trends(self, employee_id=None, period="week", since=None):
+        """Groups the goals on every call; there is no rollup table to maintain here."""
+        if period not in TREND_PERIODS:
+            raise ValueError(f"Unknown trend period: {period!r}")
+        bucket = TREND_BUCKETS[period]
+        scope = "AND employee_id = ?" if employee_id else ""
+        params = (employee_id,) if employee_id else ()
+        try:
+            rows = self._query(
+                f"""
+                SELECT bucket AS "bucket [DATE]", SUM(event = 'created'), SUM(event = 'Completed'), SUM(event = 'Cancelled')
+                FROM (
+                    SELECT {bucket.format('created_at')} AS bucket, 'created' AS event
+                    FROM goals WHERE created_at IS NOT NULL {scope}
+                    UNION ALL
+                    SELECT {bucket.format('COALESCE(status_changed_at, created_at)')}, status
+                    FROM goals WHERE status IN ('Completed', 'Cancelled')
+                        AND COALESCE(status_changed_at, created_at) IS NOT NULL {scope}
+                )
+                WHERE ? IS NULL OR bucket >= {bucket.format('?')}
+                GROUP BY bucket
+                ORDER BY bucket;
+                """,
+                params * 2 + (since, since)
+            )
+        except sqlite3.Error as e:
+            print(f"Error fetching goal trends: {e}")
+            return []
+        return rows
+
+    # --- Full-Text Search ---
+    def _full_text_search_available(self):
+        """Whether the FTS5 indexes exist; checked once per connection."""
+        if self._full_text_search is None:
+            self._full_text_search = bool(self._query("SELECT 1 FROM sqlite_master WHERE name = 'feedback_fts';"))
+        return self._full_text_search
+
+    def search_records(self, query, kinds=SEARCH_KINDS, employee_id=None, status=None, date_from=None, date_to=None,
+                       page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        """
+        Same contract as backend.search_records(), on FTS5 with Porter
+        stemming and bm25 ranking. Every word of `query` must match; phrases,
+        OR and - are PostgreSQL-only, and stop words are not skipped. Without
+        FTS5 the words are matched as substrings, newest first.
+        """
+        kinds = tuple(kinds)
+        unknown = set(kinds) - set(SEARCH_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown search kinds: {sorted(unknown)!r}")
+        words = re.findall(r"\w+", (query or "").lower())
+        if not words or not kinds:
+            return [], None
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        full_text = self._full_text_search_available()
+        branches, params = [], []
+        for kind in kinds:
+            column = SEARCH_COLUMNS[kind]
+            goal_column = "s.id" if kind == "goals" else "s.goal_id"
+            employee_column = "g.employee_id" if kind == "feedback" else "s.employee_id"
+            source = f"{kind} s JOIN goals g ON g.id = {goal_column}"
+            if full_text:
+                source = f"{kind}_fts JOIN " + source + f" AND s.id = {kind}_fts.rowid"
+                where = [f"{kind}_fts MATCH ?"]
+                params.append(" ".join(f'"{word}"' for word in words))
+                snippet = f"snippet({kind}_fts, 0, '{SEARCH_HIGHLIGHT}', '{SEARCH_HIGHLIGHT}', '…', 25)"
+                rank = f"-bm25({kind}_fts)"
+            else:
+                where = [f"lower(s.{column}) LIKE ? ESCAPE '\\'" for _ in words]
+                params.extend("%" + escape_like(word) + "%" for word in words)
+                snippet, rank = f"s.{column}", "0.0"
+            if employee_id:
+                where.append(f"{employee_column} = ?")
+                params.append(employee_id)
+            if status:
+                where.append("g.status = ?")
+                params.append(status)
+            if date_from is not None:
+                where.append("s.created_at >= ?")
+                params.append(date_from)
+            if date_to is not None:
+                where.append("s.created_at < date(?, '+1 day')")
+                params.append(date_to)
+            branches.append(
+                f"SELECT '{kind}' AS kind, s.id, {goal_column} AS goal_id, {employee_column} AS employee_id, g.status, "
+                f"s.created_at, {snippet} AS snippet, {rank} AS rank FROM {source} WHERE {' AND '.join(where)}"
+            )
+        resume = ""
+        if page_token:
+            rank_value, (kind, row_id) = decode_page_token(page_token)
+            resume = "WHERE (m.rank, m.kind, m.id) < (?, ?, ?)"
+            params.extend([rank_value, kind, row_id])
+        params.append(page_size + 1)
+        try:
+            rows = self._query(
+                f"""
+                SELECT m.kind, m.id, m.goal_id, e.name, m.status, m.created_at AS "created_at [TIMESTAMP]", m.snippet, m.rank
+                FROM ({" UNION ALL ".join(branches)}) m
+                LEFT JOIN employees e ON e.id = m.employee_id
+                {resume}
+                ORDER BY m.rank DESC, m.kind DESC, m.id DESC
+                LIMIT ?;
+                """,
+                params
+            )
+        except sqlite3.Error as e:
+            print(f"Error searching records: {e}")
+            return [], None
+        next_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_token = encode_page_token(last[7], [last[0], last[1]])
+        return [row[:-1] for row in rows], next_token
@@ -0,0 +1,499 @@
+"""
+Storage engines for the PMS data.
+
+Storage is the interface the application codes against: the CRUD, paging
+and reporting operations of backend.py. PostgreSQL (backend.py) is the
+default engine; an SQLite engine (sqlite_storage.py) runs in-process from
+a file or ':memory:'. The engine is chosen with the PMS_STORAGE setting:
+
+    PMS_STORAGE=postgres              # default
+    PMS_STORAGE=sqlite:pms.db         # SQLite file
+    PMS_STORAGE=sqlite::memory:       # private in-memory database
+
+Every engine must pass storage_conformance.py.
+"""
+import base64
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import date
+
+STORAGE_URL = os.environ.get("PMS_STORAGE", "postgres")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EMPLOYEE_SEARCH_LIMIT = 20
+# Bucket sizes of get_goal_trends(); weeks start on Monday.
+TREND_PERIODS = ("week", "month")
+# What search_records() looks through, and the marker around matched words in
+# its snippets (Markdown bold).
+SEARCH_KINDS = ("goals", "tasks", "feedback")
+SEARCH_HIGHLIGHT = "**"
+
+# Goals, tasks and feedback are reviewed in cycles of this many months,
+# starting in January. PostgreSQL can partition the tables by cycle (see
+# partitioning.py); the `since` option of the hot reads prunes to recent ones.
+REVIEW_CYCLE_MONTHS = 3
+
+# Rows fetched per round trip by the *_frame() reads.
+FRAME_CHUNK_SIZE = 10000
+# Column names and pandas dtypes of the *_frame() reads.
+GOAL_FRAME_COLUMNS = (
+    ("ID", "int64"), ("Employee", "string"), ("Description", "string"), ("Due Date", "object"), ("Status", "category"),
+)
+TASK_FRAME_COLUMNS = (("Task ID", "int64"), ("Task Description", "string"), ("Approved", "bool"))
+EMPLOYEE_TASK_FRAME_COLUMNS = (
+    ("Task ID", "int64"), ("Goal Description", "string"), ("Task Description", "string"), ("Approved", "bool"),
+)
+TEAM_TASK_FRAME_COLUMNS = (
+    ("Task ID", "int64"), ("Employee", "string"), ("Goal Description", "string"), ("Task Description", "string"),
+    ("Approved", "bool"),
+)
+
+# Page tokens are opaque to callers: the sort value (a date, or a number) and
+# id of the last row of a page, from which the next page resumes.
+def encode_page_token(sort_value, row_id):
+    if hasattr(sort_value, "isoformat"):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_page_token(token):
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid page token: {token!r}") from e
+    return sort_value, row_id
+
+def escape_like(text):
+    """Escapes LIKE wildcards (with backslash) so `text` matches literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def frame_from_chunks(chunks, columns):
+    """
+    Builds a DataFrame with `columns` ((name, dtype) pairs) from an iterable
+    of row chunks, such as successive cursor.fetchmany() results. Each chunk
+    becomes columns as soon as it arrives, so only one chunk of row tuples is
+    alive at a time.
+    """
+    import pandas as pd
+    names = [name for name, _ in columns]
+    frames = [pd.DataFrame(rows, columns=names) for rows in chunks]
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=names)
+    return frame.astype(dict(columns))
+
+def review_cycle_start(day=None, cycles_back=0):
+    """
+    Returns the first day of the review cycle containing `day` (default:
+    today), or of the cycle `cycles_back` cycles before it.
+    """
+    day = day or date.today()
+    months = day.year * 12 + (day.month - 1) // REVIEW_CYCLE_MONTHS * REVIEW_CYCLE_MONTHS - cycles_back * REVIEW_CYCLE_MONTHS
+    return date(months // 12, months % 12 + 1, 1)
+
+def task_frame_columns(goal_id=None, employee_id=None):
+    """Returns the columns of read_tasks_frame() for the given filters."""
+    if goal_id or not employee_id:
+        return TASK_FRAME_COLUMNS
+    return EMPLOYEE_TASK_FRAME_COLUMNS
+
+@dataclass(frozen=True)
+class DashboardSummary:
+    """The Business Insights metrics for one employee, or the whole organisation."""
+    employee_id: object = None
+    status_counts: dict = field(default_factory=dict)
+    total_goals: int = 0
+    avg_days_to_complete: object = None
+    approved_tasks: int = 0
+    min_due_date: object = None
+    max_due_date: object = None
+
+_schema_lock = threading.Lock()
+
+class Storage(ABC):
+    """
+    The operations the application needs from a storage engine. Results use
+    the shapes documented on backend.py's functions of the same name: rows
+    are tuples, paged reads return (rows, next_page_token), *_frame() reads
+    return pandas DataFrames and failures are reported and turned into
+    empty/False results rather than raised.
+    """
+
+    engine = None
+    _schema_ready = False
+
+    @abstractmethod
+    def create_tables(self):
+        """Creates or upgrades the schema; returns False on failure."""
+
+    def prepare_schema(self):
+        """Readies the schema for a new process; returns whether it is ready. See ensure_schema()."""
+        return self.create_tables()
+
+    def ensure_schema(self):
+        """
+        Runs prepare_schema() once per storage instance, and so once per
+        process for get_storage(), and returns whether the schema is ready.
+        Every session calls it, but only the first pays for the DDL and the
+        catalog locks it takes; a failure is retried by the next call.
+        """
+        if self._schema_ready:
+            return True
+        with _schema_lock:
+            if not self._schema_ready:
+                self._schema_ready = bool(self.prepare_schema())
+        return self._schema_ready
+
+    def is_transient_error(self, error):
+        """
+        Whether a write that raised `error` (see raise_errors) may succeed if
+        retried, rather than having been rejected for its data. Engines that
+        cannot tell treat every failure as transient.
+        """
+        return True
+
+    # --- Employees ---
+    @abstractmethod
+    def get_all_employees(self):
+        """Returns (id, name) for every employee, ordered by name."""
+
+    @abstractmethod
+    def add_employee(self, name, manager_id=None):
+        """Creates an employee, optionally reporting to `manager_id`, and returns its id."""
+
+    @abstractmethod
+    def get_employee(self, employee_id):
+        """Returns (id, name) of one employee, or None."""
+
+    @abstractmethod
+    def search_employees(self, query, limit=EMPLOYEE_SEARCH_LIMIT):
+        """
+        Returns up to `limit` (id, name) employees matching `query`
+        case-insensitively: name prefixes first, then word prefixes, then
+        other substring matches. An empty query lists the first employees by name.
+        """
+
+    # --- Reporting Lines and Teams ---
+    # A manager's team is everyone below them in the reporting tree.
+    @abstractmethod
+    def set_manager(self, employee_id, manager_id):
+        """Sets (or, with None, clears) an employee's manager; returns False for missing employees or a cycle."""
+
+    @abstractmethod
+    def get_manager(self, employee_id):
+        """Returns (id, name) of an employee's manager, or None."""
+
+    @abstractmethod
+    def get_team(self, manager_id):
+        """Returns (id, name, manager_id, depth) for a manager's team, by depth then name."""
+
+    @abstractmethod
+    def read_team_goals(self, manager_id):
+        """Returns read_goals() rows for the team's goals, latest due date first, then by id."""
+
+    @abstractmethod
+    def read_team_tasks(self, manager_id):
+        """Returns (id, employee name, goal description, description, is_approved) for the team's tasks, newest first."""
+
+    @abstractmethod
+    def read_team_goals_frame(self, manager_id):
+        """Returns read_team_goals() as a DataFrame with GOAL_FRAME_COLUMNS."""
+
+    @abstractmethod
+    def read_team_tasks_frame(self, manager_id):
+        """Returns read_team_tasks() as a DataFrame with TEAM_TASK_FRAME_COLUMNS."""
+
+    @abstractmethod
+    def get_team_goal_status_counts(self, manager_id):
+        """Returns {status: goal count} over the team."""
+
+    # --- Goals ---
+    @abstractmethod
+    def create_goal(self, employee_id, description, due_date, status="Draft"):
+        """Creates a goal; returns True on success."""
+
+    @abstractmethod
+    def read_goals(self, employee_id=None, since=None):
+        """
+        Returns (id, employee name, description, due_date, status), latest due
+        date first. `since` limits it to goals created on or after that date.
+        """
+
+    @abstractmethod
+    def read_goals_frame(self, employee_id=None):
+        """Returns read_goals() as a DataFrame with GOAL_FRAME_COLUMNS."""
+
+    @abstractmethod
+    def read_goals_page(self, employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        """Returns one page of read_goals() as (rows, next_page_token)."""
+
+    @abstractmethod
+    def update_goal_status(self, goal_id, status):
+        """Sets a goal's status; returns whether the goal exists."""
+
+    @abstractmethod
+    def update_goal_status_many(self, goal_ids, status):
+        """Sets the status of many goals; returns the ids whose status changed."""
+
+    @abstractmethod
+    def delete_goal(self, goal_id):
+        """Deletes a goal with its tasks and feedback; returns whether it existed."""
+
+    # --- Tasks ---
+    @abstractmethod
+    def create_task(self, goal_id, employee_id, description):
+        """Creates a task; returns True on success."""
+
+    @abstractmethod
+    def read_tasks(self, goal_id=None, employee_id=None, since=None):
+        """
+        Returns tasks, newest first; rows carry the goal description when
+        filtered by employee. `since` limits it to tasks created on or after
+        that date.
+        """
+
+    @abstractmethod
+    def read_tasks_frame(self, goal_id=None, employee_id=None):
+        """Returns read_tasks() as a DataFrame with task_frame_columns()."""
+
+    @abstractmethod
+    def read_tasks_page(self, goal_id=None, employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        """Returns one page of read_tasks() as (rows, next_page_token)."""
+
+    @abstractmethod
+    def update_task_approval(self, task_id, is_approved):
+        """Sets a task's approval flag; returns whether the task exists."""
+
+    @abstractmethod
+    def update_task_approval_many(self, task_ids, is_approved):
+        """Sets the approval flag of many tasks; returns the ids that changed."""
+
+    # --- Feedback ---
+    @abstractmethod
+    def create_feedback(self, goal_id, manager_id, feedback_text):
+        """Creates feedback on a goal; returns True on success."""
+
+    @abstractmethod
+    def create_feedback_many(self, entries, raise_errors=False):
+        """
+        Creates feedback from (goal_id, manager_id, feedback_text) tuples;
+        returns True on success. With raise_errors, a failure raises the
+        engine's error instead of returning False.
+        """
+
+    @abstractmethod
+    def read_feedback(self, goal_id=None):
+        """Returns (id, feedback_text, created_at) for a goal, newest first."""
+
+    @abstractmethod
+    def read_feedback_page(self, goal_id, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        """Returns one page of read_feedback() as (rows, next_page_token)."""
+
+    @abstractmethod
+    def read_feedback_for_goals(self, goal_ids):
+        """Returns {goal_id: [read_feedback() rows]} for every requested goal."""
+
+    # --- Reporting ---
+    @abstractmethod
+    def get_performance_history(self, employee_id, since=None):
+        """
+        Returns an employee's goals, newest first, each with its feedback.
+        `since` limits it to goals and feedback created on or after that date.
+        """
+
+    @abstractmethod
+    def get_goal_status_counts(self, employee_id=None):
+        """Returns {status: goal count}."""
+
+    @abstractmethod
+    def get_avg_days_to_complete_goal(self, employee_id=None):
+        """Returns the mean days from creation to due date of completed goals, or None."""
+
+    @abstractmethod
+    def get_max_min_due_date(self):
+        """Returns (earliest, latest) goal due date."""
+
+    @abstractmethod
+    def get_total_tasks_approved(self):
+        """Returns the number of approved tasks."""
+
+    @abstractmethod
+    def get_dashboard_summary(self, employee_id=None):
+        """Returns a DashboardSummary for an employee, or organisation-wide without one."""
+
+    @abstractmethod
+    def get_goal_trends(self, employee_id=None, period="week", since=None):
+        """
+        Returns (bucket start date, goals created, completed, cancelled) per
+        week or month with any activity, oldest first, for an employee or
+        organisation-wide without one. `since` limits it to buckets covering
+        that date or later. Completions and cancellations count when the
+        status changed to them.
+        """
+
+    @abstractmethod
+    def search_records(self, query, kinds=SEARCH_KINDS, employee_id=None, status=None, date_from=None, date_to=None,
+                       page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        """
+        Full-text search over goal descriptions, task descriptions and
+        feedback. Returns (rows, next_page_token) of (kind, id, goal_id,
+        employee name, goal status, created_at, snippet), best match first.
+        Filters apply to the owning employee, the goal's status and the
+        creation date (`date_to` inclusive).
+        """
+
+class PostgresStorage(Storage):
+    """The default engine: the pooled, cached PostgreSQL functions in backend.py."""
+
+    engine = "postgres"
+
+    def __init__(self):
+        import backend
+        self._backend = backend
+
+    def create_tables(self):
+        return self._backend.create_tables()
+
+    def prepare_schema(self):
+        return self._backend.prepare_schema()
+
+    def get_all_employees(self):
+        return self._backend.get_all_employees()
+
+    def add_employee(self, name, manager_id=None):
+        return self._backend.add_employee(name, manager_id)
+
+    def get_employee(self, employee_id):
+        return self._backend.get_employee(employee_id)
+
+    def search_employees(self, query, limit=EMPLOYEE_SEARCH_LIMIT):
+        return self._backend.search_employees(query, limit)
+
+    def set_manager(self, employee_id, manager_id):
+        return self._backend.set_manager(employee_id, manager_id)
+
+    def get_manager(self, employee_id):
+        return self._backend.get_manager(employee_id)
+
+    def get_team(self, manager_id):
+        return self._backend.get_team(manager_id)
+
+    def read_team_goals(self, manager_id):
+        return self._backend.read_team_goals(manager_id)
+
+    def read_team_tasks(self, manager_id):
+        return self._backend.read_team_tasks(manager_id)
+
+    def read_team_goals_frame(self, manager_id):
+        return self._backend.read_team_goals_frame(manager_id)
+
+    def read_team_tasks_frame(self, manager_id):
+        return self._backend.read_team_tasks_frame(manager_id)
+
+    def get_team_goal_status_counts(self, manager_id):
+        return self._backend.get_team_goal_status_counts(manager_id)
+
+    def create_goal(self, employee_id, description, due_date, status="Draft"):
+        return self._backend.create_goal(employee_id, description, due_date, status)
+
+    def read_goals(self, employee_id=None, since=None):
+        return self._backend.read_goals(employee_id, since)
+
+    def read_goals_frame(self, employee_id=None):
+        return self._backend.read_goals_frame(employee_id)
+
+    def read_goals_page(self, employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        return self._backend.read_goals_page(employee_id, page_size, page_token)
+
+    def update_goal_status(self, goal_id, status):
+        return self._backend.update_goal_status(goal_id, status)
+
+    def update_goal_status_many(self, goal_ids, status):
+        return self._backend.update_goal_status_many(goal_ids, status)
+
+    def delete_goal(self, goal_id):
+        return self._backend.delete_goal(goal_id)
+
+    def create_task(self, goal_id, employee_id, description):
+        return self._backend.create_task(goal_id, employee_id, description)
+
+    def read_tasks(self, goal_id=None, employee_id=None, since=None):
+        return self._backend.read_tasks(goal_id, employee_id, since)
+
+    def read_tasks_frame(self, goal_id=None, employee_id=None):
+        return self._backend.read_tasks_frame(goal_id, employee_id)
+
+    def read_tasks_page(self, goal_id=None, employee_id=None, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        return self._backend.read_tasks_page(goal_id, employee_id, page_size, page_token)
+
+    def update_task_approval(self, task_id, is_approved):
+        return self._backend.update_task_approval(task_id, is_approved)
+
+    def update_task_approval_many(self, task_ids, is_approved):
+        return self._backend.update_task_approval_many(task_ids, is_approved)
+
+    def create_feedback(self, goal_id, manager_id, feedback_text):
+        return self._backend.create_feedback(goal_id, manager_id, feedback_text)
+
+    def create_feedback_many(self, entries, raise_errors=False):
+        return self._backend.create_feedback_many(entries, raise_errors)
+
+    def is_transient_error(self, error):
+        return self._backend.is_transient_error(error)
+
+    def read_feedback(self, goal_id=None):
+        return self._backend.read_feedback(goal_id)
+
+    def read_feedback_page(self, goal_id, page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        return self._backend.read_feedback_page(goal_id, page_size, page_token)
+
+    def read_feedback_for_goals(self, goal_ids):
+        return self._backend.read_feedback_for_goals(goal_ids)
+
+    def get_performance_history(self, employee_id, since=None):
+        return self._backend.get_performance_history(employee_id, since)
+
+    def get_goal_status_counts(self, employee_id=None):
+        return self._backend.get_goal_status_counts(employee_id)
+
+    def get_avg_days_to_complete_goal(self, employee_id=None):
+        return self._backend.get_avg_days_to_complete_goal(employee_id)
+
+    def get_max_min_due_date(self):
+        return self._backend.get_max_min_due_date()
+
+    def get_total_tasks_approved(self):
+        return self._backend.get_total_tasks_approved()
+
+    def get_dashboard_summary(self, employee_id=None):
+        return self._backend.get_dashboard_summary(employee_id)
+
+    def get_goal_trends(self, employee_id=None, period="week", since=None):
+        return self._backend.get_goal_trends(employee_id, period, since)
+
+    def search_records(self, query, kinds=SEARCH_KINDS, employee_id=None, status=None, date_from=None, date_to=None,
+                       page_size=DEFAULT_PAGE_SIZE, page_token=None):
+        return self._backend.search_records(query, kinds, employee_id, status, date_from, date_to, page_size, page_token)
+
+def open_storage(url):
+    """Builds a storage engine from a PMS_STORAGE-style URL."""
+    if url == "postgres":
+        return PostgresStorage()
+    if url.startswith("sqlite:"):
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(url[len("sqlite:"):] or ":memory:")
+    raise ValueError(f"Unknown storage engine: {url!r}")
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Returns the process-wide storage engine selected by PMS_STORAGE."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = open_storage(STORAGE_URL)
+    return _storage
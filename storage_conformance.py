@@ -0,0 +1,523 @@
+"""
+Conformance checks that every storage engine must pass.
+
+Each check runs against an empty database and exercises one area of the
+Storage interface: CRUD, ordering, cascades, batch updates, pagination and
+the reporting functions. Usage:
+
+    python storage_conformance.py sqlite                       # in-memory SQLite
+    python storage_conformance.py sqlite --path pms_test.db
+    python storage_conformance.py postgres --database pms_test
+
+The PostgreSQL run TRUNCATEs every PMS table before each check, so it
+refuses to run against the application database (backend.DB_NAME).
+"""
+import argparse
+import time
+import traceback
+from datetime import date, datetime, timedelta
+
+from storage import (
+    EMPLOYEE_TASK_FRAME_COLUMNS, GOAL_FRAME_COLUMNS, SEARCH_HIGHLIGHT, TASK_FRAME_COLUMNS, TEAM_TASK_FRAME_COLUMNS,
+    DashboardSummary, PostgresStorage
+)
+
+class ConformanceError(AssertionError):
+    """Raised when an engine's behaviour differs from the Storage contract."""
+
+def check(condition, message):
+    if not condition:
+        raise ConformanceError(message)
+
+def check_equal(actual, expected, what):
+    check(actual == expected, f"{what}: expected {expected!r}, got {actual!r}")
+
+def _walk_pages(read_page):
+    """Follows page tokens to the end and returns every row in order."""
+    rows, token = read_page(None)
+    seen = 0
+    while token is not None:
+        page, token = read_page(token)
+        check(page, "a page token led to an empty page")
+        rows += page
+        seen += 1
+        check(seen < 1000, "pagination did not terminate")
+    return rows
+
+def _seed(store):
+    """Two employees with goals, tasks and feedback; returns their ids."""
+    alice = store.add_employee("Alice")
+    bob = store.add_employee("Bob")
+    check(isinstance(alice, int) and isinstance(bob, int), "add_employee() must return the new id")
+    for description, due_date, status in [
+        ("Ship v2", date(2026, 3, 1), "In Progress"),
+        ("Write docs", date(2026, 1, 15), "Completed"),
+        ("Hire", None, "Draft"),
+    ]:
+        check(store.create_goal(alice, description, due_date, status), "create_goal() failed")
+    check(store.create_goal(bob, "Learn SQL", date(2026, 6, 30)), "create_goal() failed")
+    goals = {description: goal_id for goal_id, _, description, _, _ in store.read_goals()}
+    return alice, bob, goals
+
+# --- Checks ---
+def check_schema(store):
+    check_equal(store.create_tables(), True, "create_tables() on an existing schema")
+    check_equal(store.ensure_schema(), True, "ensure_schema()")
+    check_equal(store.ensure_schema(), True, "ensure_schema() once the schema is ready")
+
+def check_employees(store):
+    check_equal(store.get_all_employees(), [], "employees of an empty database")
+    zoe = store.add_employee("Zoe")
+    adam = store.add_employee("Adam")
+    check(zoe != adam, "add_employee() must return distinct ids")
+    check_equal(store.get_all_employees(), [(adam, "Adam"), (zoe, "Zoe")], "get_all_employees()")
+
+def check_employee_search(store):
+    ids = {}
+    for name in ("Anna Smith", "Hannah Lee", "Bob Annan", "Jo_Ann", "100% Joe", "Zed"):
+        ids[name] = store.add_employee(name)
+    duplicate = store.add_employee("Anna Smith")
+    check_equal([name for _, name in store.search_employees("ann")],
+                ["Anna Smith", "Anna Smith", "Bob Annan", "Hannah Lee", "Jo_Ann"],
+                "search_employees() ranking (prefix, word prefix, substring)")
+    check_equal({employee_id for employee_id, name in store.search_employees("ANNA ") if name == "Anna Smith"},
+                {ids["Anna Smith"], duplicate}, "search_employees() keeps duplicate names apart")
+    check_equal(store.search_employees("_"), [(ids["Jo_Ann"], "Jo_Ann")], "search_employees() escapes _")
+    check_equal(store.search_employees("%"), [(ids["100% Joe"], "100% Joe")], "search_employees() escapes %")
+    check_equal(store.search_employees("zzz"), [], "search_employees() without matches")
+    check_equal(len(store.search_employees("", limit=3)), 3, "search_employees('') respects the limit")
+    check_equal(store.search_employees("")[0], (ids["100% Joe"], "100% Joe"), "search_employees('') name order")
+    check_equal(store.get_employee(ids["Zed"]), (ids["Zed"], "Zed"), "get_employee()")
+    check_equal(store.get_employee(10**6), None, "get_employee() of a missing employee")
+
+def check_hierarchy(store):
+    ceo = store.add_employee("Cora")
+    vp = store.add_employee("Vic", ceo)
+    eng = store.add_employee("Eli", vp)
+    ops = store.add_employee("Ada", vp)
+    solo = store.add_employee("Sam")
+    check(None not in (ceo, vp, eng, ops, solo), "add_employee() with a manager failed")
+    check_equal(store.add_employee("Orphan", 10**6), None, "add_employee() under a missing manager")
+    check_equal(store.get_team(ceo), [(vp, "Vic", ceo, 1), (ops, "Ada", vp, 2), (eng, "Eli", vp, 2)], "get_team()")
+    check_equal(store.get_team(solo), [], "get_team() of an employee without reports")
+    check_equal(store.get_manager(eng), (vp, "Vic"), "get_manager()")
+    check_equal(store.get_manager(ceo), None, "get_manager() of a top-level employee")
+
+    for employee_id, manager_id in [(ceo, ops), (vp, vp), (10**6, ceo), (eng, 10**6)]:
+        check(not store.set_manager(employee_id, manager_id), f"set_manager({employee_id}, {manager_id}) must fail")
+    check_equal(store.get_team(ceo), [(vp, "Vic", ceo, 1), (ops, "Ada", vp, 2), (eng, "Eli", vp, 2)],
+                "get_team() after rejected changes")
+
+    # Moving a manager moves their whole subtree.
+    check(store.set_manager(ops, eng), "set_manager() failed")
+    check(store.set_manager(vp, solo), "set_manager() of a subtree failed")
+    check_equal(store.get_team(solo), [(vp, "Vic", solo, 1), (eng, "Eli", vp, 2), (ops, "Ada", eng, 3)],
+                "get_team() after moving a subtree")
+    check_equal(store.get_team(ceo), [], "get_team() of a manager whose reports moved away")
+    check(store.set_manager(vp, None), "set_manager(None) failed")
+    check_equal(store.get_manager(vp), None, "get_manager() after clearing the manager")
+    check_equal(store.get_team(solo), [], "get_team() after clearing a manager")
+
+    check(store.create_goal(eng, "Ship v2", date(2026, 3, 1), "In Progress"), "create_goal() failed")
+    check(store.create_goal(ops, "Hire", None), "create_goal() failed")
+    check(store.create_goal(ops, "Write docs", date(2026, 1, 15), "Completed"), "create_goal() failed")
+    check(store.create_goal(vp, "Plan", date(2026, 2, 1)), "create_goal() failed")
+    check_equal([row[2] for row in store.read_team_goals(vp)], ["Hire", "Ship v2", "Write docs"],
+                "read_team_goals() order (due date descending, NULL first)")
+    check_equal(store.read_team_goals(vp)[1][:2], (store.read_goals(eng)[0][0], "Eli"), "read_team_goals() row")
+    check_equal([row[2] for row in store.read_team_goals(eng)], ["Hire", "Write docs"], "read_team_goals() of a subteam")
+    check_equal(store.read_team_goals(solo), [], "read_team_goals() without a team")
+    check_equal(store.get_team_goal_status_counts(vp), {"In Progress": 1, "Draft": 1, "Completed": 1},
+                "get_team_goal_status_counts()")
+    check_equal(store.get_team_goal_status_counts(ceo), {}, "get_team_goal_status_counts() without a team")
+
+    goal_ids = {description: goal_id for goal_id, _, description, _, _ in store.read_team_goals(vp)}
+    check(store.create_task(goal_ids["Ship v2"], eng, "Plan rollout"), "create_task() failed")
+    check(store.create_task(goal_ids["Hire"], ops, "Post the job"), "create_task() failed")
+    tasks = store.read_team_tasks(vp)
+    check_equal([row[1:] for row in tasks], [("Ada", "Hire", "Post the job", False), ("Eli", "Ship v2", "Plan rollout", False)],
+                "read_team_tasks() rows (newest first)")
+    check_equal([row[1] for row in store.read_team_tasks(eng)], ["Ada"], "read_team_tasks() of a subteam")
+
+    # Team reads follow reporting line changes.
+    check(store.set_manager(ops, vp), "set_manager() failed")
+    check_equal(store.get_team(vp), [(ops, "Ada", vp, 1), (eng, "Eli", vp, 1)], "get_team() after a move")
+    check_equal(store.read_team_goals(eng), [], "read_team_goals() after a move")
+    check_equal(store.get_team_goal_status_counts(eng), {}, "team status counts after a move")
+    check_equal(len(store.read_team_goals(vp)), 3, "read_team_goals() of the new manager after a move")
+
+def check_goals(store):
+    alice, bob, goals = _seed(store)
+    rows = store.read_goals()
+    check_equal([row[2] for row in rows], ["Hire", "Learn SQL", "Ship v2", "Write docs"],
+                "read_goals() order (due date descending, NULL first)")
+    check_equal(rows[1], (goals["Learn SQL"], "Bob", "Learn SQL", date(2026, 6, 30), "Draft"), "read_goals() row")
+    check_equal([row[2] for row in store.read_goals(alice)], ["Hire", "Ship v2", "Write docs"], "read_goals(employee_id)")
+
+    check(store.update_goal_status(goals["Hire"], "In Progress"), "update_goal_status() of an existing goal")
+    check(not store.update_goal_status(10**6, "Completed"), "update_goal_status() of a missing goal")
+    check_equal(store.read_goals(alice)[0][4], "In Progress", "status after update_goal_status()")
+
+    changed = store.update_goal_status_many([goals["Hire"], goals["Ship v2"], goals["Write docs"], 10**6], "Completed")
+    check_equal(sorted(changed), sorted([goals["Hire"], goals["Ship v2"]]), "update_goal_status_many() changed ids")
+    check_equal(store.update_goal_status_many([], "Completed"), [], "update_goal_status_many([])")
+
+    check(not store.create_goal(10**6, "Orphan", date(2026, 1, 1)), "create_goal() for a missing employee")
+
+def check_delete_cascades(store):
+    alice, bob, goals = _seed(store)
+    goal_id = goals["Ship v2"]
+    check(store.create_task(goal_id, alice, "Plan"), "create_task() failed")
+    check(store.create_feedback(goal_id, bob, "Good start"), "create_feedback() failed")
+    check(store.delete_goal(goal_id), "delete_goal() of an existing goal")
+    check(not store.delete_goal(goal_id), "delete_goal() of a deleted goal")
+    check(goal_id not in [row[0] for row in store.read_goals()], "deleted goal is still listed")
+    check_equal(store.read_tasks(goal_id=goal_id), [], "tasks of a deleted goal")
+    check_equal(store.read_feedback(goal_id), [], "feedback of a deleted goal")
+
+def check_tasks(store):
+    alice, bob, goals = _seed(store)
+    for description in ("First", "Second", "Third"):
+        check(store.create_task(goals["Ship v2"], alice, description), "create_task() failed")
+        time.sleep(0.01)
+    check(store.create_task(goals["Learn SQL"], bob, "Read book"), "create_task() failed")
+
+    by_goal = store.read_tasks(goal_id=goals["Ship v2"])
+    check_equal([(row[1], row[2]) for row in by_goal], [("Third", False), ("Second", False), ("First", False)],
+                "read_tasks(goal_id) rows, newest first")
+    check_equal([row[1:] for row in store.read_tasks(employee_id=bob)], [("Learn SQL", "Read book", False)],
+                "read_tasks(employee_id) rows")
+    check_equal(len(store.read_tasks()), 4, "read_tasks() row count")
+
+    third, second, first = (row[0] for row in by_goal)
+    check(store.update_task_approval(first, True), "update_task_approval() of an existing task")
+    check(not store.update_task_approval(10**6, True), "update_task_approval() of a missing task")
+    check_equal(sorted(store.update_task_approval_many([first, second, 10**6], True)), sorted([second]),
+                "update_task_approval_many() changed ids")
+    check_equal(store.get_total_tasks_approved(), 2, "get_total_tasks_approved()")
+    check(not store.create_task(10**6, alice, "Orphan"), "create_task() for a missing goal")
+
+def check_feedback(store):
+    alice, bob, goals = _seed(store)
+    check(store.create_feedback(goals["Ship v2"], bob, "Older"), "create_feedback() failed")
+    time.sleep(0.01)
+    check(store.create_feedback_many([(goals["Ship v2"], bob, "Newer"), (goals["Hire"], bob, "Other goal")]),
+          "create_feedback_many() failed")
+    check(store.create_feedback_many([]), "create_feedback_many([])")
+
+    rows = store.read_feedback(goals["Ship v2"])
+    check_equal([row[1] for row in rows], ["Newer", "Older"], "read_feedback() newest first")
+    check(isinstance(rows[0][2], datetime), "feedback created_at must be a datetime")
+
+    wanted = [goals["Ship v2"], goals["Hire"], goals["Write docs"]]
+    by_goal = store.read_feedback_for_goals(wanted)
+    check_equal(sorted(by_goal), sorted(wanted), "read_feedback_for_goals() keys")
+    check_equal(by_goal[goals["Ship v2"]], rows, "read_feedback_for_goals() matches read_feedback()")
+    check_equal(by_goal[goals["Write docs"]], [], "read_feedback_for_goals() of a goal without feedback")
+    check_equal(store.read_feedback_for_goals([]), {}, "read_feedback_for_goals([])")
+    check(not store.create_feedback(10**6, bob, "Orphan"), "create_feedback() for a missing goal")
+
+def check_pagination(store):
+    alice = store.add_employee("Alice")
+    # Ties on the due date and a block of NULL due dates exercise the id tie-breaker.
+    for i in range(23):
+        due_date = None if i % 7 == 0 else date(2026, 1, 1) + timedelta(days=i % 4)
+        check(store.create_goal(alice, f"Goal {i}", due_date), "create_goal() failed")
+    goal_rows = store.read_goals(alice)
+    expected = sorted(goal_rows, key=lambda row: (row[3] is None, row[3] or date.min, row[0]), reverse=True)
+    for page_size in (1, 5, 23, 100):
+        rows = _walk_pages(lambda token: store.read_goals_page(alice, page_size=page_size, page_token=token))
+        check_equal(rows, expected, f"read_goals_page() walk with page size {page_size}")
+    check_equal(_walk_pages(lambda token: store.read_goals_page(page_size=4, page_token=token)), expected,
+                "read_goals_page() walk without a filter")
+
+    goal_id = goal_rows[0][0]
+    for i in range(11):
+        check(store.create_task(goal_id, alice, f"Task {i}"), "create_task() failed")
+        check(store.create_feedback(goal_id, alice, f"Feedback {i}"), "create_feedback() failed")
+    task_rows = _walk_pages(lambda token: store.read_tasks_page(goal_id=goal_id, page_size=3, page_token=token))
+    check_equal(sorted(task_rows), sorted(store.read_tasks(goal_id=goal_id)), "read_tasks_page(goal_id) walk")
+    check_equal(len({row[0] for row in task_rows}), 11, "read_tasks_page() must not repeat rows")
+    employee_rows = _walk_pages(lambda token: store.read_tasks_page(employee_id=alice, page_size=4, page_token=token))
+    check_equal(sorted(employee_rows), sorted(store.read_tasks(employee_id=alice)), "read_tasks_page(employee_id) walk")
+    feedback_rows = _walk_pages(lambda token: store.read_feedback_page(goal_id, page_size=2, page_token=token))
+    check_equal(sorted(feedback_rows), sorted(store.read_feedback(goal_id)), "read_feedback_page() walk")
+
+    try:
+        store.read_goals_page(page_token="not-a-token")
+    except ValueError:
+        pass
+    else:
+        raise ConformanceError("an invalid page token must raise ValueError")
+
+def check_history(store):
+    alice, bob, goals = _seed(store)
+    check(store.create_feedback(goals["Write docs"], bob, "First"), "create_feedback() failed")
+    time.sleep(0.01)
+    check(store.create_feedback(goals["Write docs"], bob, "Second"), "create_feedback() failed")
+    history = store.get_performance_history(alice)
+    check_equal(len(history), 3, "get_performance_history() goal count")
+    check_equal(set(history[0]), {'goal_id', 'description', 'due_date', 'status', 'created_at', 'feedbacks'},
+                "get_performance_history() entry keys")
+    entry = next(item for item in history if item['goal_id'] == goals["Write docs"])
+    check_equal([text for text, _ in entry['feedbacks']], ["Second", "First"], "history feedback newest first")
+    check_equal([item['feedbacks'] for item in history if item['goal_id'] != goals["Write docs"]], [[], []],
+                "history of goals without feedback")
+    check_equal(store.get_performance_history(bob)[0]['description'], "Learn SQL", "get_performance_history(bob)")
+    check_equal(store.get_performance_history(10**6), [], "get_performance_history() of a missing employee")
+
+def check_recent(store):
+    alice, bob, goals = _seed(store)
+    check(store.create_task(goals["Ship v2"], alice, "Old task"), "create_task() failed")
+    check(store.create_feedback(goals["Ship v2"], bob, "Old note"), "create_feedback() failed")
+    time.sleep(0.01)
+    check(store.create_goal(alice, "Next cycle", date(2026, 9, 30)), "create_goal() failed")
+    entry = next(item for item in store.get_performance_history(alice) if item['description'] == "Next cycle")
+    since = entry['created_at']
+    time.sleep(0.01)
+    check(store.create_task(goals["Ship v2"], alice, "New task"), "create_task() failed")
+    check(store.create_feedback(goals["Ship v2"], bob, "New note"), "create_feedback() failed")
+    check(store.create_feedback(entry['goal_id'], bob, "Welcome"), "create_feedback() failed")
+
+    check_equal([row[2] for row in store.read_goals(since=since)], ["Next cycle"], "read_goals(since)")
+    check_equal([row[2] for row in store.read_goals(alice, since=since)], ["Next cycle"], "read_goals(employee_id, since)")
+    check_equal(store.read_goals(bob, since=since), [], "read_goals(since) without recent goals")
+    check_equal(store.read_goals(since=date.today() - timedelta(days=1)), store.read_goals(), "read_goals(since=yesterday)")
+    check_equal(store.read_goals(since=date.today() + timedelta(days=1)), [], "read_goals(since=tomorrow)")
+    for kwargs in ({'goal_id': goals["Ship v2"]}, {'employee_id': alice}, {}):
+        check_equal([row[-2] for row in store.read_tasks(since=since, **kwargs)], ["New task"], f"read_tasks({kwargs}, since)")
+    check_equal(len(store.read_tasks(employee_id=alice)), 2, "read_tasks() without since")
+
+    # Feedback given since the date on older goals is outside the scope too.
+    recent = store.get_performance_history(alice, since=since)
+    check_equal([(item['description'], [text for text, _ in item['feedbacks']]) for item in recent],
+                [("Next cycle", ["Welcome"])], "get_performance_history(since)")
+    check_equal(len(store.get_performance_history(alice)), 4, "get_performance_history() without since")
+
+def check_reporting(store):
+    check_equal(store.get_dashboard_summary(), DashboardSummary(), "dashboard summary of an empty database")
+    check_equal(store.get_max_min_due_date(), (None, None), "get_max_min_due_date() of an empty database")
+    alice, bob, goals = _seed(store)
+    check(store.create_task(goals["Ship v2"], alice, "Plan"), "create_task() failed")
+    check(store.create_task(goals["Learn SQL"], bob, "Read"), "create_task() failed")
+    check_equal(len(store.update_task_approval_many([row[0] for row in store.read_tasks()], True)), 2,
+                "approving every task")
+
+    check_equal(store.get_goal_status_counts(), {"In Progress": 1, "Completed": 1, "Draft": 2}, "get_goal_status_counts()")
+    check_equal(store.get_goal_status_counts(alice), {"In Progress": 1, "Completed": 1, "Draft": 1},
+                "get_goal_status_counts(employee_id)")
+    check_equal(store.get_max_min_due_date(), (date(2026, 1, 15), date(2026, 6, 30)), "get_max_min_due_date()")
+    check_equal(store.get_total_tasks_approved(), 2, "get_total_tasks_approved()")
+
+    # Completed goals are measured from creation (now) to their due date.
+    avg_days = store.get_avg_days_to_complete_goal()
+    now = datetime.now()
+    expected_days = (datetime(2026, 1, 15) - now).total_seconds() / 86400
+    check(avg_days is not None and abs(float(avg_days) - expected_days) < 0.01,
+          f"get_avg_days_to_complete_goal(): expected about {expected_days:.3f}, got {avg_days!r}")
+    check_equal(store.get_avg_days_to_complete_goal(bob), None, "get_avg_days_to_complete_goal() without completed goals")
+
+    for employee_id in (None, alice, bob):
+        summary = store.get_dashboard_summary(employee_id)
+        counts = store.get_goal_status_counts(employee_id)
+        check_equal(summary.status_counts, counts, f"dashboard status counts for {employee_id}")
+        check_equal(summary.total_goals, sum(counts.values()), f"dashboard total goals for {employee_id}")
+        average = store.get_avg_days_to_complete_goal(employee_id)
+        check((summary.avg_days_to_complete is None) == (average is None)
+              and (average is None or abs(float(summary.avg_days_to_complete) - float(average)) < 1e-6),
+              f"dashboard average for {employee_id}: {summary.avg_days_to_complete!r} != {average!r}")
+    check_equal(store.get_dashboard_summary(bob).approved_tasks, 1, "dashboard approved tasks for an employee")
+    check_equal(store.get_dashboard_summary().approved_tasks, 2, "dashboard approved tasks")
+    check_equal((store.get_dashboard_summary(alice).min_due_date, store.get_dashboard_summary(alice).max_due_date),
+                (date(2026, 1, 15), date(2026, 3, 1)), "dashboard due date range for an employee")
+
+def check_trends(store):
+    check_equal(store.get_goal_trends(), [], "get_goal_trends() of an empty database")
+    alice, bob, goals = _seed(store)
+    today = date.today()
+    week, month = today - timedelta(days=today.weekday()), today.replace(day=1)
+
+    # Every seeded goal was created now; "Write docs" was created Completed.
+    check_equal(store.get_goal_trends(), [(week, 4, 1, 0)], "get_goal_trends()")
+    check_equal(store.get_goal_trends(period="month"), [(month, 4, 1, 0)], "get_goal_trends(period='month')")
+    check_equal(store.get_goal_trends(alice), [(week, 3, 1, 0)], "get_goal_trends(employee_id)")
+    check_equal(store.get_goal_trends(bob, "month"), [(month, 1, 0, 0)], "get_goal_trends(employee_id, 'month')")
+
+    check(store.update_goal_status(goals["Learn SQL"], "Cancelled"), "update_goal_status() failed")
+    store.update_goal_status_many([goals["Ship v2"]], "Completed")
+    check_equal(store.get_goal_trends(bob), [(week, 1, 0, 1)], "trends after cancelling a goal")
+    check_equal(store.get_goal_trends(alice), [(week, 3, 2, 0)], "trends after completing a goal")
+    check(store.update_goal_status(goals["Write docs"], "In Progress"), "update_goal_status() failed")
+    check(store.delete_goal(goals["Hire"]), "delete_goal() failed")
+    check_equal(store.get_goal_trends(alice), [(week, 2, 1, 0)], "trends after reopening and deleting goals")
+    check_equal(store.get_goal_trends(), [(week, 3, 1, 1)], "organisation trends after changes")
+
+    check_equal(store.get_goal_trends(since=today), [(week, 3, 1, 1)], "get_goal_trends(since=today)")
+    check_equal(store.get_goal_trends(since=today + timedelta(days=400)), [], "get_goal_trends() since a future date")
+    try:
+        store.get_goal_trends(period="day")
+    except ValueError:
+        pass
+    else:
+        raise ConformanceError("get_goal_trends() accepted an unknown period")
+
+def check_search(store):
+    check_equal(store.search_records("billing"), ([], None), "search_records() of an empty database")
+    alice, bob, goals = _seed(store)
+    check(store.create_goal(bob, "Improve billing latency", date(2026, 9, 1)), "create_goal() failed")
+    goals["Improve billing latency"] = store.read_goals(bob)[0][0]
+    check(store.create_task(goals["Ship v2"], alice, "Deploy the billing service"), "create_task() failed")
+    check(store.create_feedback(goals["Write docs"], bob, "Great documentation of the billing API"), "create_feedback() failed")
+    check(store.create_feedback(goals["Learn SQL"], alice, "Keep deploying small changes"), "create_feedback() failed")
+
+    def found(*args, **kwargs):
+        rows, token = store.search_records(*args, **kwargs)
+        check_equal(token, None, "search_records() token of a single page")
+        return sorted((row[0], row[2]) for row in rows)
+
+    billing = [("feedback", goals["Write docs"]), ("goals", goals["Improve billing latency"]), ("tasks", goals["Ship v2"])]
+    check_equal(found("billing"), billing, "search_records() matches")
+    check_equal(found("BILLING"), billing, "search_records() is case-insensitive")
+    check_equal(found("deploys"), [("feedback", goals["Learn SQL"]), ("tasks", goals["Ship v2"])],
+                "search_records() matches word stems")
+    check_equal(found("billing latency"), [("goals", goals["Improve billing latency"])], "search_records() needs every word")
+    check_equal(found("zebra"), [], "search_records() without matches")
+    check_equal(store.search_records("  "), ([], None), "search_records() of an empty query")
+
+    rows, _ = store.search_records("billing", kinds=("tasks",))
+    check_equal(len(rows), 1, "search_records(kinds=('tasks',))")
+    kind, task_id, goal_id, name, status, created_at, snippet = rows[0]
+    check_equal((kind, goal_id, name, status), ("tasks", goals["Ship v2"], "Alice", "In Progress"), "search_records() row")
+    check_equal(task_id, store.read_tasks(goal_id=goals["Ship v2"])[0][0], "search_records() task id")
+    check(isinstance(created_at, datetime), "search_records() created_at must be a datetime")
+    check(f"{SEARCH_HIGHLIGHT}billing{SEARCH_HIGHLIGHT}" in snippet, f"search_records() snippet highlight: {snippet!r}")
+
+    # Feedback belongs to the goal's owner, not the manager who wrote it.
+    check_equal(found("billing", employee_id=bob), [("goals", goals["Improve billing latency"])],
+                "search_records(employee_id)")
+    check_equal(found("billing", employee_id=alice), [("feedback", goals["Write docs"]), ("tasks", goals["Ship v2"])],
+                "search_records(employee_id) of tasks and feedback")
+    check_equal(found("billing", status="Completed"), [("feedback", goals["Write docs"])], "search_records(status)")
+    today = date.today()
+    check_equal(found("billing", date_from=today, date_to=today), billing, "search_records() dates are inclusive")
+    check_equal(found("billing", date_from=today + timedelta(days=1)), [], "search_records(date_from)")
+    check_equal(found("billing", date_to=today - timedelta(days=1)), [], "search_records(date_to)")
+
+    check(store.update_goal_status(goals["Improve billing latency"], "Completed"), "update_goal_status() failed")
+    check_equal(found("billing", status="Completed"),
+                [("feedback", goals["Write docs"]), ("goals", goals["Improve billing latency"])],
+                "search_records(status) after a status change")
+    check(store.delete_goal(goals["Ship v2"]), "delete_goal() failed")
+    check_equal(found("billing", kinds=("tasks",)), [], "search_records() after deleting a goal")
+
+    goal_id = goals["Hire"]
+    check(store.create_task(goal_id, alice, "Audit audit audit"), "create_task() failed")
+    for n in range(7):
+        check(store.create_task(goal_id, alice, f"Audit the expenses report {n}"), "create_task() failed")
+    rows, _ = store.search_records("audit", page_size=50)
+    check_equal(rows[0][6].lower().count("audit"), 3, "search_records() ranks the best match first")
+    check_equal(_walk_pages(lambda token: store.search_records("audit", page_size=3, page_token=token)), rows,
+                "search_records() page walk")
+    try:
+        store.search_records("billing", kinds=("goals", "employees"))
+    except ValueError:
+        pass
+    else:
+        raise ConformanceError("search_records() accepted an unknown kind")
+
+def check_frames(store):
+    def check_frame(frame, columns, rows, what):
+        check_equal([(name, str(dtype)) for name, dtype in frame.dtypes.items()], list(columns), f"{what} columns")
+        check_equal(list(frame.itertuples(index=False, name=None)), rows, f"{what} rows")
+
+    check_frame(store.read_goals_frame(), GOAL_FRAME_COLUMNS, [], "read_goals_frame() of an empty database")
+    alice, bob, goals = _seed(store)
+    check(store.set_manager(bob, alice), "set_manager() failed")
+    for description in ("First", "Second"):
+        check(store.create_task(goals["Ship v2"], alice, description), "create_task() failed")
+        time.sleep(0.01)
+    check(store.create_task(goals["Learn SQL"], bob, "Read book"), "create_task() failed")
+
+    check_frame(store.read_goals_frame(), GOAL_FRAME_COLUMNS, store.read_goals(), "read_goals_frame()")
+    check_frame(store.read_goals_frame(alice), GOAL_FRAME_COLUMNS, store.read_goals(alice), "read_goals_frame(employee_id)")
+    check_frame(store.read_tasks_frame(), TASK_FRAME_COLUMNS, store.read_tasks(), "read_tasks_frame()")
+    check_frame(store.read_tasks_frame(goal_id=goals["Ship v2"]), TASK_FRAME_COLUMNS,
+                store.read_tasks(goal_id=goals["Ship v2"]), "read_tasks_frame(goal_id)")
+    check_frame(store.read_tasks_frame(employee_id=alice), EMPLOYEE_TASK_FRAME_COLUMNS,
+                store.read_tasks(employee_id=alice), "read_tasks_frame(employee_id)")
+    check_frame(store.read_team_goals_frame(alice), GOAL_FRAME_COLUMNS, store.read_team_goals(alice), "read_team_goals_frame()")
+    check_frame(store.read_team_tasks_frame(alice), TEAM_TASK_FRAME_COLUMNS, store.read_team_tasks(alice),
+                "read_team_tasks_frame()")
+    check_frame(store.read_team_tasks_frame(bob), TEAM_TASK_FRAME_COLUMNS, [], "read_team_tasks_frame() without a team")
+
+    # Frames follow writes like the row reads do.
+    check(store.update_task_approval(store.read_tasks(employee_id=bob)[0][0], True), "update_task_approval() failed")
+    check_equal(store.read_team_tasks_frame(alice)["Approved"].tolist(), [True], "read_team_tasks_frame() after an update")
+
+CHECKS = [
+    check_schema, check_employees, check_employee_search, check_hierarchy, check_goals, check_delete_cascades, check_tasks, check_feedback,
+    check_pagination, check_history, check_recent, check_reporting, check_trends, check_search, check_frames,
+]
+
+def run_conformance(make_storage, checks=CHECKS):
+    """
+    Runs every check against a fresh, empty engine from `make_storage()` and
+    returns a list of (check name, error) for the checks that failed.
+    """
+    failures = []
+    for check_function in checks:
+        try:
+            check_function(make_storage())
+        except Exception as e:
+            traceback.print_exc()
+            failures.append((check_function.__name__, e))
+            print(f"FAIL {check_function.__name__}")
+        else:
+            print(f"ok   {check_function.__name__}")
+    return failures
+
+def _sqlite_factory(path):
+    from sqlite_storage import SQLiteStorage
+    def make_storage():
+        store = SQLiteStorage(path)
+        store.create_tables()
+        store.truncate()
+        return store
+    return make_storage
+
+def _postgres_factory(database):
+    import backend
+    backend.DB_NAME = database
+    store = PostgresStorage()
+    store.create_tables()
+    def make_storage():
+        with backend.db_cursor() as cur:
+            cur.execute("TRUNCATE employees, goals, tasks, feedback RESTART IDENTITY CASCADE;")
+            cur.execute("TRUNCATE goal_summary, goal_status_summary, goal_trend_rollup;")
+        backend.clear_cache()
+        return store
+    return make_storage
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the storage conformance checks against an engine.")
+    parser.add_argument("engine", choices=["sqlite", "postgres"])
+    parser.add_argument("--path", default=":memory:", help="SQLite database file (default: in-memory)")
+    parser.add_argument("--database", help="scratch PostgreSQL database (its tables are truncated)")
+    args = parser.parse_args(argv)
+
+    if args.engine == "sqlite":
+        make_storage = _sqlite_factory(args.path)
+    else:
+        import backend
+        if not args.database:
+            parser.error("postgres requires --database")
+        if args.database == backend.DB_NAME:
+            parser.error(f"refusing to truncate the application database {args.database!r}")
+        make_storage = _postgres_factory(args.database)
+
+    failures = run_conformance(make_storage)
+    print(f"{len(CHECKS) - len(failures)}/{len(CHECKS)} checks passed.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,302 @@
+"""
+Write-behind queue for secondary writes.
+
+Records that a user action produces but does not need to wait for, such as
+the automated feedback on completed goals, are queued here and written by a
+background thread, coalesced into one multi-row insert per kind of record,
+so the action returns as soon as its own write commits. Usage:
+
+    submission = get_write_behind().submit_many("feedback", [(goal_id, manager_id, text), ...])
+
+Queued records commit shortly after submit() returns, so a read straight
+after it may not see them yet; the returned Submission tells when they have
+been written (or given up on) without waiting for other callers'. The queue is bounded: when it is full,
+submit() waits up to WRITE_BEHIND_PUT_TIMEOUT_SECONDS and then writes the
+records itself. Batches that fail for a transient reason, such as a lost
+connection or an open circuit breaker, are retried with capped backoff until
+the queue is closed, so an outage delays records rather than losing them.
+Batches the database rejects are written one record at a time so that one
+bad record cannot sink the rest. Whatever is still queued is written when
+the interpreter exits.
+"""
+import atexit
+import functools
+import os
+import queue
+import threading
+import time
+
+from storage import get_storage
+
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("PMS_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = 500
+# How long the worker waits for more records to join a batch.
+WRITE_BEHIND_LINGER_SECONDS = 0.05
+WRITE_BEHIND_PUT_TIMEOUT_SECONDS = 1.0
+# Attempts at a batch whose writer returns False, and at records callers
+# write themselves when the queue is full.
+WRITE_BEHIND_MAX_ATTEMPTS = 3
+# Delay before the first retry of a failed batch; it doubles on every retry
+# up to WRITE_BEHIND_MAX_RETRY_SECONDS.
+WRITE_BEHIND_RETRY_SECONDS = 0.5
+WRITE_BEHIND_MAX_RETRY_SECONDS = 10.0
+WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS = 10.0
+
+# Queued after the last record by close().
+_STOP = object()
+
+class Submission:
+    """
+    The records of one submit_many() call. wait() returns once every one of
+    them has been written or given up on, and `ok` then tells which.
+    """
+
+    def __init__(self, count):
+        self._pending = count
+        self._failed = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not count:
+            self._done.set()
+
+    def _finish(self, written):
+        with self._lock:
+            self._pending -= 1
+            if not written:
+                self._failed += 1
+            if self._pending <= 0:
+                self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Waits up to `timeout` seconds; returns whether every record has been dealt with."""
+        return self._done.wait(timeout)
+
+    @property
+    def ok(self):
+        """True once every record has been written, False if any was given up on, None until done()."""
+        if not self._done.is_set():
+            return None
+        with self._lock:
+            return not self._failed
+
+class WriteBehindQueue:
+    """
+    A bounded queue drained by one worker thread. `writers` maps a kind of
+    record to a function that writes a list of them in one statement and
+    returns True on success, like Storage.create_feedback_many(). Writers
+    raising an exception for which `is_transient(error)` is true are retried
+    until the queue is closed; writers returning False are retried
+    `max_attempts` times.
+    """
+
+    def __init__(self, writers, max_size=WRITE_BEHIND_QUEUE_SIZE, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 linger=WRITE_BEHIND_LINGER_SECONDS, put_timeout=WRITE_BEHIND_PUT_TIMEOUT_SECONDS,
+                 max_attempts=WRITE_BEHIND_MAX_ATTEMPTS, retry_delay=WRITE_BEHIND_RETRY_SECONDS,
+                 max_retry_delay=WRITE_BEHIND_MAX_RETRY_SECONDS, is_transient=None):
+        self._writers = dict(writers)
+        self._is_transient = is_transient or (lambda error: True)
+        self._queue = queue.Queue(max_size)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._closed = False
+        # Set by close() to cut short the backoff of a batch being retried.
+        self._closing = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0, 'written': 0, 'batches': 0, 'retries': 0, 'failed': 0, 'written_by_caller': 0,
+        }
+        self._thread = threading.Thread(target=self._run, name="pms-write-behind", daemon=True)
+        self._thread.start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def submit(self, kind, record):
+        """Queues one record and returns its Submission; see submit_many()."""
+        return self.submit_many(kind, [record])
+
+    def submit_many(self, kind, records):
+        """
+        Queues records for the `kind` writer and returns their Submission.
+        When the queue stays full (or is closed) the caller writes the rest
+        itself, and they are done when this returns.
+        """
+        if kind not in self._writers:
+            raise ValueError(f"Unknown write-behind kind: {kind!r}")
+        records = list(records)
+        submission = Submission(len(records))
+        self._count('submitted', len(records))
+        for index, record in enumerate(records):
+            try:
+                if self._closed:
+                    raise queue.Full
+                self._queue.put((kind, record, submission), timeout=self.put_timeout)
+            except queue.Full:
+                # Backpressure: the caller writes the rest and so slows down
+                # to the speed of the database.
+                remaining = records[index:]
+                self._count('written_by_caller', len(remaining))
+                for written in self._write(kind, remaining, retry_until_closed=False):
+                    submission._finish(written)
+                break
+        return submission
+
+    def flush(self, timeout=None):
+        """Waits until every queued record has been written or given up on; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=WRITE_BEHIND_SHUTDOWN_TIMEOUT_SECONDS):
+        """
+        Writes everything queued and stops the worker; later submissions are
+        written by their callers. Returns False if the worker did not finish
+        within `timeout`.
+        """
+        with self._lock:
+            if self._closed:
+                return not self._thread.is_alive()
+            self._closed = True
+        self._closing.set()
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Write-behind queue did not drain within {timeout:g}s; {self._queue.qsize()} record(s) were not written.")
+            return False
+        # Records that raced with close() and landed behind the stop marker.
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        self._write_batch(leftovers)
+        return True
+
+    def stats(self):
+        """Returns the queue's counters and current depth."""
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(stats, queued=self._queue.qsize(), running=self._thread.is_alive())
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                stopping = True
+            try:
+                self._write_batch([item for item in batch if item is not _STOP])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        by_kind = {}
+        for kind, record, submission in batch:
+            by_kind.setdefault(kind, []).append((record, submission))
+        for kind, items in by_kind.items():
+            results = self._write(kind, [record for record, _ in items])
+            for (_, submission), written in zip(items, results):
+                submission._finish(written)
+
+    def _write(self, kind, records, retry_until_closed=True):
+        """
+        Writes records of one kind and returns, for each, whether it was
+        written rather than given up on. Transient errors are retried with
+        capped backoff while the queue is open, or `max_attempts` times
+        without `retry_until_closed` (callers writing their own records). A
+        batch the database rejected is written one record at a time to
+        isolate the records it cannot take.
+        """
+        writer = self._writers[kind]
+        attempt = 0
+        while True:
+            if attempt:
+                self._count('retries')
+                self._closing.wait(min(self.retry_delay * 2 ** (attempt - 1), self.max_retry_delay))
+            attempt += 1
+            error = self._call(writer, records)
+            if error is None:
+                self._count('batches')
+                self._count('written', len(records))
+                return [True] * len(records)
+            if error is not False and not self._is_transient(error):
+                # Rejected rows stay rejected: isolate them without backing off.
+                break
+            if error is not False and retry_until_closed and not self._closed:
+                continue
+            if attempt >= self.max_attempts:
+                if error is False:
+                    break
+                self._count('failed', len(records))
+                print(f"Write-behind gave up on {len(records)} {kind} record(s) after {attempt} attempts: {error}")
+                return [False] * len(records)
+        if len(records) == 1:
+            self._count('failed')
+            print(f"Write-behind gave up on a {kind} record after {attempt} attempt(s): {records[0]!r}")
+            return [False]
+        # A batch fails as a whole, so isolate the records that cannot be written.
+        results = []
+        for record in records:
+            error = self._call(writer, [record])
+            if error is None:
+                self._count('written')
+                results.append(True)
+            elif error is not False and self._is_transient(error):
+                results.extend(self._write(kind, [record], retry_until_closed))
+            else:
+                self._count('failed')
+                print(f"Write-behind gave up on a {kind} record: {record!r}")
+                results.append(False)
+        return results
+
+    def _call(self, writer, records):
+        """Returns None if the write succeeded, else the exception it raised or False."""
+        try:
+            return None if writer(records) else False
+        except Exception as e:
+            print(f"Error in write-behind writer: {e}")
+            return e
+
+_write_behind = None
+_write_behind_lock = threading.Lock()
+
+def get_write_behind():
+    """Returns the process-wide queue writing to get_storage(), flushed at exit."""
+    global _write_behind
+    if _write_behind is None:
+        with _write_behind_lock:
+            if _write_behind is None:
+                store = get_storage()
+                _write_behind = WriteBehindQueue(
+                    {"feedback": functools.partial(store.create_feedback_many, raise_errors=True)},
+                    is_transient=store.is_transient_error
+                )
+                atexit.register(_write_behind.close)
+    return _write_behind
+
+def get_write_behind_stats():
+    """Returns the process-wide queue's counters, or None when it has not been used."""
+    write_behind = _write_behind
+    return None if write_behind is None else write_behind.stats()